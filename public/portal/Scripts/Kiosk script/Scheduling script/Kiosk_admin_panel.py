@@ -1,768 +1,4516 @@
-#!/usr/bin/env python3
-import os
-import json
-import sqlite3
-import hashlib
-import secrets
-from datetime import datetime
-from flask import Flask, request, render_template, redirect, url_for, flash, session, jsonify, send_from_directory
-from werkzeug.utils import secure_filename
-from functools import wraps
-
-# Configuration
-UPLOAD_FOLDER = '/home/kiosk/content'
-DATABASE = '/home/kiosk/kiosk.db'
-CONFIG_FILE = '/home/kiosk/kiosk_config.cfg'
-SECRET_KEY = secrets.token_hex(16)
-DEFAULT_USERNAME = 'admin'
-DEFAULT_PASSWORD = 'admin'  # You should change this immediately after setup
-
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max upload
-app.secret_key = SECRET_KEY
-
-# Database setup
-def init_db():
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL
-    )
-    ''')
-    
-    # Content table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS content (
-        id INTEGER PRIMARY KEY,
-        name TEXT NOT NULL,
-        type TEXT NOT NULL,
-        url TEXT NOT NULL,
-        file_path TEXT,
-        is_default INTEGER DEFAULT 0,
-        is_offline INTEGER DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Schedule table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS schedule (
-        id INTEGER PRIMARY KEY,
-        content_id INTEGER NOT NULL,
-        day_of_week TEXT,
-        start_time TEXT NOT NULL,
-        end_time TEXT NOT NULL,
-        priority INTEGER DEFAULT 1,
-        FOREIGN KEY (content_id) REFERENCES content (id)
-    )
-    ''')
-    
-    # Check if default user exists
-    c.execute("SELECT id FROM users WHERE username = ?", (DEFAULT_USERNAME,))
-    if not c.fetchone():
-        password_hash = hashlib.sha256(DEFAULT_PASSWORD.encode()).hexdigest()
-        c.execute("INSERT INTO users (username, password) VALUES (?, ?)", 
-                 (DEFAULT_USERNAME, password_hash))
-    
-    conn.commit()
-    conn.close()
-
-# Authentication decorator
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Please log in to access this page')
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
-
-# Helper functions
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_current_content():
-    """Determine which content should be displayed based on schedule"""
-    conn = get_db_connection()
-    now = datetime.now()
-    current_time = now.strftime("%H:%M")
-    day_of_week = now.strftime("%A").lower()
-    
-    # Check for scheduled content
-    cursor = conn.execute('''
-        SELECT c.* FROM content c
-        JOIN schedule s ON c.id = s.content_id
-        WHERE (s.day_of_week = ? OR s.day_of_week = 'everyday')
-        AND s.start_time <= ?
-        AND s.end_time >= ?
-        ORDER BY s.priority DESC
-        LIMIT 1
-    ''', (day_of_week, current_time, current_time))
-    
-    scheduled_content = cursor.fetchone()
-    
-    if scheduled_content:
-        result = dict(scheduled_content)
-    else:
-        # Fall back to default content
-        cursor = conn.execute('SELECT * FROM content WHERE is_default = 1 LIMIT 1')
-        default_content = cursor.fetchone()
-        
-        if default_content:
-            result = dict(default_content)
-        else:
-            # Last resort fallback
-            result = {
-                'url': 'file:///home/kiosk/content/fallback.html',
-                'is_offline': 1
-            }
-    
-    conn.close()
-    return result
-
-def update_config_file(main_url, offline_url):
-    """Update the kiosk config file with new URLs"""
-    with open(CONFIG_FILE, 'w') as f:
-        f.write(f'main_page="{main_url}"\n')
-        f.write(f'offline_video_page="{offline_url}"\n')
-
-def get_config_urls():
-    """Read current URLs from config file"""
-    main_url = ""
-    offline_url = ""
-    
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            for line in f:
-                if line.startswith('main_page='):
-                    main_url = line.strip().split('=', 1)[1].strip('"')
-                elif line.startswith('offline_video_page='):
-                    offline_url = line.strip().split('=', 1)[1].strip('"')
-    except FileNotFoundError:
-        pass
-        
-    return main_url, offline_url
-
-# Routes
-@app.route('/')
-def index():
-    if 'user_id' in session:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
-
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE username = ? AND password_hash = ?', 
-                          (username, password_hash)).fetchone()
-        conn.close()
-        
-        if user:
-            session['user_id'] = user['id']
-            session['username'] = user['username']
-            return redirect(url_for('dashboard'))
-        
-        flash('Invalid username or password')
-    
-    return render_template('login.html')
-
-@app.route('/logout')
-def logout():
-    session.clear()
-    return redirect(url_for('login'))
-
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    conn = get_db_connection()
-    content_list = conn.execute('SELECT * FROM content ORDER BY created_at DESC').fetchall()
-    schedule_list = conn.execute('''
-        SELECT s.*, c.name as content_name 
-        FROM schedule s 
-        JOIN content c ON s.content_id = c.id
-        ORDER BY s.priority DESC
-    ''').fetchall()
-    
-    main_url, offline_url = get_config_urls()
-    current_content = get_current_content()
-    
-    conn.close()
-    return render_template('dashboard.html', 
-                           content_list=content_list, 
-                           schedule_list=schedule_list,
-                           main_url=main_url,
-                           offline_url=offline_url,
-                           current_content=current_content)
-
-@app.route('/content/add', methods=['GET', 'POST'])
-@login_required
-def add_content():
-    if request.method == 'POST':
-        name = request.form['name']
-        content_type = request.form['type']
-        url = request.form['url']
-        is_default = 1 if 'is_default' in request.form else 0
-        is_offline = 1 if 'is_offline' in request.form else 0
-        file_path = None
-        
-        # Handle file upload
-        if 'file' in request.files and request.files['file'].filename:
-            file = request.files['file']
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            # If it's a local file, update the URL to point to it
-            if content_type == 'local':
-                url = f"file://{file_path}"
-        
-        conn = get_db_connection()
-        
-        # If setting as default, clear other defaults
-        if is_default:
-            conn.execute('UPDATE content SET is_default = 0 WHERE is_default = 1')
-        
-        conn.execute('''
-            INSERT INTO content (name, type, url, file_path, is_default, is_offline)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (name, content_type, url, file_path, is_default, is_offline))
-        
-        conn.commit()
-        
-        # If this is the default or offline content, update config
-        if is_default or is_offline:
-            main_url, offline_url = get_config_urls()
-            
-            if is_default:
-                main_url = url
-            if is_offline:
-                offline_url = url
-                
-            update_config_file(main_url, offline_url)
-        
-        conn.close()
-        flash('Content added successfully')
-        return redirect(url_for('dashboard'))
-    
-    return render_template('add_content.html')
-
-@app.route('/content/edit/<int:id>', methods=['GET', 'POST'])
-@login_required
-def edit_content(id):
-    conn = get_db_connection()
-    content = conn.execute('SELECT * FROM content WHERE id = ?', (id,)).fetchone()
-    
-    if not content:
-        conn.close()
-        flash('Content not found')
-        return redirect(url_for('dashboard'))
-    
-    if request.method == 'POST':
-        name = request.form['name']
-        content_type = request.form['type']
-        url = request.form['url']
-        is_default = 1 if 'is_default' in request.form else 0
-        is_offline = 1 if 'is_offline' in request.form else 0
-        file_path = content['file_path']
-        
-        # Handle file upload
-        if 'file' in request.files and request.files['file'].filename:
-            file = request.files['file']
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            # If it's a local file, update the URL to point to it
-            if content_type == 'local':
-                url = f"file://{file_path}"
-        
-        # If setting as default, clear other defaults
-        if is_default:
-            conn.execute('UPDATE content SET is_default = 0 WHERE is_default = 1 AND id != ?', (id,))
-        
-        conn.execute('''
-            UPDATE content 
-            SET name = ?, type = ?, url = ?, file_path = ?, is_default = ?, is_offline = ?
-            WHERE id = ?
-        ''', (name, content_type, url, file_path, is_default, is_offline, id))
-        
-        conn.commit()
-        
-        # If this is the default or offline content, update config
-        if is_default or is_offline:
-            main_url, offline_url = get_config_urls()
-            
-            if is_default:
-                main_url = url
-            if is_offline:
-                offline_url = url
-                
-            update_config_file(main_url, offline_url)
-        
-        conn.close()
-        flash('Content updated successfully')
-        return redirect(url_for('dashboard'))
-    
-    conn.close()
-    return render_template('edit_content.html', content=content)
-
-@app.route('/content/delete/<int:id>', methods=['POST'])
-@login_required
-def delete_content(id):
-    conn = get_db_connection()
-    
-    # Get content info
-    content = conn.execute('SELECT * FROM content WHERE id = ?', (id,)).fetchone()
-    
-    if not content:
-        conn.close()
-        flash('Content not found')
-        return redirect(url_for('dashboard'))
-    
-    # Delete related schedules
-    conn.execute('DELETE FROM schedule WHERE content_id = ?', (id,))
-    
-    # Delete the content
-    conn.execute('DELETE FROM content WHERE id = ?', (id,))
-    
-    # If this was default or offline content, we need to update config
-    if content['is_default'] or content['is_offline']:
-        # Find new defaults
-        new_default = conn.execute('SELECT url FROM content WHERE is_default = 1 LIMIT 1').fetchone()
-        new_offline = conn.execute('SELECT url FROM content WHERE is_offline = 1 LIMIT 1').fetchone()
-        
-        main_url = new_default['url'] if new_default else ""
-        offline_url = new_offline['url'] if new_offline else ""
-        
-        update_config_file(main_url, offline_url)
-    
-    conn.commit()
-    conn.close()
-    
-    flash('Content deleted successfully')
-    return redirect(url_for('dashboard'))
-
-@app.route('/schedule/add', methods=['GET', 'POST'])
-@login_required
-def add_schedule():
-    if request.method == 'POST':
-        content_id = request.form['content_id']
-        day_of_week = request.form['day_of_week']
-        start_time = request.form['start_time']
-        end_time = request.form['end_time']
-        priority = request.form['priority']
-        
-        conn = get_db_connection()
-        conn.execute('''
-            INSERT INTO schedule (content_id, day_of_week, start_time, end_time, priority)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (content_id, day_of_week, start_time, end_time, priority))
-        
-        conn.commit()
-        conn.close()
-        
-        flash('Schedule added successfully')
-        return redirect(url_for('dashboard'))
-    
-    conn = get_db_connection()
-    content_list = conn.execute('SELECT id, name FROM content').fetchall()
-    conn.close()
-    
-    return render_template('add_schedule.html', content_list=content_list)
-
-@app.route('/schedule/edit/<int:id>', methods=['GET', 'POST'])
-@login_required
-def edit_schedule(id):
-    conn = get_db_connection()
-    schedule = conn.execute('SELECT * FROM schedule WHERE id = ?', (id,)).fetchone()
-    
-    if not schedule:
-        conn.close()
-        flash('Schedule not found')
-        return redirect(url_for('dashboard'))
-    
-    if request.method == 'POST':
-        content_id = request.form['content_id']
-        day_of_week = request.form['day_of_week']
-        start_time = request.form['start_time']
-        end_time = request.form['end_time']
-        priority = request.form['priority']
-        
-        conn.execute('''
-            UPDATE schedule 
-            SET content_id = ?, day_of_week = ?, start_time = ?, end_time = ?, priority = ?
-            WHERE id = ?
-        ''', (content_id, day_of_week, start_time, end_time, priority, id))
-        
-        conn.commit()
-        conn.close()
-        
-        flash('Schedule updated successfully')
-        return redirect(url_for('dashboard'))
-    
-    content_list = conn.execute('SELECT id, name FROM content').fetchall()
-    conn.close()
-    
-    return render_template('edit_schedule.html', schedule=schedule, content_list=content_list)
-
-@app.route('/schedule/delete/<int:id>', methods=['POST'])
-@login_required
-def delete_schedule(id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM schedule WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
-    
-    flash('Schedule deleted successfully')
-    return redirect(url_for('dashboard'))
-
-@app.route('/settings', methods=['GET', 'POST'])
-@login_required
-def settings():
-    if request.method == 'POST':
-        current_password = request.form['current_password']
-        new_password = request.form['new_password']
-        confirm_password = request.form['confirm_password']
-        
-        if new_password != confirm_password:
-            flash('New passwords do not match')
-            return redirect(url_for('settings'))
-        
-        current_hash = hashlib.sha256(current_password.encode()).hexdigest()
-        
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE id = ? AND password_hash = ?', 
-                          (session['user_id'], current_hash)).fetchone()
-        
-        if not user:
-            conn.close()
-            flash('Current password is incorrect')
-            return redirect(url_for('settings'))
-        
-        new_hash = hashlib.sha256(new_password.encode()).hexdigest()
-        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', 
-                   (new_hash, session['user_id']))
-        
-        conn.commit()
-        conn.close()
-        
-        flash('Password updated successfully')
-        return redirect(url_for('settings'))
-    
-    return render_template('settings.html')
-
-# API endpoints
-@app.route('/api/current-content', methods=['GET'])
-def api_current_content():
-    """API endpoint to get current content based on schedule"""
-    return jsonify(get_current_content())
-
-@app.route('/content/<path:filename>')
-def serve_content(filename):
-    """Serve uploaded content files"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-
-# Create templates directory and templates
-def create_templates():
-    templates_dir = os.path.join(os.path.dirname(__file__), 'templates')
-    os.makedirs(templates_dir, exist_ok=True)
-    
-    # Create base template
-    with open(os.path.join(templates_dir, 'base.html'), 'w') as f:
-        f.write('''<!DOCTYPE html>
-<html>
-<head>
-    <title>{% block title %}Kiosk Admin Panel{% endblock %}</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css">
-    <style>
-        body { padding-top: 20px; }
-        .flash-messages { margin-bottom: 20px; }
-    </style>
-    {% block head %}{% endblock %}
-</head>
-<body>
-    <div class="container">
-        {% if session.user_id %}
-        <nav class="navbar navbar-expand-lg navbar-light bg-light mb-4">
-            <div class="container-fluid">
-                <a class="navbar-brand" href="{{ url_for('dashboard') }}">Kiosk Admin</a>
-                <button class="navbar-toggler" type="button" data-bs-toggle="collapse" data-bs-target="#navbarNav">
-                    <span class="navbar-toggler-icon"></span>
-                </button>
-                <div class="collapse navbar-collapse" id="navbarNav">
-                    <ul class="navbar-nav">
-                        <li class="nav-item">
-                            <a class="nav-link" href="{{ url_for('dashboard') }}">Dashboard</a>
-                        </li>
-                        <li class="nav-item">
-                            <a class="nav-link" href="{{ url_for('add_content') }}">Add Content</a>
-                        </li>
-                        <li class="nav-item">
-                            <a class="nav-link" href="{{ url_for('add_schedule') }}">Add Schedule</a>
-                        </li>
-                        <li class="nav-item">
-                            <a class="nav-link" href="{{ url_for('settings') }}">Settings</a>
-                        </li>
-                    </ul>
-                    <ul class="navbar-nav ms-auto">
-                        <li class="nav-item">
-                            <span class="nav-link">Welcome, {{ session.username }}</span>
-                        </li>
-                        <li class="nav-item">
-                            <a class="nav-link" href="{{ url_for('logout') }}">Logout</a>
-                        </li>
-                    </ul>
-                </div>
-            </div>
-        </nav>
-        {% endif %}
-        
-        <div class="flash-messages">
-            {% for message in get_flashed_messages() %}
-            <div class="alert alert-info">{{ message }}</div>
-            {% endfor %}
-        </div>
-        
-        {% block content %}{% endblock %}
-    </div>
-    
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
-    {% block scripts %}{% endblock %}
-</body>
-</html>''')
-    
-    # Create login template
-    with open(os.path.join(templates_dir, 'login.html'), 'w') as f:
-        f.write('''{% extends "base.html" %}
-
-{% block title %}Login - Kiosk Admin Panel{% endblock %}
-
-{% block content %}
-<div class="row justify-content-center">
-    <div class="col-md-6">
-        <div class="card">
-            <div class="card-header">
-                <h4>Login</h4>
-            </div>
-            <div class="card-body">
-                <form method="post">
-                    <div class="mb-3">
-                        <label for="username" class="form-label">Username</label>
-                        <input type="text" class="form-control" id="username" name="username" required>
-                    </div>
-                    <div class="mb-3">
-                        <label for="password" class="form-label">Password</label>
-                        <input type="password" class="form-control" id="password" name="password" required>
-                    </div>
-                    <button type="submit" class="btn btn-primary">Login</button>
-                </form>
-            </div>
-        </div>
-    </div>
-</div>
-{% endblock %}''')
-    
-    # Create dashboard template
-    with open(os.path.join(templates_dir, 'dashboard.html'), 'w') as f:
-        f.write('''{% extends "base.html" %}
-
-{% block title %}Dashboard - Kiosk Admin Panel{% endblock %}
-
-{% block content %}
-<h2>Dashboard</h2>
-
-<div class="row mb-4">
-    <div class="col-md-6">
-        <div class="card">
-            <div class="card-header">
-                <h5>Current Status</h5>
-            </div>
-            <div class="card-body">
-                <p><strong>Main URL:</strong> {{ main_url }}</p>
-                <p><strong>Offline URL:</strong> {{ offline_url }}</p>
-                <p><strong>Currently Showing:</strong> {{ current_content.name if current_content else 'Unknown' }}</p>
-                <p><strong>URL:</strong> {{ current_content.url if current_content else 'Unknown' }}</p>
-                <p><strong>Status:</strong> 
-                    {% if current_content and current_content.is_offline %}
-                        <span class="badge bg-warning">Offline Content</span>
-                    {% else %}
-                        <span class="badge bg-success">Online Content</span>
-                    {% endif %}
-                </p>
-            </div>
-        </div>
-    </div>
-    <div class="col-md-6">
-        <div class="card">
-            <div class="card-header">
-                <h5>Quick Actions</h5>
-            </div>
-            <div class="card-body">
-                <a href="{{ url_for('add_content') }}" class="btn btn-primary me-2">Add Content</a>
-                <a href="{{ url_for('add_schedule') }}" class="btn btn-success me-2">Add Schedule</a>
-                <a href="{{ url_for('settings') }}" class="btn btn-secondary">Settings</a>
-            </div>
-        </div>
-    </div>
-</div>
-
-<div class="row">
-    <div class="col-md-6">
-        <div class="card mb-4">
-            <div class="card-header d-flex justify-content-between align-items-center">
-                <h5>Content</h5>
-                <a href="{{ url_for('add_content') }}" class="btn btn-sm btn-primary">Add New</a>
-            </div>
-            <div class="card-body">
-                <div class="table-responsive">
-                    <table class="table table-striped">
-                        <thead>
-                            <tr>
-                                <th>Name</th>
-                                <th>Type</th>
-                                <th>Default</th>
-                                <th>Offline</th>
-                                <th>Actions</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {% for content in content_list %}
-                            <tr>
-                                <td>{{ content.name }}</td>
-                                <td>{{ content.type }}</td>
-                                <td>{% if content.is_default %}<span class="badge bg-success">Yes</span>{% endif %}</td>
-                                <td>{% if content.is_offline %}<span class="badge bg-warning">Yes</span>{% endif %}</td>
-                                <td>
-                                    <a href="{{ url_for('edit_content', id=content.id) }}" class="btn btn-sm btn-info">Edit</a>
-                                    <form method="post" action="{{ url_for('delete_content', id=content.id) }}" class="d-inline">
-                                        <button type="submit" class="btn btn-sm btn-danger" onclick="return confirm('Are you sure?')">Delete</button>
-                                    </form>
-                                </td>
-                            </tr>
-                            {% else %}
-                            <tr>
-                                <td colspan="5" class="text-center">No content added yet</td>
-                            </tr>
-                            {% endfor %}
-                        </tbody>
-                    </table>
-                </div>
-            </div>
-        </div>
-    </div>
-    <div class="col-md-6">
-        <div class="card">
-            <div class="card-header d-flex justify-content-between align-items-center">
-                <h5>Schedule</h5>
-                <a href="{{ url_for('add_schedule') }}" class="btn btn-sm btn-primary">Add New</a>
-            </div>
-            <div class="card-body">
-                <div class="table-responsive">
-                    <table class="table table-striped">
-                        <thead>
-                            <tr>
-                                <th>Content</th>
-                                <th>Day</th>
-                                <th>Time</th>
-                                <th>Priority</th>
-                                <th>Actions</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {% for schedule in schedule_list %}
-                            <tr>
-                                <td>{{ schedule.content_name }}</td>
-                                <td>{{ schedule.day_of_week|capitalize }}</td>
-                                <td>{{ schedule.start_time }} - {{ schedule.end_time }}</td>
-                                <td>{{ schedule.priority }}</td>
-                                <td>
-                                    <a href="{{ url_for('edit_schedule', id=schedule.id) }}" class="btn btn-sm btn-info">Edit</a>
-                                    <form method="post" action="{{ url_for('delete_schedule', id=schedule.id) }}" class="d-inline">
-                                        <button type="submit" class="btn btn-sm btn-danger" onclick="return confirm('Are you sure?')">Delete</button>
-                                    </form>
-                                </td>
-                            </tr>
-                            {% else %}
-                            <tr>
-                                <td colspan="5" class="text-center">No schedules added yet</td>
-                            </tr>
-                            {% endfor %}
-                        </tbody>
-                    </table>
-                </div>
-            </div>
-        </div>
-    </div>
-</div>
-{% endblock %}''')
-    
-    # Create add content template
-    with open(os.path.join(templates_dir, 'add_content.html'), 'w') as f:
-        f.write('''{% extends "base.html" %}
-
-{% block title %}Add Content - Kiosk Admin Panel{% endblock %}
-
-{% block content %}
-<h2>Add Content</h2>
-
-<div class="card">
-    <div class="card-body">
-        <form method="post" enctype="multipart/form-data">
-            <div class="mb-3">
-                <label for="name" class="form-label">Name</label>
-                <input type="text" class="form-control" id="name" name="name" required>
-            </div>
-            
-            <div class="mb-3">
-                <label for="type" class="form-label">Content Type</label>
-                <select class="form-select" id="type" name="type" required>
-                    <option value="url">External URL</option>
-                    <option value="local">Local File</option>
-                    <option value="html">HTML Content</option>
-                </select>
-            </div>
-            
-            <div class="mb-3">
-                <label for="url" class="form-label">URL</label>
-                <input type="text" class="form-control" id="url" name="url" 
-                       placeholder="https://example.com or file:///path/to/file.html">
-                <small class="form-text text-muted">For external content, provide full URL. For local content, this will be auto-filled when you upload a file.</small>
-            </div>
-            
-            <div class="mb-3">
-                <label for="file" class="form-label">Upload File</label>
-                <input type="file" class="form-control" id="file" name="file">
-                <small class="form-text text-muted">Upload HTML files, videos, or images for local content.</small>
-            </div>
-            
-            <div class="mb-3 form-check">
-                <input type="checkbox" class="form-check-input" id="is_default" name="is_default">
-                <label class="form-check-label" for="is_default">Set as Default Online Content</label>
-            </div>
-            
-            <div class="mb-3 form-check">
-                <input type="checkbox" class="form-check-input" id="is_offline" name="is_offline">
-                <label class="form-check-label" for="is_offline">Set as Default Offline Content</label>
-            </div>
-            
-            <button type="submit" class="btn btn-primary">Add Content</button>
-            <a href="{{ url_for('dashboard') }}" class="btn btn-secondary">Cancel</a>
-        </form>
+#!/usr/bin/env python3
+import os
+import io
+import csv
+import json
+import atexit
+import cProfile
+import pstats
+import re
+import fcntl
+import logging.handlers
+import asyncio
+import mimetypes
+import threading
+import time
+import uuid
+import zlib
+import sqlite3
+import bisect
+import hashlib
+import functools
+import heapq
+import itertools
+import secrets
+import shutil
+import subprocess
+import multiprocessing
+import concurrent.futures
+import concurrent.futures.process
+import html
+import urllib.request
+import urllib.error
+import click
+from collections import deque
+from datetime import datetime, timedelta
+from flask import Flask, request, render_template, redirect, url_for, flash, session, jsonify, abort, g, has_app_context, send_file
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+from functools import wraps
+from html.parser import HTMLParser
+from urllib.parse import parse_qs, quote, urljoin, urlsplit
+
+# Configuration
+KIOSK_HOME = os.environ.get('KIOSK_HOME', '/home/kiosk')  # Override to run against another data directory
+UPLOAD_FOLDER = os.path.join(KIOSK_HOME, 'content')
+DATABASE = os.path.join(KIOSK_HOME, 'kiosk.db')
+CONFIG_FILE = os.path.join(KIOSK_HOME, 'kiosk_config.cfg')
+SECRET_KEY_FILE = os.path.join(KIOSK_HOME, 'secret_key')  # Shared by every worker; KIOSK_SECRET_KEY overrides
+SERVE_BIND = '0.0.0.0:8080'  # Production server (flask serve)
+SERVE_WORKERS = 1  # Pre-forked worker processes; metrics and slow-request logs are kept per worker
+SERVE_THREADS = 16  # Request threads per worker
+SERVE_TIMEOUT = 60  # Seconds before an unresponsive worker is restarted
+SERVE_GRACEFUL_TIMEOUT = 30  # Seconds in-flight requests get to finish on reload or shutdown
+CHANGE_CHECK_INTERVAL = 1.0  # Seconds between checks for edits made by another worker
+LEADER_RETRY = 5  # Seconds between attempts to take over background services
+CHUNK_SIZE = 8 * 1024 * 1024  # Default chunk size for resumable uploads
+CHUNKED_UPLOAD_THRESHOLD = 32 * 1024 * 1024  # The upload form switches to chunks above this
+CHUNKED_UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024  # 4GB max for a chunked upload
+UPLOAD_SESSION_TTL = 7 * 24 * 3600  # Seconds before an abandoned upload is discarded
+CONTENT_CACHE_MAX_AGE = 300  # Seconds browsers may reuse /content/ files before revalidating
+DB_POOL_SIZE = 8  # Idle SQLite connections kept open for reuse
+STREAM_HOST = '0.0.0.0'
+STREAM_PORT = 8081  # Content change stream (Server-Sent Events)
+STREAM_KEEPALIVE = 25  # Seconds between keep-alive comments on idle streams
+TIMELINE_DAYS = 7  # Default length of an exported playback timeline
+TIMELINE_MAX_DAYS = 31
+HEARTBEAT_FLUSH_INTERVAL = 2  # Seconds between batched heartbeat writes
+HEARTBEAT_BATCH_SIZE = 500  # Heartbeats written per transaction
+HEARTBEAT_QUEUE_MAX = 20000  # Heartbeats buffered before new ones are refused
+HEARTBEAT_STALE = 120  # Seconds without a heartbeat before a kiosk shows as missing
+HEARTBEAT_RETENTION = 2 * 24 * 3600  # Raw heartbeats are kept this long
+HEARTBEAT_MINUTE_RETENTION = 14 * 24 * 3600  # Per-minute rollups; hourly rollups are kept
+WRITE_BEHIND_RETRIES = 4  # Further attempts at a heartbeat/play batch whose write failed (e.g. database locked)
+WRITE_BEHIND_RETRY_DELAY = 1  # Seconds before the first retry; doubles after each
+PLAY_FLUSH_INTERVAL = 2  # Seconds between batched play-event writes
+PLAY_BATCH_SIZE = 1000  # Play events written per transaction
+PLAY_QUEUE_MAX = 50000  # Play events buffered before new ones are refused
+PLAY_MAX_DURATION = 24 * 3600  # Longest single play event accepted (seconds)
+PLAY_RETENTION_DAYS = 400  # Raw per-day event tables kept; daily totals are kept forever
+AIRTIME_REPORT_DAYS = 30  # Default span of an airtime report
+API_PAGE_SIZE = 50  # Default rows per page of the paginated content/schedule APIs
+API_MAX_PAGE_SIZE = 500
+CONFIG_WAIT_MAX = 25  # Longest a /api/config long-poll is held open (seconds)
+CONFIG_WAITERS_MAX = 2  # Long-polls held at once per worker; the rest get a 503 with Retry-After
+CONFIG_RETRY_AFTER = 5  # Seconds a long-poll turned away at CONFIG_WAITERS_MAX is told to wait
+PREFETCH_ENABLED = False  # Opt in once PREFETCH_URL_PREFIX is reachable from every kiosk
+PREFETCH_FOLDER = os.path.join(UPLOAD_FOLDER, '.prefetch')
+# How kiosks reach the cache: file:// works only for a kiosk on this host; kiosks
+# elsewhere need the panel's address, e.g. 'http://192.168.1.10:8080/content/.prefetch'
+PREFETCH_URL_PREFIX = 'file://' + PREFETCH_FOLDER
+PREFETCH_LOOKAHEAD = 2 * 3600  # Seconds of upcoming schedule to download ahead
+PREFETCH_INTERVAL = 60  # Seconds between prefetch passes
+PREFETCH_REFRESH = 15 * 60  # Seconds before a cached page is revalidated
+PREFETCH_CACHE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB; least recently scheduled pages are evicted
+PREFETCH_MAX_FILE = 500 * 1024 * 1024  # Largest single download
+PREFETCH_MAX_ASSETS = 100  # Static assets fetched per page
+MEDIA_WORKERS = 2  # Processes probing uploads and rendering thumbnails
+MEDIA_JOB_TIMEOUT = 300  # Seconds ffprobe/ffmpeg may take per file
+THUMBNAIL_FOLDER = os.path.join(UPLOAD_FOLDER, '.thumbnails')
+THUMBNAIL_WIDTH = 320
+MANIFEST_FOLDER = os.path.join(UPLOAD_FOLDER, '.manifests')  # Chunk lists published for sync-content
+SYNC_CHUNK_MIN = 256 * 1024  # Content-defined chunk bounds; chunks average about 1.3MB
+SYNC_CHUNK_MAX = 4 * 1024 * 1024
+SYNC_CHUNK_DIVISOR = 4096  # One candidate cut point in this many becomes a boundary
+SYNC_RANGE_MAX = 16 * 1024 * 1024  # Largest single Range request made by sync-content
+SYNC_TIMEOUT = 60  # Seconds sync-content waits on the server
+PROFILING_ENABLED = os.environ.get('KIOSK_PROFILING') == '1'  # Opt-in; adds per-request overhead
+PROFILE_THRESHOLD = 0.5  # Requests slower than this (seconds) are logged with their profile
+PROFILE_TOP_FRAMES = 30  # Functions listed per slow request, by cumulative time
+PROFILE_LOG = os.path.join(KIOSK_HOME, 'profile.log')
+PROFILE_LOG_SIZE = 5 * 1024 * 1024  # Rotated at 5MB
+PROFILE_LOG_BACKUPS = 3
+SLOW_QUERY_MS = 100  # SQL statements slower than this are logged with their parameters
+SLOW_REQUEST_HISTORY = 100  # Slow requests kept for the /slow-requests page
+DEFAULT_USERNAME = 'admin'
+DEFAULT_PASSWORD = 'admin'  # You should change this immediately after setup
+
+# Ensure upload directory exists
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+def load_secret_key():
+    """The session signing key, generated once and kept so sessions survive restarts"""
+    if os.environ.get('KIOSK_SECRET_KEY'):
+        return os.environ['KIOSK_SECRET_KEY']
+    try:
+        fd = os.open(SECRET_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker may have created it a moment ago; wait for its write
+        for _ in range(50):
+            with open(SECRET_KEY_FILE) as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.1)
+        raise RuntimeError(f"{SECRET_KEY_FILE} is empty; delete it to generate a new key")
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+        f.flush()
+        os.fsync(f.fileno())
+    return key
+
+SECRET_KEY = load_secret_key()
+
+app = Flask(__name__)
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max upload
+app.secret_key = SECRET_KEY
+
+# Database setup
+def schedule_columns(day_of_week, start_time, end_time):
+    """Integer form of a schedule slot: (weekday bitmask, start minute, end minute)"""
+    day_mask = 0
+    for day in schedule_days(day_of_week):
+        day_mask |= 1 << day
+    return day_mask, parse_time_minutes(start_time), parse_time_minutes(end_time)
+
+def migrate_base_tables(c):
+    # Users table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    )
+    ''')
+    
+    # Content table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS content (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        url TEXT NOT NULL,
+        file_path TEXT,
+        is_default INTEGER DEFAULT 0,
+        is_offline INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Schedule table
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS schedule (
+        id INTEGER PRIMARY KEY,
+        content_id INTEGER NOT NULL,
+        day_of_week TEXT,
+        start_time TEXT NOT NULL,
+        end_time TEXT NOT NULL,
+        priority INTEGER DEFAULT 1,
+        FOREIGN KEY (content_id) REFERENCES content (id)
+    )
+    ''')
+
+def migrate_schedule_integer_times(c):
+    # Weekdays as a bitmask (Monday = bit 0) and times as minutes past midnight;
+    # the text columns stay as entered in the forms.
+    c.execute('ALTER TABLE schedule ADD COLUMN day_mask INTEGER NOT NULL DEFAULT 0')
+    c.execute('ALTER TABLE schedule ADD COLUMN start_minute INTEGER')
+    c.execute('ALTER TABLE schedule ADD COLUMN end_minute INTEGER')
+    
+    rows = c.execute('SELECT id, day_of_week, start_time, end_time FROM schedule').fetchall()
+    c.executemany('UPDATE schedule SET day_mask = ?, start_minute = ?, end_minute = ? WHERE id = ?',
+                  [schedule_columns(row[1], row[2], row[3]) + (row[0],) for row in rows])
+    
+    c.execute('CREATE INDEX IF NOT EXISTS idx_schedule_time ON schedule (start_minute, end_minute, day_mask)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_schedule_priority ON schedule (priority DESC, content_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_schedule_content ON schedule (content_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_default ON content (is_default) WHERE is_default = 1')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_offline ON content (is_offline) WHERE is_offline = 1')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_created ON content (created_at DESC)')
+
+def migrate_upload_sessions(c):
+    # Resumable uploads: one row per session, one per verified chunk
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS upload_sessions (
+        id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        total_size INTEGER NOT NULL,
+        chunk_size INTEGER NOT NULL,
+        created_at INTEGER NOT NULL
+    )
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS upload_chunks (
+        session_id TEXT NOT NULL,
+        chunk_index INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        PRIMARY KEY (session_id, chunk_index)
+    ) WITHOUT ROWID
+    ''')
+
+def migrate_content_file_validators(c):
+    # Precomputed validators for /content/<path>; etag is the file's SHA-256
+    c.execute('ALTER TABLE content ADD COLUMN etag TEXT')
+    c.execute('ALTER TABLE content ADD COLUMN file_size INTEGER')
+    c.execute('ALTER TABLE content ADD COLUMN file_mtime_ns INTEGER')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_file_path ON content (file_path)')
+    
+    paths = [row[0] for row in c.execute('SELECT DISTINCT file_path FROM content WHERE file_path IS NOT NULL')]
+    for path in paths:
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            c.execute('UPDATE content SET etag = ?, file_size = ?, file_mtime_ns = ? WHERE file_path = ?',
+                      (file_sha256(path), stat.st_size, stat.st_mtime_ns, path))
+
+def migrate_kiosk_fleet(c):
+    # Kiosks identify themselves by a device id (the launcher sends its hostname);
+    # schedule rows with a group_id apply only to that group's kiosks
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS kiosk_groups (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS kiosks (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        group_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (group_id) REFERENCES kiosk_groups (id)
+    )
+    ''')
+    c.execute('ALTER TABLE schedule ADD COLUMN group_id INTEGER REFERENCES kiosk_groups (id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_schedule_group ON schedule (group_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_kiosks_group ON kiosks (group_id)')
+
+HEARTBEAT_METRICS = ('cpu_load', 'memory_pct', 'disk_pct', 'temperature')
+
+def migrate_kiosk_heartbeats(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS heartbeats (
+        kiosk_id TEXT NOT NULL,
+        received_at INTEGER NOT NULL,
+        cpu_load REAL,
+        memory_pct REAL,
+        disk_pct REAL,
+        temperature REAL,
+        chrome_running INTEGER,
+        mode TEXT,
+        content_url TEXT
+    )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_heartbeats_kiosk ON heartbeats (kiosk_id, received_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_heartbeats_received ON heartbeats (received_at)')
+    
+    # Latest heartbeat per kiosk, for the fleet overview
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS kiosk_status (
+        kiosk_id TEXT PRIMARY KEY,
+        last_seen INTEGER NOT NULL,
+        cpu_load REAL,
+        memory_pct REAL,
+        disk_pct REAL,
+        temperature REAL,
+        chrome_running INTEGER,
+        mode TEXT,
+        content_url TEXT
+    )
+    ''')
+    
+    # Rollups: per metric a sample count, sum and maximum, so averages ignore
+    # kiosks that did not report that metric
+    metric_columns = ',\n'.join(
+        f'{m}_count INTEGER NOT NULL DEFAULT 0, {m}_sum REAL NOT NULL DEFAULT 0, {m}_max REAL'
+        for m in HEARTBEAT_METRICS)
+    for table in ('heartbeat_minutes', 'heartbeat_hours'):
+        c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            kiosk_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            offline_samples INTEGER NOT NULL DEFAULT 0,
+            chrome_down_samples INTEGER NOT NULL DEFAULT 0,
+            {metric_columns},
+            PRIMARY KEY (kiosk_id, bucket)
+        ) WITHOUT ROWID
+        ''')
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)')
+
+def migrate_catalog_pagination(c):
+    # Keyset pages walk (priority DESC, id); the id tie-breaker makes the order total
+    c.execute('DROP INDEX IF EXISTS idx_schedule_priority')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_schedule_order ON schedule (priority DESC, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_content_type ON content (type, id)')
+
+def migrate_media_metadata(c):
+    # Filled in by the media worker pool after an upload; media_status is
+    # pending, ready or failed
+    for column in ('mime_type TEXT', 'duration REAL', 'width INTEGER', 'height INTEGER',
+                   'thumbnail_path TEXT', 'media_status TEXT'):
+        c.execute(f'ALTER TABLE content ADD COLUMN {column}')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS media_jobs (
+        id INTEGER PRIMARY KEY,
+        content_id INTEGER,
+        file_path TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        FOREIGN KEY (content_id) REFERENCES content (id)
+    )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_media_jobs_status ON media_jobs (status, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_media_jobs_content ON media_jobs (content_id, id)')
+
+def migrate_play_events(c):
+    # Proof of play: raw events go to one table per local day (play_events_YYYYMMDD,
+    # created on first write) so expired days are dropped whole; reports read
+    # the per-day totals in play_daily. Kiosk ids are stored as small integers.
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS play_kiosks (
+        id INTEGER PRIMARY KEY,
+        kiosk_id TEXT UNIQUE NOT NULL
+    )
+    ''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS play_daily (
+        content_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        kiosk INTEGER NOT NULL,
+        offline INTEGER NOT NULL,
+        plays INTEGER NOT NULL,
+        seconds INTEGER NOT NULL,
+        PRIMARY KEY (content_id, day, kiosk, offline)
+    ) WITHOUT ROWID
+    ''')
+    # No index on day: whole-fleet reports are faster as one scan in key order
+
+# Schema version N is reached by applying MIGRATIONS[N - 1]; append, never reorder
+MIGRATIONS = [
+    migrate_base_tables,
+    migrate_schedule_integer_times,
+    migrate_upload_sessions,
+    migrate_content_file_validators,
+    migrate_kiosk_fleet,
+    migrate_kiosk_heartbeats,
+    migrate_catalog_pagination,
+    migrate_media_metadata,
+    migrate_play_events,
+]
+
+def init_db():
+    conn = get_db_connection()
+    
+    # Apply pending migrations in one transaction; IMMEDIATE keeps two
+    # processes starting at once from migrating the same database twice
+    conn.execute('BEGIN IMMEDIATE')
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+    
+    # Check if default user exists
+    user = conn.execute("SELECT id FROM users WHERE username = ?", (DEFAULT_USERNAME,)).fetchone()
+    if not user:
+        password_hash = hashlib.sha256(DEFAULT_PASSWORD.encode()).hexdigest()
+        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", 
+                     (DEFAULT_USERNAME, password_hash))
+    
+    conn.commit()
+    conn.close()
+
+# Authentication decorator
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            flash('Please log in to access this page')
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# Metrics
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+RESOLVE_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.001)
+REBUILD_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+UPLOAD_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+class MetricsRegistry:
+    """Counters and histograms exposed at /metrics in the Prometheus text format.
+
+    Each series is keyed by its metric name and a tuple of label values. One
+    lock guards every update; an update is only a few additions, so requests
+    never hold it for long. Values owned by other objects (pool sizes, queue
+    depths) are read by collectors when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}  # name -> (type, help, label names, buckets, {label values: value})
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        self.metrics[name] = ('counter', help_text, labels, None, {})
+
+    def histogram(self, name, help_text, buckets, labels=()):
+        self.metrics[name] = ('histogram', help_text, labels, buckets, {})
+
+    def inc(self, name, amount=1, labels=()):
+        series = self.metrics[name][4]
+        with self.lock:
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        _, _, _, buckets, series = self.metrics[name]
+        with self.lock:
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets)
+            histogram.counts[bisect.bisect_left(buckets, value)] += 1
+            histogram.total += value
+            histogram.count += 1
+
+    def collector(self, func):
+        """Register func() returning (name, type, help, [(labels dict, value)]) tuples"""
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, label_names, buckets, series) in self.metrics.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for values, value in sorted(series.items()):
+                    if kind == 'counter':
+                        lines.append(f'{name}{format_labels(label_names, values)} {value}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), value.counts):
+                        cumulative += count
+                        labels = format_labels(label_names + ('le',), values + (bound,))
+                        lines.append(f'{name}_bucket{labels} {cumulative}')
+                    labels = format_labels(label_names, values)
+                    lines.append(f'{name}_sum{labels} {value.total}')
+                    lines.append(f'{name}_count{labels} {value.count}')
+        for collect in self.collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{format_labels(tuple(labels), tuple(labels.values()))} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+metrics.counter('kiosk_http_requests_total', 'Requests handled, by route, method and status',
+                ('route', 'method', 'status'))
+metrics.histogram('kiosk_http_request_duration_seconds', 'Time to build each response, by route and method',
+                  HTTP_BUCKETS, ('route', 'method'))
+metrics.histogram('kiosk_sqlite_query_duration_seconds', 'Time SQLite spent executing each statement',
+                  QUERY_BUCKETS, ('statement',))
+metrics.histogram('kiosk_schedule_resolve_duration_seconds', 'Time /api/current-content spent resolving the schedule',
+                  RESOLVE_BUCKETS)
+metrics.histogram('kiosk_schedule_rebuild_duration_seconds', 'Time to recompile the schedule indexes',
+                  REBUILD_BUCKETS)
+metrics.counter('kiosk_content_bytes_served_total',
+                'Bytes of /content/ files sent, including ranges, by method (sendfile or read)', ('method',))
+metrics.counter('kiosk_upload_bytes_total', 'Bytes received from uploads, by kind (form or chunk)', ('kind',))
+metrics.histogram('kiosk_upload_duration_seconds', 'Time spent receiving each upload, by kind',
+                  UPLOAD_BUCKETS, ('kind',))
+metrics.counter('kiosk_stream_events_total', 'Content changes pushed to kiosks over the stream')
+
+METRICS_MAX_STATEMENTS = 200  # Distinct statement labels; the rest are counted as "other"
+METRICS_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')  # Not migrations or PRAGMAs
+PLAY_PARTITION_RE = re.compile(r'\bplay_events_\d{8}\b')
+_statement_labels = {}
+
+def record_query(sql, elapsed, parameters=None):
+    """Time one statement under its whitespace-normalised text"""
+    if request_profiler.enabled:
+        request_profiler.query(sql, parameters, elapsed)
+    label = _statement_labels.get(sql)
+    if label is None:
+        # Every day's play-event table shares one label, and is not cached, so
+        # a year of partitions does not use up the statement limit
+        label, per_day = PLAY_PARTITION_RE.subn('play_events_<day>', ' '.join(sql.split()))
+        if not label.upper().startswith(METRICS_STATEMENTS):
+            label = ''
+        elif len(_statement_labels) >= METRICS_MAX_STATEMENTS and not per_day:
+            label = 'other'
+        if len(_statement_labels) < METRICS_MAX_STATEMENTS and not per_day:
+            _statement_labels[sql] = label
+    if label:
+        metrics.observe('kiosk_sqlite_query_duration_seconds', elapsed, (label,))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.inc('kiosk_http_requests_total', labels=(route, request.method, str(response.status_code)))
+        metrics.observe('kiosk_http_request_duration_seconds', time.perf_counter() - started,
+                        (route, request.method))
+    return response
+
+# Request profiling
+class RequestProfiler:
+    """Opt-in profiling of slow requests and SQL statements (PROFILING_ENABLED).
+
+    Requests run under cProfile, and those slower than PROFILE_THRESHOLD are
+    written to PROFILE_LOG with their top frames and listed at /slow-requests.
+    Only one request is profiled at a time, since newer Pythons allow a single
+    active profiler; concurrent ones are still timed. Statements slower than
+    SLOW_QUERY_MS are logged with their parameters. When disabled, every hook
+    returns after checking one attribute.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.lock = threading.Lock()  # Held by the request being profiled
+        self.recent = deque(maxlen=SLOW_REQUEST_HISTORY)
+        handler = logging.handlers.RotatingFileHandler(PROFILE_LOG, maxBytes=PROFILE_LOG_SIZE,
+                                                       backupCount=PROFILE_LOG_BACKUPS, delay=True)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        self.logger = logging.getLogger('kiosk.profile')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.handlers = [handler]
+
+    def start(self):
+        g.profile_started = time.perf_counter()
+        g.profile_queries = [0, 0.0]  # Statements run and seconds spent in them
+        if not self.lock.acquire(blocking=False):
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Another profiler (e.g. a debugger) is active
+            self.lock.release()
+            return
+        g.profile = profile
+
+    def finish(self, status):
+        started = g.pop('profile_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.disable()
+            self.lock.release()
+        queries, query_time = g.pop('profile_queries')
+        if elapsed < PROFILE_THRESHOLD:
+            return
+
+        entry = {
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': status,
+            'duration_ms': round(elapsed * 1000, 1),
+            'queries': queries,
+            'sql_ms': round(query_time * 1000, 1),
+            'profiled': profile is not None
+        }
+        self.recent.append(entry)
+        message = (f"Slow request {entry['duration_ms']}ms: {entry['method']} {entry['path']} -> {status} "
+                   f"({queries} queries, {entry['sql_ms']}ms SQL)")
+        if profile is not None:
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP_FRAMES)
+            message += '\n' + out.getvalue()
+        self.logger.info(message)
+
+    def query(self, sql, parameters, elapsed):
+        totals = g.get('profile_queries') if has_app_context() else None
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            self.logger.info('Slow query %.1fms: %s %s', elapsed * 1000, ' '.join(sql.split()),
+                             '(executemany)' if parameters is None else repr(parameters))
+
+    def slowest(self):
+        return sorted(self.recent, key=lambda entry: entry['duration_ms'], reverse=True)
+
+request_profiler = RequestProfiler(PROFILING_ENABLED)
+
+@app.before_request
+def start_request_profile():
+    if request_profiler.enabled:
+        request_profiler.start()
+
+@app.after_request
+def note_profiled_status(response):
+    if request_profiler.enabled:
+        g.profile_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_profile(exception):
+    if request_profiler.enabled:
+        request_profiler.finish(g.pop('profile_status', 500))
+
+# Database connection pool
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection whose close() hands it back to the pool"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started, parameters)
+
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    def close(self):
+        db_pool.release(self)
+
+class ConnectionPool:
+    """Long-lived SQLite connections in WAL mode, reused across requests.
+
+    Connections are opened on demand and up to ``size`` idle ones are kept.
+    Each keeps its own prepared statement cache, so the same query text is
+    compiled once per connection rather than once per request. Every checkout
+    is numbered; a release that names an older checkout is ignored, so a late
+    second release cannot take a connection away from its next user.
+    """
+
+    PRAGMAS = (
+        'PRAGMA journal_mode = WAL',  # Readers no longer block on a committing writer
+        'PRAGMA synchronous = NORMAL',  # Durable enough with WAL, far fewer fsyncs
+        'PRAGMA cache_size = -8000',  # 8 MB page cache per connection
+        'PRAGMA mmap_size = 67108864',  # Read the database through a 64 MB mapping
+        'PRAGMA temp_store = MEMORY',
+    )
+
+    def __init__(self, database, size):
+        self.database = database
+        self.size = size
+        self.idle = []
+        self.checked_out = {}  # connection -> checkout number
+        self.checkouts = itertools.count(1)
+        self.inherited = []
+        self.lock = threading.Lock()
+        self.stats = {'opened': 0, 'closed': 0, 'acquired': 0, 'reused': 0, 'peak_in_use': 0}
+
+    def _open(self):
+        conn = sqlite3.connect(self.database, timeout=10, factory=PooledConnection,
+                               check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+            self.stats['acquired'] += 1
+            if conn is not None:
+                self.stats['reused'] += 1
+            else:
+                self.stats['opened'] += 1
+        if conn is None:
+            conn = self._open()
+        with self.lock:
+            conn.checkout = self.checked_out[conn] = next(self.checkouts)
+            self.stats['peak_in_use'] = max(self.stats['peak_in_use'], len(self.checked_out))
+        return conn
+
+    def release(self, conn, checkout=None):
+        with self.lock:
+            if conn not in self.checked_out or checkout not in (None, self.checked_out[conn]):
+                return
+            del self.checked_out[conn]
+        if conn.in_transaction:
+            conn.rollback()
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+            self.stats['closed'] += 1
+        sqlite3.Connection.close(conn)
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, in_use=len(self.checked_out), idle=len(self.idle), size=self.size)
+
+    def reset_after_fork(self):
+        """Stop using connections inherited from the parent; SQLite handles must not cross a fork.
+
+        They are kept referenced rather than closed: closing one here could
+        checkpoint and delete the WAL the parent is still using.
+        """
+        self.inherited = self.idle + list(self.checked_out)
+        self.idle = []
+        self.checked_out = {}
+        self.lock = threading.Lock()
+
+db_pool = ConnectionPool(DATABASE, DB_POOL_SIZE)
+os.register_at_fork(after_in_child=db_pool.reset_after_fork)
+
+@app.teardown_appcontext
+def release_db_connections(exception):
+    """Return connections a request forgot to close, e.g. after an error"""
+    for conn, checkout in g.pop('db_connections', ()):
+        db_pool.release(conn, checkout)
+
+# Helper functions
+def get_db_connection():
+    conn = db_pool.acquire()
+    if has_app_context():
+        g.setdefault('db_connections', []).append((conn, conn.checkout))
+    return conn
+
+# Worker processes
+class ChangeSignal:
+    """A file replaced whenever one worker process changes state the others cache.
+
+    Each worker polls it from a background thread every CHANGE_CHECK_INTERVAL
+    seconds, so an edit made in one worker reaches every other worker within
+    about a second while requests themselves never touch the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.seen = self._signature()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def publish(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(f"{os.getpid()} {time.time()}\n")
+        os.replace(temp_path, self.path)  # A new inode, even within one mtime tick
+        self.seen = self._signature()
+
+    def watch(self, callback):
+        """Call ``callback`` whenever another process publishes; starts once per process"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, args=(callback,), name='change-signal', daemon=True)
+                self.thread.start()
+
+    def _run(self, callback):
+        while True:
+            time.sleep(CHANGE_CHECK_INTERVAL)
+            signature = self._signature()
+            if signature == self.seen:
+                continue
+            self.seen = signature
+            try:
+                callback()
+            except sqlite3.Error as e:
+                app.logger.error('Reloading after a change in another worker failed: %s', e)
+
+class LeaderLock:
+    """Elects one worker process to run the background services.
+
+    The content stream port, the prefetch cache and media job recovery must
+    each have a single owner. Every worker tries a non-blocking flock; the
+    holder keeps it until it exits, and the others try again every
+    LEADER_RETRY seconds in case it was restarted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.next_attempt = 0
+
+    def acquire(self):
+        """True if this process is (now) the leader"""
+        if self.file is not None:
+            return True
+        now = time.monotonic()
+        if now < self.next_attempt:
+            return False
+        self.next_attempt = now + LEADER_RETRY
+        lock_file = open(self.path, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.file = lock_file
+        return True
+
+schedule_changes = ChangeSignal(os.path.join(KIOSK_HOME, '.schedule_generation'))
+leader_lock = LeaderLock(os.path.join(KIOSK_HOME, '.leader.lock'))
+
+# Schedule engine
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+FALLBACK_CONTENT = {
+    'url': f'file://{UPLOAD_FOLDER}/fallback.html',
+    'is_offline': 1
+}
+
+def parse_time_minutes(value):
+    """Convert an 'HH:MM' (or 'HH:MM:SS') string to minutes past midnight"""
+    try:
+        hours, minutes = str(value).strip().split(':')[:2]
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+def schedule_days(day_of_week):
+    """Return the weekday numbers (Monday = 0) a schedule row applies to"""
+    day = (day_of_week or '').strip().lower()
+    if day == 'everyday':
+        return range(7)
+    if day in DAY_NAMES:
+        return [DAY_NAMES.index(day)]
+    return []
+
+class ScheduleIndex:
+    """Schedule table compiled into a sorted weekly timeline of segments.
+
+    Weekday N owns minutes N*1440 to N*1440+1439 of the timeline. Overlapping
+    slots are resolved by priority when the index is built, so each segment
+    already knows its winning content and a lookup is a single bisect.
+    """
+
+    def __init__(self, content, schedule_rows):
+        self.content = content
+        self.default = next((c for c in content.values() if c['is_default']), FALLBACK_CONTENT)
+
+        intervals = []
+        for row in schedule_rows:
+            if row['content_id'] not in self.content:
+                continue
+            start, end = row['start_minute'], row['end_minute']
+            if start is None or end is None:
+                continue
+            # End times are inclusive to the minute, as in the original SQL
+            # comparison; a slot ending before it starts runs past midnight.
+            end += 1
+            if end <= start:
+                end += MINUTES_PER_DAY
+            rank = (-int(row['priority'] or 0), row['id'])
+            for day in range(7):
+                if not row['day_mask'] & (1 << day):
+                    continue
+                begin = day * MINUTES_PER_DAY + start
+                finish = day * MINUTES_PER_DAY + end
+                if finish > MINUTES_PER_WEEK:
+                    intervals.append((0, finish - MINUTES_PER_WEEK, rank, row['content_id']))
+                    finish = MINUTES_PER_WEEK
+                intervals.append((begin, finish, rank, row['content_id']))
+        intervals.sort()
+
+        boundaries = sorted({0} | {i[0] for i in intervals} | {i[1] for i in intervals if i[1] < MINUTES_PER_WEEK})
+        self.starts = []
+        self.winners = []
+        self.responses = {}
+        active = []
+        pending = 0
+        for minute in boundaries:
+            while pending < len(intervals) and intervals[pending][0] <= minute:
+                begin, finish, rank, content_id = intervals[pending]
+                heapq.heappush(active, (rank, finish, content_id))
+                pending += 1
+            while active and active[0][1] <= minute:
+                heapq.heappop(active)
+            winner = active[0][2] if active else None
+            if not self.winners or self.winners[-1] != winner:
+                self.starts.append(minute)
+                self.winners.append(winner)
+
+    def segment(self, when):
+        """Return the index of the timeline segment covering a datetime"""
+        minute = when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+        return bisect.bisect_right(self.starts, minute) - 1
+
+    def content_for(self, segment):
+        content_id = self.winners[segment]
+        return self.content[content_id] if content_id is not None else self.default
+
+    def next_transition(self, when, segment):
+        """Return when the content shown at ``when`` next changes, or None if it never does"""
+        if len(self.starts) == 1:
+            return None
+        following, offset = segment + 1, 0
+        if following == len(self.starts):
+            following, offset = 0, MINUTES_PER_WEEK
+            if self.winners[0] == self.winners[segment]:
+                following = 1
+        minute = when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+        delta = self.starts[following] + offset - minute
+        return when.replace(second=0, microsecond=0) + timedelta(minutes=delta)
+
+    def current_response(self, when):
+        """Return the serialized /api/current-content body and its ETag.
+
+        Responses are cached per segment until the segment's validity window
+        moves on, so repeat polls neither serialize nor hash anything.
+        """
+        segment = self.segment(when)
+        valid_until = self.next_transition(when, segment)
+        cached = self.responses.get(segment)
+        if cached and cached[0] == valid_until:
+            return cached[1], cached[2]
+
+        payload = dict(self.content_for(segment))
+        payload['valid_until'] = valid_until.isoformat() if valid_until else None
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        self.responses[segment] = (valid_until, body, etag)
+        return body, etag
+
+    def timeline(self, start, days):
+        """Return the (datetime, content) transitions from ``start`` for ``days`` days.
+
+        The first entry is the content showing at ``start``; gaps between
+        schedule slots already resolve to the default content.
+        """
+        when = start.replace(second=0, microsecond=0)
+        end = when + timedelta(days=days)
+        segment = self.segment(when)
+        transitions = [(when, self.content_for(segment))]
+        while True:
+            when = self.next_transition(when, segment)
+            if when is None or when >= end:
+                return transitions
+            segment = self.segment(when)
+            content = self.content_for(segment)
+            # A slot showing the default content is not a visible change
+            if content is not transitions[-1][1]:
+                transitions.append((when, content))
+
+class FleetSchedule:
+    """One compiled ScheduleIndex per kiosk group, plus the kiosk to group map.
+
+    Schedule rows without a group apply to every kiosk; kiosks that are not
+    registered or not in a group use the index built from those rows alone.
+    """
+
+    def __init__(self, content_rows, schedule_rows, kiosk_rows, group_rows):
+        content = {row['id']: dict(row) for row in content_rows}
+        content_prefetcher.localize(content)
+        shared = [row for row in schedule_rows if row['group_id'] is None]
+        self.default_index = ScheduleIndex(content, shared)
+
+        self.groups = {}
+        for group in group_rows:
+            rows = [row for row in schedule_rows if row['group_id'] == group['id']]
+            self.groups[group['id']] = ScheduleIndex(content, shared + rows) if rows else self.default_index
+        self.kiosk_groups = {row['id']: row['group_id'] for row in kiosk_rows}
+
+    def for_kiosk(self, kiosk_id):
+        return self.groups.get(self.kiosk_groups.get(kiosk_id), self.default_index)
+
+_fleet_schedule = None
+
+def rebuild_schedule_index(publish=True):
+    """Recompile the in-memory schedule indexes from the database.
+
+    With ``publish`` (after an edit), other worker processes rebuild theirs too.
+    """
+    global _fleet_schedule
+    started = time.perf_counter()
+    conn = get_db_connection()
+    content_rows = conn.execute('SELECT * FROM content ORDER BY id').fetchall()
+    schedule_rows = conn.execute('SELECT * FROM schedule').fetchall()
+    kiosk_rows = conn.execute('SELECT id, group_id FROM kiosks').fetchall()
+    group_rows = conn.execute('SELECT id FROM kiosk_groups').fetchall()
+    conn.close()
+
+    _fleet_schedule = FleetSchedule(content_rows, schedule_rows, kiosk_rows, group_rows)
+    metrics.observe('kiosk_schedule_rebuild_duration_seconds', time.perf_counter() - started)
+    if publish:
+        schedule_changes.publish()
+    content_stream.notify()
+    content_prefetcher.notify()
+    return _fleet_schedule
+
+def reload_shared_state():
+    """Drop caches after another worker edited content, schedules or the prefetch cache"""
+    global _file_validators
+    _file_validators = None
+    content_prefetcher.reload()
+    return rebuild_schedule_index(publish=False)
+
+def get_schedule_index(kiosk_id=None):
+    """The compiled schedule for a kiosk (or for ungrouped kiosks)"""
+    return (_fleet_schedule or reload_shared_state()).for_kiosk(kiosk_id)
+
+def get_current_content(now=None, kiosk_id=None):
+    """Determine which content should be displayed based on schedule"""
+    index = get_schedule_index(kiosk_id)
+    return dict(index.content_for(index.segment(now or datetime.now())))
+
+# Content change stream
+class ContentStream:
+    """Pushes the current content to kiosks as Server-Sent Events.
+
+    Every connection is served by a single asyncio loop on a background thread,
+    so an idle kiosk costs one socket instead of one worker thread. A new event
+    is sent only when the resolved content changes, either because a schedule
+    boundary passed or because an admin edit rebuilt the schedule index.
+    """
+
+    PATH = '/api/current-content/stream'
+    MAX_BUFFER = 64 * 1024  # Drop clients that stop reading
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.clients = {}  # writer -> [kiosk id, last event sent]
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def start(self, host=None, port=None):
+        """Start the stream server once; later calls are no-ops"""
+        with self.lock:
+            if self.thread:
+                return
+            ready = threading.Event()
+            self.thread = threading.Thread(target=self._run, name='content-stream', daemon=True,
+                                           args=(host or STREAM_HOST, port or STREAM_PORT, ready))
+            self.thread.start()
+            ready.wait()
+
+    def notify(self):
+        """Re-resolve the current content; safe to call from any thread"""
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._refresh)
+
+    def _run(self, host, port, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.start_server(self._handle, host, port))
+        except OSError as e:
+            print(f"Content stream disabled: {e}")
+            ready.set()
+            return
+        self.loop = loop
+        self._refresh()
+        loop.call_later(STREAM_KEEPALIVE, self._keepalive)
+        ready.set()
+        loop.run_forever()
+
+    def _event(self, index, now):
+        segment = index.segment(now)
+        transition = index.next_transition(now, segment)
+        payload = dict(index.content_for(segment))
+        payload['next_transition'] = transition.isoformat() if transition else None
+        return f"data: {json.dumps(payload, separators=(',', ':'))}\n\n".encode(), transition
+
+    def _refresh(self):
+        # Resolve once per distinct group index, however many kiosks share it
+        now = datetime.now()
+        events = {}
+        wake = now + timedelta(minutes=1)
+        for writer, state in list(self.clients.items()):
+            index = get_schedule_index(state[0])
+            if index not in events:
+                events[index], transition = self._event(index, now)
+                if transition:
+                    wake = min(wake, transition)
+            if events[index] != state[1]:
+                state[1] = events[index]
+                self._send(writer, state[1])
+                metrics.inc('kiosk_stream_events_total')
+
+        # Wake up at the next boundary, re-checking at least once a minute in
+        # case the wall clock was adjusted underneath the loop's monotonic timer.
+        if self.timer:
+            self.timer.cancel()
+        self.timer = self.loop.call_later(max((wake - now).total_seconds(), 0), self._refresh)
+
+    def _keepalive(self):
+        for writer in list(self.clients):
+            self._send(writer, b': keep-alive\n\n')
+        self.loop.call_later(STREAM_KEEPALIVE, self._keepalive)
+
+    def _send(self, writer, data):
+        if writer.transport.get_write_buffer_size() > self.MAX_BUFFER:
+            self.clients.pop(writer, None)
+            writer.close()
+            return
+        writer.write(data)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+
+        parts = request_line.split(b'\r\n', 1)[0].split()
+        target = urlsplit(parts[1].decode('latin-1') if len(parts) > 1 else '')
+        if parts[:1] != [b'GET'] or target.path != self.PATH:
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            writer.close()
+            return
+
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'X-Accel-Buffering: no\r\n'
+                     b'Connection: keep-alive\r\n\r\n'
+                     b'retry: 5000\n\n')
+        # The refresh sends the newcomer its first event and re-arms the timer
+        # in case its group changes sooner than anyone else's
+        self.clients[writer] = [parse_qs(target.query).get('kiosk', [None])[0], None]
+        self._refresh()
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+content_stream = ContentStream()
+
+# Write-behind storage
+class WriteBehindQueue:
+    """Buffers rows in memory and writes them to SQLite in batches from one thread.
+
+    Request handlers only append to a list, so many clients reporting at once
+    never wait on each other's commits; each batch is a single transaction.
+    A batch that fails (say, while the database is locked) is retried with
+    backoff before it is dropped; new items keep queueing in the meantime.
+    """
+
+    def __init__(self, flush, interval, max_batch, max_pending,
+                 retries=WRITE_BEHIND_RETRIES, retry_delay=WRITE_BEHIND_RETRY_DELAY):
+        self.flush = flush
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.pending = []
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.written = 0
+        self.dropped = 0
+        self.retried = 0
+        self.failed = 0
+
+    def put(self, items):
+        """Queue items; returns False (and queues nothing) when the buffer is full"""
+        with self.condition:
+            if len(self.pending) + len(items) > self.max_pending:
+                self.dropped += len(items)
+                return False
+            self.pending.extend(items)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self.thread.start()
+            if len(self.pending) >= self.max_batch:
+                self.condition.notify()
+        return True
+
+    def drain(self):
+        """Write everything queued so far from the calling thread"""
+        with self.condition:
+            items, self.pending = self.pending, []
+        self._write(items)
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'pending': len(self.pending),
+                'written': self.written,
+                'dropped': self.dropped,
+                'retried': self.retried,
+                'failed': self.failed
+            }
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if len(self.pending) < self.max_batch:
+                    self.condition.wait(self.interval)
+                items, self.pending = self.pending, []
+            self._write(items)
+
+    def _write(self, items):
+        with self.write_lock:
+            for start in range(0, len(items), self.max_batch):
+                batch = items[start:start + self.max_batch]
+                for attempt in range(self.retries + 1):
+                    try:
+                        self.flush(batch)
+                        self.written += len(batch)
+                        break
+                    except sqlite3.Error as e:
+                        if attempt == self.retries:
+                            self.failed += len(batch)
+                            app.logger.error('Write-behind flush of %d rows failed, dropping them: %s', len(batch), e)
+                        else:
+                            self.retried += 1
+                            app.logger.warning('Write-behind flush of %d rows failed, retrying: %s', len(batch), e)
+                            time.sleep(self.retry_delay * 2 ** attempt)
+
+def rollup_upsert_sql(table):
+    """INSERT ... ON CONFLICT statement that merges a partial rollup into ``table``"""
+    columns = ['kiosk_id', 'bucket', 'samples', 'offline_samples', 'chrome_down_samples']
+    updates = [f'{c} = {c} + excluded.{c}' for c in columns[2:]]
+    for m in HEARTBEAT_METRICS:
+        columns += [f'{m}_count', f'{m}_sum', f'{m}_max']
+        updates += [f'{m}_count = {m}_count + excluded.{m}_count',
+                    f'{m}_sum = {m}_sum + excluded.{m}_sum',
+                    f'{m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {m}_max))']
+    placeholders = ', '.join('?' * len(columns))
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT (kiosk_id, bucket) DO UPDATE SET {', '.join(updates)}")
+
+HEARTBEAT_COLUMNS = ('kiosk_id', 'received_at') + HEARTBEAT_METRICS + ('chrome_running', 'mode', 'content_url')
+HEARTBEAT_ROLLUPS = (('heartbeat_minutes', 60), ('heartbeat_hours', 3600))
+_rollup_sql = {table: rollup_upsert_sql(table) for table, _ in HEARTBEAT_ROLLUPS}
+_heartbeats_pruned = 0
+
+def write_heartbeats(batch):
+    """Store a batch of heartbeats and fold it into the rollup tables"""
+    global _heartbeats_pruned
+    rows = [tuple(hb[c] for c in HEARTBEAT_COLUMNS) for hb in batch]
+    
+    # Aggregate in memory first so each rollup row is written once per batch
+    rollups = {}
+    latest = {}
+    for hb in batch:
+        if hb['received_at'] >= latest.get(hb['kiosk_id'], hb)['received_at']:
+            latest[hb['kiosk_id']] = hb
+        for table, size in HEARTBEAT_ROLLUPS:
+            key = (hb['kiosk_id'], hb['received_at'] // size * size)
+            totals = rollups.setdefault(table, {}).setdefault(key, [0, 0, 0] + [0, 0.0, None] * len(HEARTBEAT_METRICS))
+            totals[0] += 1
+            totals[1] += hb['mode'] == 'offline'
+            totals[2] += hb['chrome_running'] == 0
+            for i, m in enumerate(HEARTBEAT_METRICS):
+                value = hb[m]
+                if value is not None:
+                    offset = 3 + i * 3
+                    totals[offset] += 1
+                    totals[offset + 1] += value
+                    totals[offset + 2] = value if totals[offset + 2] is None else max(totals[offset + 2], value)
+    
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.executemany(f"INSERT INTO heartbeats ({', '.join(HEARTBEAT_COLUMNS)}) "
+                             f"VALUES ({', '.join('?' * len(HEARTBEAT_COLUMNS))})", rows)
+            for table, totals in rollups.items():
+                conn.executemany(_rollup_sql[table], [key + tuple(values) for key, values in totals.items()])
+            status_columns = ('kiosk_id', 'received_at') + HEARTBEAT_COLUMNS[2:]
+            conn.executemany(f'''
+                INSERT INTO kiosk_status (kiosk_id, last_seen, {', '.join(HEARTBEAT_COLUMNS[2:])})
+                VALUES ({', '.join('?' * len(status_columns))})
+                ON CONFLICT (kiosk_id) DO UPDATE SET
+                    last_seen = excluded.last_seen,
+                    {', '.join(f'{c} = excluded.{c}' for c in HEARTBEAT_COLUMNS[2:])}
+                WHERE excluded.last_seen >= kiosk_status.last_seen
+            ''', [tuple(hb[c] for c in status_columns) for hb in latest.values()])
+            
+            # Expire old detail about once an hour
+            now = int(time.time())
+            if now - _heartbeats_pruned >= 3600:
+                conn.execute('DELETE FROM heartbeats WHERE received_at < ?', (now - HEARTBEAT_RETENTION,))
+                conn.execute('DELETE FROM heartbeat_minutes WHERE bucket < ?', (now - HEARTBEAT_MINUTE_RETENTION,))
+                _heartbeats_pruned = now
+    finally:
+        conn.close()
+
+heartbeat_queue = WriteBehindQueue(write_heartbeats, HEARTBEAT_FLUSH_INTERVAL,
+                                   HEARTBEAT_BATCH_SIZE, HEARTBEAT_QUEUE_MAX)
+atexit.register(heartbeat_queue.drain)
+
+# Proof of play
+PLAY_PARTITION_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        kiosk INTEGER NOT NULL,
+        start INTEGER NOT NULL,
+        duration INTEGER NOT NULL,
+        content_id INTEGER NOT NULL,
+        offline INTEGER NOT NULL,
+        PRIMARY KEY (kiosk, start)
+    ) WITHOUT ROWID
+'''  # start is seconds after local midnight; content_id 0 is a page that is not in the catalog
+
+def play_day(day):
+    """YYYYMMDD integer of a date, as used in play_daily and partition names"""
+    return day.year * 10000 + day.month * 100 + day.day
+
+def play_partition(day):
+    return f'play_events_{day}'
+
+def split_play_event(started_at, ended_at):
+    """Yield (day, seconds after midnight, duration) for each local day an event spans"""
+    while started_at < ended_at:
+        day = datetime.fromtimestamp(started_at).date()
+        midnight = int(datetime.combine(day, datetime.min.time()).timestamp())
+        next_midnight = int(datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp())
+        end = min(ended_at, next_midnight)
+        yield play_day(day), started_at - midnight, end - started_at
+        started_at = end
+
+_play_kiosks = {}
+_play_partitions = set()
+_play_events_pruned = 0
+
+def write_play_events(batch):
+    """Append a batch of play events to their day tables and add them to play_daily.
+
+    Events are keyed by kiosk and start second, so a batch a kiosk resends
+    after a lost response is stored, and counted, once. Kiosk ids and day
+    tables learned in the transaction are cached only once it commits.
+    """
+    global _play_events_pruned
+    kiosks, created, dropped = dict(_play_kiosks), set(), set()
+    now = int(time.time())
+    prune = now - _play_events_pruned >= 3600
+    conn = get_db_connection()
+    try:
+        with conn:
+            for kiosk_id in {event['kiosk_id'] for event in batch} - kiosks.keys():
+                conn.execute('INSERT OR IGNORE INTO play_kiosks (kiosk_id) VALUES (?)', (kiosk_id,))
+                kiosks[kiosk_id] = conn.execute('SELECT id FROM play_kiosks WHERE kiosk_id = ?',
+                                                (kiosk_id,)).fetchone()[0]
+            urls = {}
+            if any(event['content_id'] is None and event['url'] for event in batch):
+                urls = {row['url']: row['id'] for row in conn.execute(
+                    'SELECT url, MIN(id) AS id FROM content WHERE url IS NOT NULL GROUP BY url')}
+            
+            totals = {}
+            for event in batch:
+                kiosk = kiosks[event['kiosk_id']]
+                content_id = event['content_id'] if event['content_id'] is not None else urls.get(event['url'], 0)
+                first = True
+                for day, start, duration in split_play_event(event['started_at'], event['ended_at']):
+                    table = play_partition(day)
+                    if table not in _play_partitions and table not in created:
+                        conn.execute(PLAY_PARTITION_SQL.format(table=table))
+                        created.add(table)
+                    cursor = conn.execute(f'INSERT OR IGNORE INTO {table} VALUES (?, ?, ?, ?, ?)',
+                                          (kiosk, start, duration, content_id, event['offline']))
+                    if cursor.rowcount == 1:
+                        key = (content_id, day, kiosk, event['offline'])
+                        plays, seconds = totals.get(key, (0, 0))
+                        totals[key] = (plays + first, seconds + duration)
+                    first = False
+            conn.executemany('''
+                INSERT INTO play_daily (content_id, day, kiosk, offline, plays, seconds) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (content_id, day, kiosk, offline) DO UPDATE SET
+                    plays = plays + excluded.plays, seconds = seconds + excluded.seconds
+            ''', [key + values for key, values in totals.items()])
+            
+            # Drop expired day tables about once an hour
+            if prune:
+                cutoff = play_partition(play_day(datetime.now().date() - timedelta(days=PLAY_RETENTION_DAYS)))
+                for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'play_events_%'"
+                                        ).fetchall():
+                    if row['name'] < cutoff:
+                        conn.execute(f'DROP TABLE {row["name"]}')
+                        dropped.add(row['name'])
+    finally:
+        conn.close()
+    
+    _play_kiosks.update(kiosks)
+    _play_partitions.update(created - dropped)
+    _play_partitions.difference_update(dropped)
+    if prune:
+        _play_events_pruned = now
+
+play_queue = WriteBehindQueue(write_play_events, PLAY_FLUSH_INTERVAL, PLAY_BATCH_SIZE, PLAY_QUEUE_MAX)
+atexit.register(play_queue.drain)
+
+# Content prefetch
+class AssetCollector(HTMLParser):
+    """Collects the static asset references (scripts, styles, media) of a page"""
+
+    ASSET_ATTRIBUTES = {
+        'script': ('src',), 'img': ('src',), 'source': ('src',),
+        'video': ('src', 'poster'), 'audio': ('src',), 'link': ('href',)
+    }
+    LINK_RELS = {'stylesheet', 'icon', 'preload', 'shortcut'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.assets = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'link' and not self.LINK_RELS & set((attrs.get('rel') or '').lower().split()):
+            return
+        for name in self.ASSET_ATTRIBUTES.get(tag, ()):
+            value = (attrs.get(name) or '').strip()
+            if value and not value.startswith(('data:', 'blob:', 'javascript:')):
+                self.assets.append(value)
+
+class ContentPrefetcher:
+    """Downloads upcoming URL content into a size-bounded cache on local disk.
+
+    A background thread looks PREFETCH_LOOKAHEAD seconds ahead in every
+    group's schedule and fetches each web page (plus its scripts, styles and
+    media) into PREFETCH_FOLDER/<key>/. Once a copy is complete the schedule
+    index is rebuilt and serves the local URL instead, so a slot starts
+    without waiting on the network. Least recently scheduled copies are
+    evicted when the cache grows past PREFETCH_CACHE_SIZE.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.wake = threading.Event()
+
+    def start(self):
+        if self.thread is not None or not PREFETCH_ENABLED:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            os.makedirs(self.folder, exist_ok=True)
+            self.entries = self._load_entries()
+            self.thread = threading.Thread(target=self._run, name='content-prefetch', daemon=True)
+            self.thread.start()
+        rebuild_schedule_index(publish=False)
+
+    def reload(self):
+        """Re-read the cache in a worker that is not running the prefetcher itself"""
+        if self.thread is not None or not PREFETCH_ENABLED or not os.path.isdir(self.folder):
+            return
+        entries = self._load_entries(cleanup=False)
+        with self.lock:
+            self.entries = entries
+
+    def notify(self):
+        """Run a prefetch pass now (after schedule edits)"""
+        self.wake.set()
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+    @classmethod
+    def servable(cls, parts):
+        """True for the path parts of a file inside a finished copy, as named under /content/"""
+        return (len(parts) > 2 and parts[0] == os.path.basename(PREFETCH_FOLDER)
+                and re.fullmatch(r'[0-9a-f]{32}', parts[1]) is not None and parts[2:] != [cls.MANIFEST])
+
+    def local_url(self, entry):
+        return f"{PREFETCH_URL_PREFIX}/{entry['key']}/{entry['file']}"
+
+    def localize(self, content):
+        """Point URL content at its local copy wherever one is warm"""
+        with self.lock:
+            for item in content.values():
+                entry = self.entries.get(self.key(item['url'])) if item['type'] == 'url' else None
+                if entry:
+                    item['source_url'] = item['url']
+                    item['url'] = self.local_url(entry)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': sum(entry['size'] for entry in self.entries.values()),
+                'limit': PREFETCH_CACHE_SIZE
+            }
+
+    def _load_entries(self, cleanup=True):
+        entries = {}
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if '.' in name:
+                if cleanup:
+                    shutil.rmtree(path, ignore_errors=True)  # Interrupted download
+                continue
+            try:
+                with open(os.path.join(path, self.MANIFEST)) as f:
+                    entries[name] = json.load(f)
+            except (OSError, ValueError):
+                if cleanup:
+                    shutil.rmtree(path, ignore_errors=True)
+        return entries
+
+    def upcoming_urls(self):
+        """Web URLs scheduled within the lookahead window, soonest first"""
+        fleet = _fleet_schedule or rebuild_schedule_index(publish=False)
+        now = datetime.now()
+        upcoming = {}
+        for index in {id(i): i for i in [fleet.default_index, *fleet.groups.values()]}.values():
+            # The default and offline pages can be needed at any moment
+            standby = [c for c in index.content.values() if c['is_default'] or c['is_offline']]
+            scheduled = [c for _, c in index.timeline(now, PREFETCH_LOOKAHEAD / 86400)]
+            for content in scheduled + standby:
+                url = content.get('source_url', content['url'])
+                if content.get('type') == 'url' and url.startswith(('http://', 'https://')):
+                    upcoming.setdefault(url, None)
+        return list(upcoming)
+
+    def _run(self):
+        while True:
+            try:
+                self.prefetch()
+            except Exception as e:
+                app.logger.error('Content prefetch pass failed: %s', e)
+            self.wake.wait(PREFETCH_INTERVAL)
+            self.wake.clear()
+
+    def prefetch(self):
+        """One pass: fetch or revalidate upcoming pages, then enforce the size limit"""
+        urls = self.upcoming_urls()
+        changed = False
+        now = time.time()
+        for url in urls:
+            key = self.key(url)
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry:
+                    entry['last_used'] = now
+            if entry and now - entry['fetched_at'] < PREFETCH_REFRESH:
+                continue
+            try:
+                changed |= self.fetch(url, entry)
+            except (OSError, ValueError, urllib.error.URLError) as e:
+                app.logger.warning('Could not prefetch %s: %s', url, e)
+        
+        changed |= self.evict({self.key(url) for url in urls})
+        if changed:
+            rebuild_schedule_index()
+
+    def _download(self, url, path, headers=None, limit=PREFETCH_MAX_FILE):
+        """Stream ``url`` into ``path``; returns the response, or None on 304"""
+        request = urllib.request.Request(url, headers={'User-Agent': 'KioskPrefetch/1.0', **(headers or {})})
+        try:
+            response = urllib.request.urlopen(request, timeout=30)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+        with response, open(path, 'wb') as f:
+            size = 0
+            while True:
+                block = response.read(1024 * 1024)
+                if not block:
+                    break
+                size += len(block)
+                if size > limit:
+                    raise ValueError(f'larger than {limit} bytes')
+                f.write(block)
+        return response
+
+    def fetch(self, url, entry):
+        """Download ``url`` (revalidating ``entry``); returns True if the cache changed"""
+        key = self.key(url)
+        temp_dir = os.path.join(self.folder, f"{key}.{os.getpid()}.tmp")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(os.path.join(temp_dir, 'assets'))
+        try:
+            headers = {}
+            if entry and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry and entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            
+            name = os.path.basename(urlsplit(url).path)
+            page_path = os.path.join(temp_dir, 'page')
+            response = self._download(url, page_path, headers)
+            if response is None:
+                with self.lock:
+                    entry['fetched_at'] = time.time()
+                    self._write_manifest(entry)
+                return False
+            
+            new_entry = {
+                'key': key,
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+                'last_used': time.time()
+            }
+            if response.headers.get_content_type() == 'text/html':
+                new_entry['file'] = 'index.html'
+                self._localize_page(url, page_path, os.path.join(temp_dir, 'index.html'),
+                                    response.headers.get_content_charset() or 'utf-8', key)
+                os.remove(page_path)
+            else:
+                new_entry['file'] = secure_filename(name) or 'content'
+                os.replace(page_path, os.path.join(temp_dir, new_entry['file']))
+            new_entry['size'] = sum(
+                os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(temp_dir) for f in files)
+            
+            with open(os.path.join(temp_dir, self.MANIFEST), 'w') as f:
+                json.dump(new_entry, f)
+            
+            # Swap the new copy in; the old one stays complete until the rename
+            final_dir = os.path.join(self.folder, key)
+            old_dir = f"{final_dir}.{os.getpid()}.old"
+            with self.lock:
+                if os.path.isdir(final_dir):
+                    os.rename(final_dir, old_dir)
+                os.rename(temp_dir, final_dir)
+                self.entries[key] = new_entry
+            shutil.rmtree(old_dir, ignore_errors=True)
+            return True
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _localize_page(self, url, source_path, page_path, charset, key):
+        """Fetch a page's static assets and point the page at the local copies"""
+        with open(source_path, 'rb') as f:
+            data = f.read()
+        try:
+            text = data.decode(charset, errors='replace')
+        except LookupError:
+            charset = 'utf-8'
+            text = data.decode(charset, errors='replace')
+        collector = AssetCollector()
+        collector.feed(text)
+        
+        budget = PREFETCH_MAX_FILE
+        replacements = {}
+        for reference in dict.fromkeys(collector.assets[:PREFETCH_MAX_ASSETS]):
+            asset_url = urljoin(url, reference)
+            if not asset_url.startswith(('http://', 'https://')):
+                continue
+            extension = secure_filename(os.path.splitext(urlsplit(asset_url).path)[1][1:10])
+            name = hashlib.sha256(asset_url.encode()).hexdigest()[:16] + (f'.{extension}' if extension else '')
+            asset_path = os.path.join(os.path.dirname(page_path), 'assets', name)
+            try:
+                self._download(asset_url, asset_path, limit=budget)
+            except (OSError, ValueError, urllib.error.URLError):
+                continue  # The page falls back to the live asset
+            budget -= os.path.getsize(asset_path)
+            replacements[reference] = f"{PREFETCH_URL_PREFIX}/{key}/assets/{name}"
+        
+        for reference, local in replacements.items():
+            for quoted in {reference, html.escape(reference)}:
+                text = text.replace(f'"{quoted}"', f'"{local}"').replace(f"'{quoted}'", f"'{local}'")
+        
+        # Anything not cached (links, fonts, API calls) still resolves against the origin
+        base = f'<base href="{html.escape(url)}">'
+        head = text.lower().find('<head')
+        if head != -1 and text.find('>', head) != -1:
+            insert_at = text.find('>', head) + 1
+            text = text[:insert_at] + base + text[insert_at:]
+        else:
+            text = base + text
+        with open(page_path, 'w', encoding=charset, errors='xmlcharrefreplace') as f:
+            f.write(text)
+
+    def _write_manifest(self, entry):
+        path = os.path.join(self.folder, entry['key'], self.MANIFEST)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(entry, f)
+        os.replace(path + '.tmp', path)
+
+    def evict(self, pinned):
+        """Drop least recently scheduled copies until the cache fits; returns True if any went"""
+        with self.lock:
+            total = sum(entry['size'] for entry in self.entries.values())
+            victims = []
+            for entry in sorted(self.entries.values(), key=lambda e: e['last_used']):
+                if total <= PREFETCH_CACHE_SIZE:
+                    break
+                if entry['key'] in pinned:
+                    continue
+                total -= entry['size']
+                victims.append(entry['key'])
+                del self.entries[entry['key']]
+        for key in victims:
+            shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+        return bool(victims)
+
+content_prefetcher = ContentPrefetcher(PREFETCH_FOLDER)
+
+# Content file validators
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def save_upload(file, file_path):
+    """Stream an uploaded file to disk, hashing it on the way; returns its SHA-256"""
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    written = 0
+    with open(file_path, 'wb') as f:
+        for block in iter(lambda: file.stream.read(1024 * 1024), b''):
+            digest.update(block)
+            f.write(block)
+            written += len(block)
+    metrics.inc('kiosk_upload_bytes_total', written, ('form',))
+    metrics.observe('kiosk_upload_duration_seconds', time.perf_counter() - started, ('form',))
+    return digest.hexdigest()
+
+_file_validators = None
+
+def get_file_validators():
+    """Map of file path to (etag, size, mtime_ns) for files stored with content rows"""
+    global _file_validators
+    if _file_validators is None:
+        conn = get_db_connection()
+        rows = conn.execute('''
+            SELECT file_path, etag, file_size, file_mtime_ns FROM content
+            WHERE file_path IS NOT NULL AND etag IS NOT NULL
+        ''').fetchall()
+        conn.close()
+        _file_validators = {row['file_path']: (row['etag'], row['file_size'], row['file_mtime_ns']) for row in rows}
+    return _file_validators
+
+def content_file_etag(path, stat):
+    """Strong ETag stored for a file, or a weak one if the file changed behind our back"""
+    stored = get_file_validators().get(path)
+    if stored and stored[1:] == (stat.st_size, stat.st_mtime_ns):
+        return stored[0], False
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}", True
+
+# Content-defined chunking
+def chunk_boundary(data, start, end):
+    """End of the chunk starting at ``start`` in ``data[:end]``.
+
+    Cut points are tried just after zero bytes and taken where the CRC-32 of
+    the preceding 32 bytes is a multiple of SYNC_CHUNK_DIVISOR, so they
+    depend only on nearby bytes: an edit moves the boundaries around it
+    and leaves the rest of the file's chunks unchanged.
+    """
+    limit = min(end, start + SYNC_CHUNK_MAX)
+    if limit - start <= SYNC_CHUNK_MIN:
+        return limit
+    pos = start + SYNC_CHUNK_MIN
+    while True:
+        pos = data.find(b'\x00', pos, limit)
+        if pos < 0:
+            return limit
+        pos += 1
+        if zlib.crc32(data[pos - 32:pos]) % SYNC_CHUNK_DIVISOR == 0:
+            return pos
+
+def file_chunks(path):
+    """Read a file once; returns (sha256, [[offset, length, sha256], ...]) of its chunks"""
+    digest = hashlib.sha256()
+    chunks = []
+    offset = 0
+    with open(path, 'rb') as f:
+        data, pos, eof = b'', 0, False
+        while True:
+            if not eof and len(data) - pos < SYNC_CHUNK_MAX:
+                block = f.read(4 * SYNC_CHUNK_MAX)
+                eof = not block
+                data, pos = data[pos:] + block, 0
+                continue
+            if pos == len(data):
+                break
+            end = chunk_boundary(data, pos, len(data))
+            chunk = memoryview(data)[pos:end]
+            digest.update(chunk)
+            chunks.append([offset, end - pos, hashlib.sha256(chunk).hexdigest()])
+            offset += end - pos
+            pos = end
+    return digest.hexdigest(), chunks
+
+def write_chunk_manifest(file_path, manifest_folder):
+    """Chunk a file and store its manifest under its SHA-256; returns the SHA-256"""
+    etag, chunks = file_chunks(file_path)
+    manifest_path = os.path.join(manifest_folder, f"{etag}.json")
+    if not os.path.exists(manifest_path):
+        os.makedirs(manifest_folder, exist_ok=True)
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(chunks, f, separators=(',', ':'))
+        os.replace(temp_path, manifest_path)
+    return etag
+
+_chunk_manifests = {}
+
+def load_chunk_manifest(etag):
+    """Chunk list stored for a file's SHA-256, or None if it was never chunked"""
+    if etag not in _chunk_manifests:
+        try:
+            with open(os.path.join(MANIFEST_FOLDER, f"{etag}.json")) as f:
+                _chunk_manifests[etag] = json.load(f)
+        except FileNotFoundError:
+            return None
+    return _chunk_manifests[etag]
+
+# Media processing
+MEDIA_SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x1aE\xdf\xa3', 'video/webm'),
+    (0, b'OggS', 'application/ogg'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (4, b'ftypqt', 'video/quicktime'),
+    (4, b'ftyp', 'video/mp4'),
+]
+
+def sniff_mime_type(path):
+    """MIME type from the file's leading bytes, falling back to its extension"""
+    with open(path, 'rb') as f:
+        head = f.read(64)
+    if head[:4] == b'RIFF' and head[8:12] in (b'WEBP', b'AVI ', b'WAVE'):
+        return {b'WEBP': 'image/webp', b'AVI ': 'video/x-msvideo', b'WAVE': 'audio/wav'}[head[8:12]]
+    for offset, magic, mime_type in MEDIA_SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return mime_type
+    if head.lstrip().lower().startswith((b'<!doctype html', b'<html')):
+        return 'text/html'
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+def process_media(file_path, thumbnail_folder, manifest_folder):
+    """Inspect one uploaded file. Runs in a worker process, so it touches no shared state.
+
+    The file is hashed and chunked for sync-content in the same pass. Duration, resolution and thumbnails need ffprobe/ffmpeg on the PATH and
+    are left empty without them.
+    """
+    stat = os.stat(file_path)
+    result = {
+        'etag': write_chunk_manifest(file_path, manifest_folder),
+        'file_size': stat.st_size,
+        'file_mtime_ns': stat.st_mtime_ns,
+        'mime_type': sniff_mime_type(file_path),
+        'duration': None,
+        'width': None,
+        'height': None,
+        'thumbnail_path': None
+    }
+    if not result['mime_type'].startswith(('video/', 'image/', 'audio/')) or not shutil.which('ffprobe'):
+        return result
+    
+    probe = subprocess.run(['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams',
+                            file_path], capture_output=True, timeout=MEDIA_JOB_TIMEOUT)
+    if probe.returncode == 0:
+        info = json.loads(probe.stdout or b'{}')
+        duration = info.get('format', {}).get('duration')
+        result['duration'] = float(duration) if duration not in (None, 'N/A') else None
+        video = next((st for st in info.get('streams', []) if st.get('codec_type') == 'video'), None)
+        if video:
+            result['width'], result['height'] = video.get('width'), video.get('height')
+    
+    if result['width'] and shutil.which('ffmpeg'):
+        thumbnail_path = os.path.join(thumbnail_folder, f"{result['etag']}.jpg")
+        if not os.path.exists(thumbnail_path):
+            os.makedirs(thumbnail_folder, exist_ok=True)
+            temp_path = f"{thumbnail_path}.{os.getpid()}.tmp.jpg"
+            # One second in skips black lead-in frames; stills have no second frame
+            seek = ['-ss', '1'] if (result['duration'] or 0) > 2 else []
+            subprocess.run(['ffmpeg', '-v', 'error', '-y', *seek, '-i', file_path, '-frames:v', '1',
+                            '-vf', f'scale={THUMBNAIL_WIDTH}:-2', temp_path],
+                           capture_output=True, timeout=MEDIA_JOB_TIMEOUT)
+            if os.path.exists(temp_path):
+                os.replace(temp_path, thumbnail_path)
+        if os.path.exists(thumbnail_path):
+            result['thumbnail_path'] = thumbnail_path
+    return result
+
+class MediaWorkerPool:
+    """Runs process_media for new uploads in a pool of worker processes.
+
+    Jobs are recorded in media_jobs first, so ones interrupted by a restart
+    are picked up again by resume(). Workers are spawned rather
+    than forked, since the admin panel is multi-threaded. If a worker dies
+    (killed, out of memory), the pool is replaced and the jobs it held fail.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def _replace_executor(self, broken):
+        """Drop a pool whose workers died; the next job starts a fresh one"""
+        with self.lock:
+            if self.executor is broken:
+                self.executor = None
+        broken.shutdown(wait=False)
+
+    def resume(self):
+        """Resubmit jobs left queued or running by a previous run (leader worker only)"""
+        conn = get_db_connection()
+        jobs = conn.execute("SELECT id, file_path FROM media_jobs WHERE status IN ('queued', 'running')").fetchall()
+        conn.close()
+        for job in jobs:
+            self._submit(job['id'], job['file_path'])
+
+    def enqueue(self, content_id, file_path):
+        """Record a job for ``file_path`` and hand it to a worker; returns the job id"""
+        conn = get_db_connection()
+        with conn:
+            cursor = conn.execute('INSERT INTO media_jobs (content_id, file_path) VALUES (?, ?)',
+                                  (content_id, file_path))
+            conn.execute("UPDATE content SET media_status = 'pending' WHERE file_path = ?", (file_path,))
+        conn.close()
+        self._submit(cursor.lastrowid, file_path)
+        return cursor.lastrowid
+
+    def _submit(self, job_id, file_path):
+        for _ in range(2):
+            executor = self._get_executor()
+            try:
+                future = executor.submit(process_media, file_path, THUMBNAIL_FOLDER, MANIFEST_FOLDER)
+                break
+            except concurrent.futures.process.BrokenProcessPool as e:
+                self._replace_executor(executor)
+                future = concurrent.futures.Future()  # Fails the job if the new pool breaks too
+                future.set_exception(e)
+        conn = get_db_connection()
+        with conn:
+            conn.execute("UPDATE media_jobs SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         (job_id,))
+        conn.close()
+        future.add_done_callback(lambda done: self._finish(job_id, file_path, done, executor))
+
+    def _finish(self, job_id, file_path, future, executor):
+        try:
+            result = future.result()
+        except Exception as e:
+            result, error = None, f'{type(e).__name__}: {e}'
+            if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+                self._replace_executor(executor)
+        else:
+            error = None
+        
+        conn = get_db_connection()
+        try:
+            with conn:
+                if result is None:
+                    conn.execute("UPDATE content SET media_status = 'failed' WHERE file_path = ?", (file_path,))
+                else:
+                    conn.execute('''
+                        UPDATE content
+                        SET etag = ?, file_size = ?, file_mtime_ns = ?, mime_type = ?, duration = ?,
+                            width = ?, height = ?, thumbnail_path = ?, media_status = 'ready'
+                        WHERE file_path = ?
+                    ''', (result['etag'], result['file_size'], result['file_mtime_ns'], result['mime_type'],
+                          result['duration'], result['width'], result['height'], result['thumbnail_path'],
+                          file_path))
+                conn.execute('''
+                    UPDATE media_jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?
+                ''', ('failed' if error else 'done', error, job_id))
+        finally:
+            conn.close()
+        if result is not None:
+            get_file_validators()[file_path] = (result['etag'], result['file_size'], result['file_mtime_ns'])
+
+media_pool = MediaWorkerPool(MEDIA_WORKERS)
+
+@app.before_request
+def start_background_services():
+    """Watch for other workers' edits; start the stream, prefetcher and media recovery in one of them"""
+    schedule_changes.watch(reload_shared_state)
+    if leader_lock.file is None and leader_lock.acquire():
+        content_stream.start()
+        content_prefetcher.start()
+        media_pool.resume()
+
+def save_content(conn, content_id, name, content_type, url, file_path, is_default, is_offline, etag=None):
+    """Insert (content_id None) or update a content row, then refresh derived state"""
+    # If setting as default, clear other defaults
+    if is_default:
+        conn.execute('UPDATE content SET is_default = 0 WHERE is_default = 1 AND id != ?', (content_id or 0,))
+    
+    if content_id is None:
+        cursor = conn.execute('''
+            INSERT INTO content (name, type, url, file_path, is_default, is_offline)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, content_type, url, file_path, is_default, is_offline))
+        content_id = cursor.lastrowid
+    else:
+        conn.execute('''
+            UPDATE content 
+            SET name = ?, type = ?, url = ?, file_path = ?, is_default = ?, is_offline = ?
+            WHERE id = ?
+        ''', (name, content_type, url, file_path, is_default, is_offline, content_id))
+    
+    # A new file replaces the bytes behind every row that points at it
+    if etag:
+        stat = os.stat(file_path)
+        conn.execute('UPDATE content SET etag = ?, file_size = ?, file_mtime_ns = ? WHERE file_path = ?',
+                     (etag, stat.st_size, stat.st_mtime_ns, file_path))
+        get_file_validators()[file_path] = (etag, stat.st_size, stat.st_mtime_ns)
+    
+    conn.commit()
+    rebuild_schedule_index()
+    
+    # If this is the default or offline content, update config
+    if is_default or is_offline:
+        main_url, offline_url = get_config_urls()
+        
+        if is_default:
+            main_url = url
+        if is_offline:
+            offline_url = url
+            
+        update_config_file(main_url, offline_url)
+    
+    # Probe the new file off the request path; the content is live without it
+    if etag:
+        try:
+            media_pool.enqueue(content_id, file_path)
+        except (OSError, RuntimeError, sqlite3.Error) as e:
+            app.logger.error('Could not queue media processing for %s: %s', file_path, e)
+    
+    return content_id
+
+_config_changed = threading.Condition()
+_config_waiters = threading.BoundedSemaphore(CONFIG_WAITERS_MAX)  # Keeps request threads free for the admin UI
+
+def update_config_file(main_url, offline_url):
+    """Publish new URLs to the kiosk config file.
+
+    The file is written under a new name and renamed over the old one, so
+    the launcher never sources a half-written file, and every publish
+    bumps config_version.
+    """
+    with open(CONFIG_FILE + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # Serializes publishers across processes
+        version = read_config()['version'] + 1
+        temp_path = f"{CONFIG_FILE}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(f'main_page="{main_url}"\n')
+            f.write(f'offline_video_page="{offline_url}"\n')
+            f.write(f'config_version={version}\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, CONFIG_FILE)
+    
+    with _config_changed:
+        _config_changed.notify_all()
+    return version
+
+EMPTY_CONFIG = {'version': 0, 'main_page': "", 'offline_video_page': ""}
+_config_state = (None, EMPTY_CONFIG)
+
+def read_config():
+    """Parse the kiosk config file, re-reading it only after it changes"""
+    global _config_state
+    try:
+        stat = os.stat(CONFIG_FILE)
+    except FileNotFoundError:
+        return EMPTY_CONFIG
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _config_state[0] == signature:
+        return _config_state[1]
+    
+    config = dict(EMPTY_CONFIG)
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            for line in f:
+                if line.startswith('main_page='):
+                    config['main_page'] = line.strip().split('=', 1)[1].strip('"')
+                elif line.startswith('offline_video_page='):
+                    config['offline_video_page'] = line.strip().split('=', 1)[1].strip('"')
+                elif line.startswith('config_version='):
+                    try:
+                        config['version'] = int(line.strip().split('=', 1)[1].strip('"'))
+                    except ValueError:
+                        pass
+    except FileNotFoundError:
+        pass
+    
+    _config_state = (signature, config)
+    return config
+
+def get_config_urls():
+    """Read current URLs from config file"""
+    config = read_config()
+    return config['main_page'], config['offline_video_page']
+
+# Routes
+@app.route('/')
+def index():
+    if 'user_id' in session:
+        return redirect(url_for('dashboard'))
+    return redirect(url_for('login'))
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        password_hash = hashlib.sha256(password.encode()).hexdigest()
+        
+        conn = get_db_connection()
+        user = conn.execute('SELECT * FROM users WHERE username = ? AND password_hash = ?', 
+                          (username, password_hash)).fetchone()
+        conn.close()
+        
+        if user:
+            session['user_id'] = user['id']
+            session['username'] = user['username']
+            return redirect(url_for('dashboard'))
+        
+        flash('Invalid username or password')
+    
+    return render_template('login.html')
+
+@app.route('/logout')
+def logout():
+    session.clear()
+    return redirect(url_for('login'))
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    # The content and schedule tables load page by page from /api/content and /api/schedule
+    main_url, offline_url = get_config_urls()
+    current_content = get_current_content()
+    
+    return render_template('dashboard.html', 
+                           main_url=main_url,
+                           offline_url=offline_url,
+                           current_content=current_content,
+                           day_names=DAY_NAMES,
+                           page_size=API_PAGE_SIZE)
+
+@app.route('/content/add', methods=['GET', 'POST'])
+@login_required
+def add_content():
+    if request.method == 'POST':
+        name = request.form['name']
+        content_type = request.form['type']
+        url = request.form['url']
+        is_default = 1 if 'is_default' in request.form else 0
+        is_offline = 1 if 'is_offline' in request.form else 0
+        file_path = None
+        etag = None
+        
+        # Handle file upload
+        if 'file' in request.files and request.files['file'].filename:
+            file = request.files['file']
+            filename = secure_filename(file.filename)
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            etag = save_upload(file, file_path)
+            
+            # If it's a local file, update the URL to point to it
+            if content_type == 'local':
+                url = f"file://{file_path}"
+        
+        conn = get_db_connection()
+        save_content(conn, None, name, content_type, url, file_path, is_default, is_offline, etag)
+        conn.close()
+        
+        flash('Content added successfully')
+        return redirect(url_for('dashboard'))
+    
+    return render_template('add_content.html', chunk_size=CHUNK_SIZE,
+                           chunked_upload_threshold=CHUNKED_UPLOAD_THRESHOLD)
+
+@app.route('/content/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_content(id):
+    conn = get_db_connection()
+    content = conn.execute('SELECT * FROM content WHERE id = ?', (id,)).fetchone()
+    
+    if not content:
+        conn.close()
+        flash('Content not found')
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        name = request.form['name']
+        content_type = request.form['type']
+        url = request.form['url']
+        is_default = 1 if 'is_default' in request.form else 0
+        is_offline = 1 if 'is_offline' in request.form else 0
+        file_path = content['file_path']
+        etag = None
+        
+        # Handle file upload
+        if 'file' in request.files and request.files['file'].filename:
+            file = request.files['file']
+            filename = secure_filename(file.filename)
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            etag = save_upload(file, file_path)
+            
+            # If it's a local file, update the URL to point to it
+            if content_type == 'local':
+                url = f"file://{file_path}"
+        
+        save_content(conn, id, name, content_type, url, file_path, is_default, is_offline, etag)
+        conn.close()
+        
+        flash('Content updated successfully')
+        return redirect(url_for('dashboard'))
+    
+    conn.close()
+    return render_template('edit_content.html', content=content)
+
+@app.route('/content/delete/<int:id>', methods=['POST'])
+@login_required
+def delete_content(id):
+    conn = get_db_connection()
+    
+    # Get content info
+    content = conn.execute('SELECT * FROM content WHERE id = ?', (id,)).fetchone()
+    
+    if not content:
+        conn.close()
+        flash('Content not found')
+        return redirect(url_for('dashboard'))
+    
+    # Delete related schedules
+    conn.execute('DELETE FROM schedule WHERE content_id = ?', (id,))
+    
+    # Delete the content
+    conn.execute('DELETE FROM content WHERE id = ?', (id,))
+    
+    # If this was default or offline content, we need to update config
+    if content['is_default'] or content['is_offline']:
+        # Find new defaults
+        new_default = conn.execute('SELECT url FROM content WHERE is_default = 1 LIMIT 1').fetchone()
+        new_offline = conn.execute('SELECT url FROM content WHERE is_offline = 1 LIMIT 1').fetchone()
+        
+        main_url = new_default['url'] if new_default else ""
+        offline_url = new_offline['url'] if new_offline else ""
+        
+        update_config_file(main_url, offline_url)
+    
+    conn.commit()
+    rebuild_schedule_index()
+    conn.close()
+    
+    flash('Content deleted successfully')
+    return redirect(url_for('dashboard'))
+
+@app.route('/schedule/add', methods=['GET', 'POST'])
+@login_required
+def add_schedule():
+    if request.method == 'POST':
+        content_id = request.form['content_id']
+        day_of_week = request.form['day_of_week']
+        start_time = request.form['start_time']
+        end_time = request.form['end_time']
+        priority = request.form['priority']
+        group_id = request.form.get('group_id') or None  # Empty means every kiosk
+        
+        day_mask, start_minute, end_minute = schedule_columns(day_of_week, start_time, end_time)
+        
+        conn = get_db_connection()
+        conn.execute('''
+            INSERT INTO schedule (content_id, day_of_week, start_time, end_time, priority,
+                                  day_mask, start_minute, end_minute, group_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (content_id, day_of_week, start_time, end_time, priority,
+              day_mask, start_minute, end_minute, group_id))
+        
+        conn.commit()
+        rebuild_schedule_index()
+        conn.close()
+        
+        flash('Schedule added successfully')
+        return redirect(url_for('dashboard'))
+    
+    conn = get_db_connection()
+    content_list = conn.execute('SELECT id, name FROM content').fetchall()
+    group_list = conn.execute('SELECT id, name FROM kiosk_groups ORDER BY name').fetchall()
+    conn.close()
+    
+    return render_template('add_schedule.html', content_list=content_list, group_list=group_list)
+
+@app.route('/schedule/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_schedule(id):
+    conn = get_db_connection()
+    schedule = conn.execute('SELECT * FROM schedule WHERE id = ?', (id,)).fetchone()
+    
+    if not schedule:
+        conn.close()
+        flash('Schedule not found')
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        content_id = request.form['content_id']
+        day_of_week = request.form['day_of_week']
+        start_time = request.form['start_time']
+        end_time = request.form['end_time']
+        priority = request.form['priority']
+        group_id = request.form.get('group_id', schedule['group_id']) or None
+        
+        day_mask, start_minute, end_minute = schedule_columns(day_of_week, start_time, end_time)
+        
+        conn.execute('''
+            UPDATE schedule 
+            SET content_id = ?, day_of_week = ?, start_time = ?, end_time = ?, priority = ?,
+                day_mask = ?, start_minute = ?, end_minute = ?, group_id = ?
+            WHERE id = ?
+        ''', (content_id, day_of_week, start_time, end_time, priority,
+              day_mask, start_minute, end_minute, group_id, id))
+        
+        conn.commit()
+        rebuild_schedule_index()
+        conn.close()
+        
+        flash('Schedule updated successfully')
+        return redirect(url_for('dashboard'))
+    
+    content_list = conn.execute('SELECT id, name FROM content').fetchall()
+    group_list = conn.execute('SELECT id, name FROM kiosk_groups ORDER BY name').fetchall()
+    conn.close()
+    
+    return render_template('edit_schedule.html', schedule=schedule, content_list=content_list,
+                           group_list=group_list)
+
+@app.route('/schedule/delete/<int:id>', methods=['POST'])
+@login_required
+def delete_schedule(id):
+    conn = get_db_connection()
+    conn.execute('DELETE FROM schedule WHERE id = ?', (id,))
+    conn.commit()
+    rebuild_schedule_index()
+    conn.close()
+    
+    flash('Schedule deleted successfully')
+    return redirect(url_for('dashboard'))
+
+@app.route('/settings', methods=['GET', 'POST'])
+@login_required
+def settings():
+    if request.method == 'POST':
+        current_password = request.form['current_password']
+        new_password = request.form['new_password']
+        confirm_password = request.form['confirm_password']
+        
+        if new_password != confirm_password:
+            flash('New passwords do not match')
+            return redirect(url_for('settings'))
+        
+        current_hash = hashlib.sha256(current_password.encode()).hexdigest()
+        
+        conn = get_db_connection()
+        user = conn.execute('SELECT * FROM users WHERE id = ? AND password_hash = ?', 
+                          (session['user_id'], current_hash)).fetchone()
+        
+        if not user:
+            conn.close()
+            flash('Current password is incorrect')
+            return redirect(url_for('settings'))
+        
+        new_hash = hashlib.sha256(new_password.encode()).hexdigest()
+        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', 
+                   (new_hash, session['user_id']))
+        
+        conn.commit()
+        conn.close()
+        
+        flash('Password updated successfully')
+        return redirect(url_for('settings'))
+    
+    return render_template('settings.html')
+
+# API endpoints
+@app.route('/api/current-content', methods=['GET'])
+def api_current_content():
+    """API endpoint to get current content based on schedule"""
+    started = time.perf_counter()
+    index = get_schedule_index(request.args.get('kiosk'))
+    body, etag = index.current_response(datetime.now())
+    metrics.observe('kiosk_schedule_resolve_duration_seconds', time.perf_counter() - started)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Always revalidate: an admin edit can change the answer before valid_until
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def build_timeline(kiosk_id=None, days=TIMELINE_DAYS, start=None):
+    """Precompiled playback timeline for a kiosk, as a JSON-serializable dict"""
+    start = start or datetime.now()
+    transitions = get_schedule_index(kiosk_id).timeline(start, days)
+    return {
+        'kiosk': kiosk_id,
+        'generated_at': start.replace(microsecond=0).isoformat(),
+        'until': (transitions[0][0] + timedelta(days=days)).isoformat(),
+        'transitions': [
+            {'at': when.isoformat(), 'epoch': int(when.timestamp()), 'content': content}
+            for when, content in transitions
+        ]
+    }
+
+def timeline_tsv(timeline):
+    """One 'epoch<TAB>is_offline<TAB>url' line per transition, for shell scripts"""
+    lines = [f"{t['epoch']}\t{t['content']['is_offline']}\t{t['content']['url']}" for t in timeline['transitions']]
+    return '\n'.join(lines) + '\n'
+
+@app.route('/api/timeline', methods=['GET'])
+def api_timeline():
+    """Upcoming content transitions, so a kiosk can switch on time without polling"""
+    days = request.args.get('days', TIMELINE_DAYS, type=int)
+    if not 1 <= days <= TIMELINE_MAX_DAYS:
+        return jsonify({'error': f'days must be between 1 and {TIMELINE_MAX_DAYS}'}), 400
+    
+    timeline = build_timeline(request.args.get('kiosk'), days)
+    if request.args.get('format') == 'tsv':
+        response = app.response_class(timeline_tsv(timeline), mimetype='text/tab-separated-values')
+    else:
+        response = jsonify(timeline)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/current-content/batch', methods=['GET', 'POST'])
+def api_current_content_batch():
+    """Current content for many kiosks in one call, resolved once per kiosk group"""
+    if request.method == 'POST':
+        kiosk_ids = (request.get_json(silent=True) or {}).get('kiosks') or []
+    else:
+        kiosk_ids = request.args.getlist('kiosk')
+    
+    started = time.perf_counter()
+    now = datetime.now()
+    bodies = {}
+    parts = []
+    for kiosk_id in dict.fromkeys(str(k) for k in kiosk_ids):
+        index = get_schedule_index(kiosk_id)
+        if index not in bodies:
+            bodies[index] = index.current_response(now)[0]
+        # Splice the cached per-group bodies instead of re-serializing per kiosk
+        parts.append(json.dumps(kiosk_id).encode() + b':' + bodies[index])
+    
+    body = b'{"kiosks":{' + b','.join(parts) + b'}}'
+    metrics.observe('kiosk_schedule_resolve_duration_seconds', time.perf_counter() - started)
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/current-content/stream', methods=['GET'])
+def api_current_content_stream():
+    """Send kiosks to the content change stream (served by the leader worker)"""
+    host = urlsplit(request.host_url).hostname
+    if ':' in host:
+        host = f"[{host}]"
+    query = f"?{request.query_string.decode()}" if request.query_string else ''
+    return redirect(f"http://{host}:{STREAM_PORT}{ContentStream.PATH}{query}", code=307)
+
+@app.route('/api/config', methods=['GET'])
+def api_config():
+    """Current kiosk config. With ?since=<version>, waits briefly for a newer one.
+
+    Returns at once when the version differs from ``since``; otherwise holds
+    the request for up to ?wait= seconds and answers 304 if nothing changed.
+    Each held request ties up a request thread, so once CONFIG_WAITERS_MAX
+    are waiting, further ones get a 503 telling them when to come back.
+    """
+    config = read_config()
+    since = request.args.get('since', type=int)
+    changed = since is None or config['version'] != since
+    if not changed:
+        if not _config_waiters.acquire(blocking=False):
+            response = jsonify({'error': 'Too many config long-polls waiting', 'version': config['version']})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(CONFIG_RETRY_AFTER)
+            return response
+        try:
+            wait = max(0, min(request.args.get('wait', 20, type=float), CONFIG_WAIT_MAX))
+            deadline = time.monotonic() + wait
+            while not changed and time.monotonic() < deadline:
+                # Publishes from this process wake us at once; the 1s timeout
+                # also notices files replaced by another process or by hand
+                with _config_changed:
+                    _config_changed.wait(min(deadline - time.monotonic(), 1.0))
+                current = read_config()
+                changed = current is not config
+                config = current
+        finally:
+            _config_waiters.release()
+    
+    response = jsonify(config) if changed else app.response_class(status=304)
+    etag = f"config-{config['version']}"
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Catalog API
+def page_limit():
+    """The ?limit= of a paginated request, clamped to the allowed range"""
+    limit = request.args.get('limit', API_PAGE_SIZE, type=int)
+    return max(1, min(limit, API_MAX_PAGE_SIZE))
+
+def flag_filter(name):
+    """Map a ?name=0/1/true/false filter to 0, 1 or None (not filtered)"""
+    value = request.args.get(name, '').lower()
+    if value in ('1', 'true', 'yes'):
+        return 1
+    if value in ('0', 'false', 'no'):
+        return 0
+    return None
+
+@app.route('/api/content', methods=['GET'])
+@login_required
+def api_content():
+    """Content, newest first, one keyset page at a time.
+
+    Filters: type, is_default, is_offline, q (name contains). Pass the
+    returned ``next`` value as ?after= to get the following page.
+    """
+    limit = page_limit()
+    conditions = []
+    params = []
+    
+    after = request.args.get('after', type=int)
+    if after is not None:
+        conditions.append('id < ?')
+        params.append(after)
+    if request.args.get('type'):
+        conditions.append('type = ?')
+        params.append(request.args['type'])
+    for flag in ('is_default', 'is_offline'):
+        value = flag_filter(flag)
+        if value is not None:
+            conditions.append(f'{flag} = ?')
+            params.append(value)
+    if request.args.get('q'):
+        conditions.append("name LIKE ? ESCAPE '\\'")
+        params.append('%' + request.args['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = get_db_connection()
+    rows = conn.execute(f'''
+        SELECT id, name, type, url, file_path, is_default, is_offline, created_at
+        FROM content {where}
+        ORDER BY id DESC
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    conn.close()
+    
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = items[-1]['id'] if len(rows) > limit else None
+    return jsonify({'items': items, 'next': next_cursor})
+
+@app.route('/api/schedule', methods=['GET'])
+@login_required
+def api_schedule():
+    """Schedule slots by priority, one keyset page at a time.
+
+    Filters: day (weekday name), content_id, group_id. Pass the returned
+    ``next`` value as ?after= to get the following page.
+    """
+    limit = page_limit()
+    conditions = []
+    params = []
+    
+    after = request.args.get('after')
+    if after:
+        try:
+            priority, last_id = (int(part) for part in after.split(':'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        conditions.append('(s.priority < ? OR (s.priority = ? AND s.id > ?))')
+        params += [priority, priority, last_id]
+    if request.args.get('day'):
+        day_mask = schedule_columns(request.args['day'], None, None)[0]
+        if not day_mask:
+            return jsonify({'error': 'Unknown day'}), 400
+        conditions.append('s.day_mask & ?')
+        params.append(day_mask)
+    for column in ('content_id', 'group_id'):
+        value = request.args.get(column, type=int)
+        if value is not None:
+            conditions.append(f's.{column} = ?')
+            params.append(value)
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = get_db_connection()
+    rows = conn.execute(f'''
+        SELECT s.id, s.content_id, s.day_of_week, s.start_time, s.end_time, s.priority,
+               s.group_id, c.name AS content_name, g.name AS group_name
+        FROM schedule s
+        JOIN content c ON s.content_id = c.id
+        LEFT JOIN kiosk_groups g ON s.group_id = g.id
+        {where}
+        ORDER BY s.priority DESC, s.id
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    conn.close()
+    
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = f"{items[-1]['priority']}:{items[-1]['id']}" if len(rows) > limit else None
+    return jsonify({'items': items, 'next': next_cursor})
+
+# Bulk import/export
+CONTENT_TYPES = ('url', 'local', 'html')
+CONTENT_EXPORT_COLUMNS = ['id', 'name', 'type', 'url', 'file_path', 'is_default', 'is_offline']
+SCHEDULE_EXPORT_COLUMNS = ['id', 'content_id', 'day_of_week', 'start_time', 'end_time', 'priority', 'group_id']
+
+def export_catalog(tables=('content', 'schedule')):
+    """Content and schedule rows in the shape import_catalog() accepts"""
+    conn = get_db_connection()
+    data = {}
+    if 'content' in tables:
+        rows = conn.execute(f"SELECT {', '.join(CONTENT_EXPORT_COLUMNS)} FROM content ORDER BY id").fetchall()
+        data['content'] = [dict(row) for row in rows]
+    if 'schedule' in tables:
+        rows = conn.execute(f"SELECT {', '.join(SCHEDULE_EXPORT_COLUMNS)} FROM schedule ORDER BY id").fetchall()
+        data['schedule'] = [dict(row) for row in rows]
+    conn.close()
+    return data
+
+def parse_flag(value):
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ('', '0', 'false', 'no'):
+            return 0
+        if value in ('1', 'true', 'yes'):
+            return 1
+        raise ValueError(f'expected 0/1, got {value!r}')
+    return 1 if value else 0
+
+def parse_optional_int(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return int(value)
+
+def import_catalog(data, replace=False):
+    """Validate and apply a bulk import; returns (counts, errors).
+
+    ``data`` has optional "content" and "schedule" lists. A content row's id
+    is only a reference for schedule rows in the same import (kept as the
+    real id when replacing); schedule rows may also name existing content.
+    Nothing is written unless every row is valid.
+    """
+    content_in = data.get('content') or []
+    schedule_in = data.get('schedule') or []
+    if not isinstance(content_in, list) or not isinstance(schedule_in, list):
+        return None, ['"content" and "schedule" must be lists']
+    
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        errors = []
+        
+        # Validate content and assign ids up front so executemany can insert them
+        next_id = 1 if replace else conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM content').fetchone()[0]
+        references = {}
+        seen_references = set()
+        content_rows = []
+        defaults = 0
+        for number, row in enumerate(content_in, 1):
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError('must be an object')
+                name = str(row.get('name') or '').strip()
+                content_type = str(row.get('type') or 'url').strip()
+                url = str(row.get('url') or '').strip()
+                if not name or not url:
+                    raise ValueError('name and url are required')
+                if content_type not in CONTENT_TYPES:
+                    raise ValueError(f"type must be one of {', '.join(CONTENT_TYPES)}")
+                is_default = parse_flag(row.get('is_default'))
+                is_offline = parse_flag(row.get('is_offline'))
+                reference = parse_optional_int(row.get('id'))
+            except (TypeError, ValueError) as e:
+                errors.append(f'content row {number}: {e}')
+                continue
+            if reference is not None and reference in seen_references:
+                errors.append(f'content row {number}: duplicate id {reference}')
+                continue
+            seen_references.add(reference)
+            defaults += is_default
+            content_rows.append([reference, name, content_type, url, row.get('file_path') or None,
+                                 is_default, is_offline])
+        if defaults > 1:
+            errors.append('only one content row can be the default')
+        
+        # When replacing, keep exported ids (so schedules still match) and number the rest after them
+        if replace:
+            next_id = max([r[0] for r in content_rows if r[0] is not None] + [0]) + 1
+        for row in content_rows:
+            if row[0] is None or not replace:
+                new_id, next_id = next_id, next_id + 1
+            else:
+                new_id = row[0]
+            if row[0] is not None:
+                references[row[0]] = new_id
+            row[0] = new_id
+        
+        existing_content = set() if replace else {r[0] for r in conn.execute('SELECT id FROM content')}
+        content_by_name = {} if replace else {r['name']: r['id'] for r in conn.execute('SELECT id, name FROM content')}
+        content_by_name.update({row[1]: row[0] for row in content_rows})
+        groups = {r[0] for r in conn.execute('SELECT id FROM kiosk_groups')}
+        
+        schedule_rows = []
+        for number, row in enumerate(schedule_in, 1):
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError('must be an object')
+                reference = parse_optional_int(row.get('content_id'))
+                if reference is not None:
+                    content_id = references.get(reference, reference if reference in existing_content else None)
+                else:
+                    content_id = content_by_name.get(str(row.get('content_name') or '').strip())
+                if content_id is None:
+                    raise ValueError('unknown content_id/content_name')
+                day_of_week = str(row.get('day_of_week') or '').strip()
+                start_time = str(row.get('start_time') or '').strip()
+                end_time = str(row.get('end_time') or '').strip()
+                day_mask, start_minute, end_minute = schedule_columns(day_of_week, start_time, end_time)
+                if not day_mask:
+                    raise ValueError(f'unknown day_of_week {day_of_week!r}')
+                if start_minute is None or end_minute is None:
+                    raise ValueError('start_time and end_time must be HH:MM')
+                priority = parse_optional_int(row.get('priority'))
+                group_id = parse_optional_int(row.get('group_id'))
+                if group_id is not None and group_id not in groups:
+                    raise ValueError(f'unknown group_id {group_id}')
+            except (TypeError, ValueError) as e:
+                errors.append(f'schedule row {number}: {e}')
+                continue
+            schedule_rows.append((content_id, day_of_week, f'{start_minute // 60:02d}:{start_minute % 60:02d}',
+                                  f'{end_minute // 60:02d}:{end_minute % 60:02d}',
+                                  1 if priority is None else priority, day_mask, start_minute, end_minute, group_id))
+        
+        if errors:
+            conn.rollback()
+            return None, errors
+        
+        if replace:
+            conn.execute('DELETE FROM schedule')
+            conn.execute('DELETE FROM content')
+        elif defaults:
+            conn.execute('UPDATE content SET is_default = 0 WHERE is_default = 1')
+        conn.executemany('''
+            INSERT INTO content (id, name, type, url, file_path, is_default, is_offline)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', content_rows)
+        conn.executemany('''
+            INSERT INTO schedule (content_id, day_of_week, start_time, end_time, priority,
+                                  day_mask, start_minute, end_minute, group_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', schedule_rows)
+        
+        new_default = conn.execute('SELECT url FROM content WHERE is_default = 1 LIMIT 1').fetchone()
+        new_offline = conn.execute('SELECT url FROM content WHERE is_offline = 1 LIMIT 1').fetchone()
+        conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+    
+    # Derived state is rebuilt once for the whole import
+    rebuild_schedule_index()
+    main_url = new_default['url'] if new_default else ""
+    offline_url = new_offline['url'] if new_offline else ""
+    if (main_url, offline_url) != get_config_urls():
+        update_config_file(main_url, offline_url)
+    return {'content': len(content_rows), 'schedule': len(schedule_rows)}, []
+
+def catalog_csv(rows, columns):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+@app.route('/api/export', methods=['GET'])
+@login_required
+def api_export():
+    """Export content and schedule as JSON, or one table as CSV (?format=csv&table=schedule)"""
+    if request.args.get('format') == 'csv':
+        table = request.args.get('table')
+        if table not in ('content', 'schedule'):
+            return jsonify({'error': 'CSV export needs ?table=content or ?table=schedule'}), 400
+        columns = CONTENT_EXPORT_COLUMNS if table == 'content' else SCHEDULE_EXPORT_COLUMNS
+        response = app.response_class(catalog_csv(export_catalog((table,))[table], columns), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={table}.csv'
+        return response
+    
+    response = jsonify(export_catalog())
+    response.headers['Content-Disposition'] = 'attachment; filename=kiosk-catalog.json'
+    return response
+
+@app.route('/api/import', methods=['POST'])
+@login_required
+def api_import():
+    """Bulk import, all or nothing.
+
+    Send JSON ({"content": [...], "schedule": [...]}) or a CSV file/body with
+    ?table=content or ?table=schedule. ?mode=replace swaps out both tables
+    instead of appending.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'errors': ['Expected a JSON object']}), 400
+    else:
+        table = request.args.get('table')
+        if table not in ('content', 'schedule'):
+            return jsonify({'errors': ['CSV import needs ?table=content or ?table=schedule']}), 400
+        upload = request.files.get('file')
+        text = (upload.read() if upload else request.get_data()).decode('utf-8-sig', errors='replace')
+        data = {table: list(csv.DictReader(io.StringIO(text)))}
+    
+    counts, errors = import_catalog(data, replace=request.args.get('mode') == 'replace')
+    if errors:
+        return jsonify({'errors': errors[:100], 'error_count': len(errors)}), 400
+    return jsonify({'imported': counts})
+
+# Kiosk fleet management
+@app.route('/api/kiosk-groups', methods=['GET'])
+@login_required
+def api_kiosk_groups():
+    conn = get_db_connection()
+    groups = conn.execute('''
+        SELECT g.id, g.name, COUNT(k.id) AS kiosk_count
+        FROM kiosk_groups g LEFT JOIN kiosks k ON k.group_id = g.id
+        GROUP BY g.id ORDER BY g.name
+    ''').fetchall()
+    conn.close()
+    return jsonify([dict(group) for group in groups])
+
+@app.route('/api/kiosk-groups', methods=['POST'])
+@login_required
+def api_add_kiosk_group():
+    name = str((request.get_json(silent=True) or request.form).get('name', '')).strip()
+    if not name:
+        return jsonify({'error': 'name is required'}), 400
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute('INSERT INTO kiosk_groups (name) VALUES (?)', (name,))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.close()
+        return jsonify({'error': f"Group '{name}' already exists"}), 409
+    conn.close()
+    rebuild_schedule_index()
+    return jsonify({'id': cursor.lastrowid, 'name': name}), 201
+
+@app.route('/api/kiosk-groups/<int:id>', methods=['DELETE'])
+@login_required
+def api_delete_kiosk_group(id):
+    conn = get_db_connection()
+    if conn.execute('SELECT 1 FROM schedule WHERE group_id = ? LIMIT 1', (id,)).fetchone():
+        conn.close()
+        return jsonify({'error': 'Group still has schedules; delete or reassign them first'}), 409
+    conn.execute('UPDATE kiosks SET group_id = NULL WHERE group_id = ?', (id,))
+    conn.execute('DELETE FROM kiosk_groups WHERE id = ?', (id,))
+    conn.commit()
+    conn.close()
+    rebuild_schedule_index()
+    return '', 204
+
+@app.route('/api/kiosks', methods=['GET'])
+@login_required
+def api_kiosks():
+    conn = get_db_connection()
+    kiosks = conn.execute('''
+        SELECT k.*, g.name AS group_name
+        FROM kiosks k LEFT JOIN kiosk_groups g ON k.group_id = g.id
+        ORDER BY k.id
+    ''').fetchall()
+    conn.close()
+    return jsonify([dict(kiosk) for kiosk in kiosks])
+
+@app.route('/api/kiosks', methods=['POST'])
+@login_required
+def api_save_kiosk():
+    """Register a kiosk or move it to another group"""
+    data = request.get_json(silent=True) or request.form
+    kiosk_id = str(data.get('id', '')).strip()
+    if not kiosk_id:
+        return jsonify({'error': 'id is required'}), 400
+    group_id = data.get('group_id') or None
+    
+    conn = get_db_connection()
+    if group_id and not conn.execute('SELECT 1 FROM kiosk_groups WHERE id = ?', (group_id,)).fetchone():
+        conn.close()
+        return jsonify({'error': 'Group not found'}), 404
+    conn.execute('''
+        INSERT INTO kiosks (id, name, group_id) VALUES (?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET name = excluded.name, group_id = excluded.group_id
+    ''', (kiosk_id, data.get('name') or kiosk_id, group_id))
+    conn.commit()
+    kiosk = conn.execute('SELECT * FROM kiosks WHERE id = ?', (kiosk_id,)).fetchone()
+    conn.close()
+    rebuild_schedule_index()
+    return jsonify(dict(kiosk))
+
+@app.route('/api/kiosks/<kiosk_id>', methods=['DELETE'])
+@login_required
+def api_delete_kiosk(kiosk_id):
+    conn = get_db_connection()
+    conn.execute('DELETE FROM kiosks WHERE id = ?', (kiosk_id,))
+    conn.commit()
+    conn.close()
+    rebuild_schedule_index()
+    return '', 204
+
+# Kiosk health
+def parse_heartbeat(data, kiosk_id, received_at):
+    """Validate one heartbeat payload; returns a row dict or raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('heartbeat must be a JSON object')
+    kiosk_id = str(data.get('kiosk_id') or kiosk_id or '').strip()
+    if not kiosk_id:
+        raise ValueError('kiosk_id is required')
+    
+    heartbeat = {'kiosk_id': kiosk_id[:200], 'received_at': received_at}
+    for metric in HEARTBEAT_METRICS:
+        value = data.get(metric)
+        heartbeat[metric] = float(value) if value not in (None, '') else None
+    chrome_running = data.get('chrome_running')
+    heartbeat['chrome_running'] = None if chrome_running is None else int(bool(chrome_running))
+    heartbeat['mode'] = str(data['mode'])[:20] if data.get('mode') else None
+    heartbeat['content_url'] = str(data['content_url'])[:2000] if data.get('content_url') else None
+    return heartbeat
+
+@app.route('/api/heartbeat', methods=['POST'])
+def api_heartbeat():
+    """Accept one heartbeat, or a list of them, for write-behind storage"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({'error': 'Expected a JSON body'}), 400
+    
+    received_at = int(time.time())
+    try:
+        heartbeats = [parse_heartbeat(item, request.args.get('kiosk'), received_at)
+                      for item in (data if isinstance(data, list) else [data])]
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not heartbeat_queue.put(heartbeats):
+        response = jsonify({'error': 'Heartbeat queue is full'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(HEARTBEAT_FLUSH_INTERVAL * 5)
+        return response
+    return '', 202
+
+@app.route('/api/kiosks/status', methods=['GET'])
+@login_required
+def api_kiosk_status():
+    """Latest heartbeat of every kiosk that has reported"""
+    now = int(time.time())
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT s.*, k.name, g.name AS group_name
+        FROM kiosk_status s
+        LEFT JOIN kiosks k ON k.id = s.kiosk_id
+        LEFT JOIN kiosk_groups g ON g.id = k.group_id
+        ORDER BY s.kiosk_id
+    ''').fetchall()
+    conn.close()
+    
+    kiosks = []
+    for row in rows:
+        kiosk = dict(row)
+        kiosk['stale'] = now - row['last_seen'] > HEARTBEAT_STALE
+        kiosks.append(kiosk)
+    return jsonify({'kiosks': kiosks, 'queue': heartbeat_queue.get_stats()})
+
+@app.route('/api/kiosks/<kiosk_id>/health', methods=['GET'])
+@login_required
+def api_kiosk_health(kiosk_id):
+    """Rolled-up health history: ?resolution=minute|hour&since=<epoch>"""
+    resolution = request.args.get('resolution', 'minute')
+    tables = {'minute': ('heartbeat_minutes', 3600), 'hour': ('heartbeat_hours', 7 * 24 * 3600)}
+    if resolution not in tables:
+        return jsonify({'error': 'resolution must be minute or hour'}), 400
+    table, default_span = tables[resolution]
+    since = request.args.get('since', int(time.time()) - default_span, type=int)
+    
+    averages = ', '.join(f'{m}_sum / NULLIF({m}_count, 0) AS {m}_avg, {m}_max' for m in HEARTBEAT_METRICS)
+    conn = get_db_connection()
+    rows = conn.execute(f'''
+        SELECT bucket, samples, offline_samples, chrome_down_samples, {averages}
+        FROM {table}
+        WHERE kiosk_id = ? AND bucket >= ?
+        ORDER BY bucket
+    ''', (kiosk_id, since)).fetchall()
+    conn.close()
+    return jsonify({'kiosk_id': kiosk_id, 'resolution': resolution, 'buckets': [dict(row) for row in rows]})
+
+# Proof of play
+def parse_epoch(value, name):
+    """Epoch seconds from a number or an ISO 8601 string"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str) and value:
+        return int(datetime.fromisoformat(value).timestamp())
+    raise ValueError(f'{name} is required')
+
+def parse_play_event(data, kiosk_id, now):
+    """Validate one play event; returns a row dict or raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('play event must be a JSON object')
+    kiosk_id = str(data.get('kiosk_id') or kiosk_id or '').strip()
+    if not kiosk_id:
+        raise ValueError('kiosk_id is required')
+    
+    started_at = parse_epoch(data.get('started_at'), 'started_at')
+    ended_at = parse_epoch(data.get('ended_at'), 'ended_at')
+    if not started_at < ended_at <= now + 300:
+        raise ValueError('ended_at must be after started_at and not in the future')
+    if ended_at - started_at > PLAY_MAX_DURATION:
+        raise ValueError(f'play events may last at most {PLAY_MAX_DURATION} seconds')
+    if started_at < now - PLAY_RETENTION_DAYS * 24 * 3600:
+        raise ValueError('play event is older than the retention period')
+    
+    mode = data.get('mode') or 'online'
+    if mode not in ('online', 'offline'):
+        raise ValueError('mode must be online or offline')
+    content_id = data.get('content_id')
+    return {
+        'kiosk_id': kiosk_id[:200],
+        'content_id': int(content_id) if content_id not in (None, '') else None,
+        'url': str(data['url'])[:2000] if data.get('url') else None,
+        'started_at': started_at,
+        'ended_at': ended_at,
+        'offline': int(mode == 'offline')
+    }
+
+@app.route('/api/play-events', methods=['POST'])
+def api_play_events():
+    """Accept one play event, or a list of them, for write-behind storage"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({'error': 'Expected a JSON body'}), 400
+    
+    now = int(time.time())
+    try:
+        events = [parse_play_event(item, request.args.get('kiosk'), now)
+                  for item in (data if isinstance(data, list) else [data])]
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not play_queue.put(events):
+        response = jsonify({'error': 'Play event queue is full'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(PLAY_FLUSH_INTERVAL * 5)
+        return response
+    return '', 202
+
+def parse_report_day(value, default):
+    """A YYYY-MM-DD query argument as a date"""
+    if not value:
+        return default
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+@app.route('/api/play-events/<day>', methods=['GET'])
+@login_required
+def api_play_events_day(day):
+    """Raw play events of one day (YYYY-MM-DD) in start order, one keyset page at a time.
+
+    Filters: kiosk, content_id. Pass the returned ``next`` value as ?after=
+    to get the following page.
+    """
+    try:
+        date = parse_report_day(day, None)
+    except ValueError:
+        return jsonify({'error': 'day must be YYYY-MM-DD'}), 400
+    limit = page_limit()
+    conditions = []
+    params = []
+    
+    after = request.args.get('after')
+    if after:
+        try:
+            start, kiosk = (int(part) for part in after.split(':'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        conditions.append('(e.start > ? OR (e.start = ? AND e.kiosk > ?))')
+        params += [start, start, kiosk]
+    if request.args.get('kiosk'):
+        conditions.append('k.kiosk_id = ?')
+        params.append(request.args['kiosk'])
+    content_id = request.args.get('content_id', type=int)
+    if content_id is not None:
+        conditions.append('e.content_id = ?')
+        params.append(content_id)
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    table = play_partition(play_day(date))
+    conn = get_db_connection()
+    try:
+        rows = []  # No events were stored that day
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            rows = conn.execute(f'''
+                SELECT e.start, e.kiosk, k.kiosk_id, e.duration, e.content_id, e.offline
+                FROM {table} e
+                JOIN play_kiosks k ON k.id = e.kiosk
+                {where}
+                ORDER BY e.start, e.kiosk
+                LIMIT ?
+            ''', params + [limit + 1]).fetchall()
+    finally:
+        conn.close()
+    
+    midnight = int(datetime.combine(date, datetime.min.time()).timestamp())
+    items = [{
+        'kiosk_id': row['kiosk_id'],
+        'content_id': row['content_id'] or None,
+        'started_at': midnight + row['start'],
+        'ended_at': midnight + row['start'] + row['duration'],
+        'mode': 'offline' if row['offline'] else 'online'
+    } for row in rows[:limit]]
+    next_cursor = f"{rows[limit - 1]['start']}:{rows[limit - 1]['kiosk']}" if len(rows) > limit else None
+    return jsonify({'day': date.isoformat(), 'items': items, 'next': next_cursor})
+
+AIRTIME_GROUPS = {  # group -> (GROUP BY key, selected columns)
+    'content': ('d.content_id', 'd.content_id, c.name AS content_name'),
+    'day': ('d.day', "printf('%04d-%02d-%02d', d.day / 10000, d.day / 100 % 100, d.day % 100) AS day"),
+    'kiosk': ('k.kiosk_id', 'k.kiosk_id'),
+    'mode': ('d.offline', "CASE d.offline WHEN 1 THEN 'offline' ELSE 'online' END AS mode"),
+}
+
+def airtime_report(start, end, content_ids=(), kiosk_id=None, group_by=('content',)):
+    """Plays and seconds on air between two dates (inclusive), summed from play_daily"""
+    columns = [AIRTIME_GROUPS[group][1] for group in group_by]
+    keys = [AIRTIME_GROUPS[group][0] for group in group_by]
+    conditions = ['d.day BETWEEN ? AND ?']
+    params = [play_day(start), play_day(end)]
+    if content_ids:
+        conditions.append(f"d.content_id IN ({', '.join('?' * len(content_ids))})")
+        params += list(content_ids)
+    if kiosk_id:
+        conditions.append('k.kiosk_id = ?')
+        params.append(kiosk_id)
+    
+    conn = get_db_connection()
+    rows = conn.execute(f'''
+        SELECT {', '.join(columns + [''])} SUM(d.plays) AS plays, SUM(d.seconds) AS seconds
+        FROM play_daily d
+        JOIN play_kiosks k ON k.id = d.kiosk
+        LEFT JOIN content c ON c.id = d.content_id
+        WHERE {' AND '.join(conditions)}
+        {'GROUP BY ' + ', '.join(keys) if keys else ''}
+        ORDER BY {'d.day, ' if 'day' in group_by else ''}seconds DESC
+    ''', params).fetchall()
+    conn.close()
+    
+    report = []
+    for row in rows:
+        item = dict(row)
+        if item['plays'] is None:
+            continue  # Totals over no rows at all
+        if 'content_id' in item:
+            item['content_id'] = item['content_id'] or None
+        item['hours'] = round(item['seconds'] / 3600, 2)
+        report.append(item)
+    return report
+
+def airtime_csv(report):
+    output = io.StringIO()
+    if report:
+        writer = csv.DictWriter(output, fieldnames=list(report[0]))
+        writer.writeheader()
+        writer.writerows(report)
+    return output.getvalue()
+
+@app.route('/api/reports/airtime', methods=['GET'])
+@login_required
+def api_airtime_report():
+    """Airtime per content item (or ?group_by=content,day,kiosk,mode) from the daily totals.
+
+    ?from=&to= (YYYY-MM-DD, default the last 30 days), ?content_id= (repeat
+    it to report on a campaign), ?kiosk=, ?format=csv
+    """
+    today = datetime.now().date()
+    try:
+        end = parse_report_day(request.args.get('to'), today)
+        start = parse_report_day(request.args.get('from'), end - timedelta(days=AIRTIME_REPORT_DAYS - 1))
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+    group_by = [group for group in request.args.get('group_by', 'content').split(',') if group]
+    if any(group not in AIRTIME_GROUPS for group in group_by):
+        return jsonify({'error': f"group_by must be made of {', '.join(AIRTIME_GROUPS)}"}), 400
+    content_ids = request.args.getlist('content_id', type=int)
+    
+    report = airtime_report(start, end, content_ids, request.args.get('kiosk'), group_by)
+    if request.args.get('format') == 'csv':
+        response = app.response_class(airtime_csv(report), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename=airtime_{start}_{end}.csv'
+        return response
+    return jsonify({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'rows': report,
+        'total_seconds': sum(item['seconds'] for item in report),
+        'queue': play_queue.get_stats()
+    })
+
+@app.route('/api/db-stats', methods=['GET'])
+@login_required
+def api_db_stats():
+    """Connection pool statistics"""
+    return jsonify(db_pool.get_stats())
+
+@app.route('/api/media-jobs', methods=['GET'])
+@login_required
+def api_media_jobs():
+    """Recent media processing jobs, optionally filtered by ?status= or ?content_id="""
+    conditions = []
+    params = []
+    if request.args.get('status'):
+        conditions.append('status = ?')
+        params.append(request.args['status'])
+    content_id = request.args.get('content_id', type=int)
+    if content_id is not None:
+        conditions.append('content_id = ?')
+        params.append(content_id)
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = get_db_connection()
+    jobs = conn.execute(f'SELECT * FROM media_jobs {where} ORDER BY id DESC LIMIT ?',
+                        params + [page_limit()]).fetchall()
+    conn.close()
+    return jsonify([dict(job) for job in jobs])
+
+@app.route('/api/media-jobs/<int:id>', methods=['GET'])
+@login_required
+def api_media_job(id):
+    conn = get_db_connection()
+    job = conn.execute('SELECT * FROM media_jobs WHERE id = ?', (id,)).fetchone()
+    conn.close()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(dict(job))
+
+@app.route('/api/content/<int:id>/media', methods=['GET'])
+@login_required
+def api_content_media(id):
+    """Media metadata of a content item and the status of its latest job"""
+    conn = get_db_connection()
+    content = conn.execute('''
+        SELECT id, file_path, etag, file_size, mime_type, duration, width, height, media_status,
+               thumbnail_path IS NOT NULL AS has_thumbnail
+        FROM content WHERE id = ?
+    ''', (id,)).fetchone()
+    if not content:
+        conn.close()
+        return jsonify({'error': 'Content not found'}), 404
+    job = conn.execute('SELECT * FROM media_jobs WHERE content_id = ? ORDER BY id DESC LIMIT 1', (id,)).fetchone()
+    conn.close()
+    return jsonify({**dict(content), 'job': dict(job) if job else None})
+
+@app.route('/api/content/<int:id>/media', methods=['POST'])
+@login_required
+def api_reprocess_content_media(id):
+    """Queue a content item's file for (re)processing"""
+    conn = get_db_connection()
+    content = conn.execute('SELECT file_path FROM content WHERE id = ?', (id,)).fetchone()
+    conn.close()
+    if not content or not content['file_path'] or not os.path.isfile(content['file_path']):
+        return jsonify({'error': 'Content has no stored file'}), 404
+    job_id = media_pool.enqueue(id, content['file_path'])
+    return jsonify({'job_id': job_id}), 202
+
+@app.route('/api/content/<int:id>/thumbnail', methods=['GET'])
+@login_required
+def api_content_thumbnail(id):
+    conn = get_db_connection()
+    content = conn.execute('SELECT thumbnail_path FROM content WHERE id = ?', (id,)).fetchone()
+    conn.close()
+    if not content or not content['thumbnail_path'] or not os.path.isfile(content['thumbnail_path']):
+        abort(404)
+    response = send_file(content['thumbnail_path'], mimetype='image/jpeg', conditional=True)
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@app.route('/api/prefetch-stats', methods=['GET'])
+@login_required
+def api_prefetch_stats():
+    """Size and entry count of the content prefetch cache"""
+    return jsonify(content_prefetcher.get_stats())
+
+@metrics.collector
+def collect_runtime_metrics():
+    pool = db_pool.get_stats()
+    queue = heartbeat_queue.get_stats()
+    plays = play_queue.get_stats()
+    return [
+        ('kiosk_db_connections_opened_total', 'counter', 'SQLite connections opened by the pool', [({}, pool['opened'])]),
+        ('kiosk_db_connections_closed_total', 'counter', 'SQLite connections closed by the pool', [({}, pool['closed'])]),
+        ('kiosk_db_connections_acquired_total', 'counter', 'Connections handed out, new or reused',
+         [({}, pool['acquired'])]),
+        ('kiosk_db_connections', 'gauge', 'Pooled SQLite connections by state',
+         [({'state': 'in_use'}, pool['in_use']), ({'state': 'idle'}, pool['idle'])]),
+        ('kiosk_stream_clients', 'gauge', 'Kiosks connected to the content stream', [({}, len(content_stream.clients))]),
+        ('kiosk_heartbeat_queue_pending', 'gauge', 'Heartbeats waiting to be written', [({}, queue['pending'])]),
+        ('kiosk_heartbeats_dropped_total', 'counter', 'Heartbeats refused because the queue was full',
+         [({}, queue['dropped'])]),
+        ('kiosk_heartbeats_failed_total', 'counter', 'Heartbeats lost because every write attempt failed',
+         [({}, queue['failed'])]),
+        ('kiosk_play_queue_pending', 'gauge', 'Play events waiting to be written', [({}, plays['pending'])]),
+        ('kiosk_play_events_dropped_total', 'counter', 'Play events refused because the queue was full',
+         [({}, plays['dropped'])]),
+        ('kiosk_play_events_failed_total', 'counter', 'Play events lost because every write attempt failed',
+         [({}, plays['failed'])]),
+    ]
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Request, query, schedule and transfer metrics for Prometheus"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/slow-requests')
+@login_required
+def slow_requests():
+    """The slowest recent requests recorded by the profiler"""
+    return render_template('slow_requests.html', requests=request_profiler.slowest(),
+                           enabled=request_profiler.enabled, threshold_ms=int(PROFILE_THRESHOLD * 1000),
+                           profile_log=PROFILE_LOG)
+
+# Chunked uploads
+def upload_part_path(upload_id):
+    return os.path.join(app.config['UPLOAD_FOLDER'], '.uploads', f"{upload_id}.part")
+
+def upload_status(conn, upload):
+    received = [row['chunk_index'] for row in conn.execute(
+        'SELECT chunk_index FROM upload_chunks WHERE session_id = ? ORDER BY chunk_index', (upload['id'],))]
+    chunk_count = max(1, -(-upload['total_size'] // upload['chunk_size']))
+    return {
+        'upload_id': upload['id'],
+        'filename': upload['filename'],
+        'size': upload['total_size'],
+        'chunk_size': upload['chunk_size'],
+        'chunk_count': chunk_count,
+        'received': received,
+        'complete': len(received) == chunk_count,
+    }
+
+def discard_upload(conn, upload_id):
+    conn.execute('DELETE FROM upload_chunks WHERE session_id = ?', (upload_id,))
+    conn.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+    try:
+        os.remove(upload_part_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+def purge_expired_uploads(conn):
+    """Drop upload sessions abandoned for longer than UPLOAD_SESSION_TTL"""
+    cutoff = int(time.time()) - UPLOAD_SESSION_TTL
+    for row in conn.execute('SELECT id FROM upload_sessions WHERE created_at < ?', (cutoff,)).fetchall():
+        discard_upload(conn, row['id'])
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def api_create_upload():
+    """Start a resumable upload session and reserve its file on disk"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename', '')))
+    try:
+        total_size = int(data.get('size', -1))
+        chunk_size = int(data.get('chunk_size') or CHUNK_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size and chunk_size must be integers'}), 400
+    
+    if not filename:
+        return jsonify({'error': 'filename is required'}), 400
+    if not 0 <= total_size <= CHUNKED_UPLOAD_MAX_SIZE:
+        return jsonify({'error': f"size must be between 0 and {CHUNKED_UPLOAD_MAX_SIZE} bytes"}), 400
+    if not 0 < chunk_size <= app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'chunk_size is out of range'}), 400
+    
+    upload_id = uuid.uuid4().hex
+    part_path = upload_part_path(upload_id)
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    with open(part_path, 'wb') as f:
+        f.truncate(total_size)
+    
+    conn = get_db_connection()
+    purge_expired_uploads(conn)
+    conn.execute('''
+        INSERT INTO upload_sessions (id, filename, total_size, chunk_size, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (upload_id, filename, total_size, chunk_size, int(time.time())))
+    conn.commit()
+    upload = conn.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    status = upload_status(conn, upload)
+    conn.close()
+    
+    return jsonify(status), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def api_upload_status(upload_id):
+    """Report which chunks have arrived, so a client can resume"""
+    conn = get_db_connection()
+    upload = conn.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    status = upload_status(conn, upload) if upload else None
+    conn.close()
+    
+    if not status:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(status)
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def api_upload_chunk(upload_id, index):
+    """Stream one chunk to its offset in the part file, verifying its SHA-256"""
+    conn = get_db_connection()
+    upload = conn.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    conn.close()
+    
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    offset = index * upload['chunk_size']
+    expected = min(upload['chunk_size'], upload['total_size'] - offset)
+    if expected < 0 or (expected == 0 and index > 0):
+        return jsonify({'error': 'Chunk index out of range'}), 400
+    
+    # Stream straight to disk in small blocks; memory use is independent of chunk size
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    written = 0
+    with open(upload_part_path(upload_id), 'r+b') as f:
+        f.seek(offset)
+        while True:
+            block = request.stream.read(64 * 1024)
+            if not block:
+                break
+            written += len(block)
+            if written > expected:
+                break
+            digest.update(block)
+            f.write(block)
+    metrics.inc('kiosk_upload_bytes_total', written, ('chunk',))
+    metrics.observe('kiosk_upload_duration_seconds', time.perf_counter() - started, ('chunk',))
+    
+    if written != expected:
+        return jsonify({'error': f"Chunk {index} must be exactly {expected} bytes"}), 400
+    
+    checksum = digest.hexdigest()
+    claimed = request.headers.get('X-Chunk-SHA256', '').lower()
+    if claimed and claimed != checksum:
+        return jsonify({'error': f"Checksum mismatch for chunk {index}", 'sha256': checksum}), 422
+    
+    conn = get_db_connection()
+    conn.execute('INSERT OR REPLACE INTO upload_chunks (session_id, chunk_index, sha256) VALUES (?, ?, ?)',
+                 (upload_id, index, checksum))
+    conn.commit()
+    conn.close()
+    
+    return jsonify({'index': index, 'sha256': checksum})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def api_complete_upload(upload_id):
+    """Move a fully received upload into place and save its content row"""
+    data = request.get_json(silent=True) or request.form
+    conn = get_db_connection()
+    upload = conn.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    
+    if not upload:
+        conn.close()
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    status = upload_status(conn, upload)
+    if not status['complete']:
+        conn.close()
+        return jsonify(dict(status, error='Upload is missing chunks')), 409
+    
+    content_id = data.get('content_id')
+    if content_id and not conn.execute('SELECT id FROM content WHERE id = ?', (content_id,)).fetchone():
+        conn.close()
+        return jsonify({'error': 'Content not found'}), 404
+    
+    # The ETag is the whole file's SHA-256, like a form upload's; hash it in the
+    # same pass that flushes it to disk
+    part_path = upload_part_path(upload_id)
+    digest = hashlib.sha256()
+    with open(part_path, 'rb+') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+        os.fsync(f.fileno())
+    etag = digest.hexdigest()
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], upload['filename'])
+    os.replace(part_path, file_path)
+    
+    content_type = data.get('type', 'local')
+    url = data.get('url', '')
+    # If it's a local file, update the URL to point to it
+    if content_type == 'local':
+        url = f"file://{file_path}"
+    
+    discard_upload(conn, upload_id)
+    content_id = save_content(conn, int(content_id) if content_id else None,
+                              data.get('name') or upload['filename'], content_type, url, file_path,
+                              1 if data.get('is_default') else 0, 1 if data.get('is_offline') else 0, etag)
+    conn.close()
+    
+    flash('Content saved successfully')
+    return jsonify({'content_id': content_id, 'file_path': file_path, 'redirect': url_for('dashboard')})
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def api_abort_upload(upload_id):
+    """Abandon an upload and delete its partial file"""
+    conn = get_db_connection()
+    discard_upload(conn, upload_id)
+    conn.commit()
+    conn.close()
+    return '', 204
+
+@app.route('/content/<path:filename>')
+def serve_content(filename):
+    """Serve uploaded content files with validators, byte ranges and sendfile"""
+    path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    parts = filename.split('/')
+    # Dot-directories hold in-progress uploads and caches, not content; finished
+    # prefetch copies are the exception, for kiosks that reach them over HTTP
+    if ContentPrefetcher.servable(parts):
+        parts = parts[2:]
+    if path is None or any(part.startswith('.') for part in parts):
+        abort(404)
+    try:
+        f = open(path, 'rb')
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        abort(404)
+    
+    stat = os.fstat(f.fileno())
+    size = stat.st_size
+    etag, weak = content_file_etag(path, stat)
+    
+    response = app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    response.set_etag(etag, weak)
+    response.last_modified = int(stat.st_mtime)
+    response.accept_ranges = 'bytes'
+    response.headers['Cache-Control'] = f"public, max-age={CONTENT_CACHE_MAX_AGE}"
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = request.if_modified_since and request.if_modified_since.timestamp() >= int(stat.st_mtime)
+    if not_modified:
+        f.close()
+        response.status_code = 304
+        return response
+    
+    # Honour a single byte range unless If-Range says the client's copy is stale
+    start, end = 0, size
+    if_range = request.if_range
+    if request.range and (not (if_range.etag or if_range.date) or (if_range.etag == etag and not weak)):
+        span = request.range.range_for_length(size)
+        if span:
+            start, end = span
+            response.status_code = 206
+            response.headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+        elif len(request.range.ranges) == 1:
+            f.close()
+            response.status_code = 416
+            response.headers['Content-Range'] = f"bytes */{size}"
+            return response
+    
+    f.seek(start)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    # gunicorn sends a file wrapper with os.sendfile from the current offset and
+    # stops at Content-Length, so any range can go zero-copy there; other
+    # servers may send to the end of the file, so they get it only for tails
+    zero_copy = isinstance(file_wrapper, type) and (
+        end == size or request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn/'))
+    if zero_copy:
+        body = counting_file_wrapper(file_wrapper)(f, 1024 * 1024, end - start)
+    else:
+        body = read_file_range(f, end - start)
+    response.response = body
+    response.direct_passthrough = True
+    response.content_length = end - start
+    return response
+
+@functools.lru_cache(maxsize=None)
+def counting_file_wrapper(wrapper_class):
+    """Subclass of a server's wsgi.file_wrapper that counts its bytes once the server closes it"""
+    class CountingFileWrapper(wrapper_class):
+        def __init__(self, filelike, blksize, length):
+            super().__init__(filelike, blksize)
+            close = getattr(self, 'close', None)  # gunicorn binds the file's close() on the instance
+
+            def counted_close():
+                metrics.inc('kiosk_content_bytes_served_total', length, ('sendfile',))
+                if close is not None:
+                    close()
+            self.close = counted_close
+    return CountingFileWrapper
+
+def read_file_range(f, length):
+    try:
+        while length > 0:
+            block = f.read(min(1024 * 1024, length))
+            if not block:
+                break
+            length -= len(block)
+            metrics.inc('kiosk_content_bytes_served_total', len(block), ('read',))
+            yield block
+    finally:
+        f.close()
+
+@app.route('/api/sync-manifest', methods=['GET'])
+def api_sync_manifest():
+    """Content files with their SHA-256 and chunk hashes, for sync-content"""
+    files = []
+    for file_path, (etag, size, mtime_ns) in sorted(get_file_validators().items()):
+        filename = os.path.relpath(file_path, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        if filename.startswith('../') or any(part.startswith('.') for part in filename.split('/')):
+            continue
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            continue  # Changed on disk and not yet rehashed
+        files.append({'path': filename, 'size': size, 'sha256': etag, 'chunks': load_chunk_manifest(etag)})
+    
+    listing = [(f['path'], f['sha256'], f['chunks'] is None) for f in files]
+    etag = hashlib.sha256(json.dumps(listing).encode()).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({'files': files})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Content sync client
+class ContentSync:
+    """Brings a local content folder up to date with another admin panel's /api/sync-manifest.
+
+    Chunks already present in any known local file are copied from disk and
+    only the rest are downloaded, with Range requests pinned to the server's
+    SHA-256 by If-Range. Each file is rebuilt beside its target, verified and
+    then moved into place, so a kiosk never plays a half-written file.
+    """
+
+    def __init__(self, server, dest):
+        self.server = server.rstrip('/')
+        self.dest = dest
+        self.state_path = os.path.join(dest, '.sync-state.json')
+        self.state = {}
+        self.index = {}
+        self.reused = 0
+        self.downloaded = 0
+
+    def _open(self, path, headers=None):
+        request = urllib.request.Request(self.server + path, headers={'User-Agent': 'KioskSync/1.0', **(headers or {})})
+        return urllib.request.urlopen(request, timeout=SYNC_TIMEOUT)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.state, f, separators=(',', ':'))
+        os.replace(temp_path, self.state_path)
+
+    def _local_entry(self, filename):
+        """State entry for a local file, re-chunking it if it changed since the last sync"""
+        path = safe_join(self.dest, filename)
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            self.state.pop(filename, None)
+            return None
+        entry = self.state.get(filename)
+        if entry is None or (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            sha256, chunks = file_chunks(path)
+            entry = self.state[filename] = {'sha256': sha256, 'size': stat.st_size,
+                                            'mtime_ns': stat.st_mtime_ns, 'chunks': chunks}
+        return entry
+
+    def _index(self, filename, chunks):
+        for offset, length, digest in chunks:
+            self.index[digest] = (filename, offset, length)
+
+    def _read_local(self, digest):
+        """A chunk's bytes from whichever local file holds it, or None"""
+        location = self.index.get(digest)
+        if location is None:
+            return None
+        filename, offset, length = location
+        try:
+            with open(safe_join(self.dest, filename), 'rb') as f:
+                f.seek(offset)
+                data = f.read(length)
+        except OSError:
+            return None
+        # The file may have been replaced earlier in this run
+        return data if hashlib.sha256(data).hexdigest() == digest else None
+
+    def _fetch_chunks(self, remote, chunks, out, digest):
+        """Download consecutive chunks in as few Range requests as SYNC_RANGE_MAX allows"""
+        url = '/content/' + quote(remote['path'])
+        while chunks:
+            group, total = [chunks[0]], chunks[0][1]
+            for chunk in chunks[1:]:
+                if total + chunk[1] > SYNC_RANGE_MAX:
+                    break
+                group.append(chunk)
+                total += chunk[1]
+            chunks = chunks[len(group):]
+            start = group[0][0]
+            headers = {'Range': f"bytes={start}-{start + total - 1}", 'If-Range': f'"{remote["sha256"]}"'}
+            with self._open(url, headers) as response:
+                if response.status != 206 or not response.headers.get('Content-Range', '').startswith(f"bytes {start}-"):
+                    raise ValueError('changed on the server during sync')
+                for offset, length, chunk_digest in group:
+                    data = response.read(length)
+                    if hashlib.sha256(data).hexdigest() != chunk_digest:
+                        raise ValueError(f'chunk at byte {offset} failed verification')
+                    out.write(data)
+                    digest.update(data)
+                    self.downloaded += length
+
+    def _fetch_file(self, remote, out, digest):
+        """Download a whole file the server has no chunk manifest for"""
+        with self._open('/content/' + quote(remote['path'])) as response:
+            for block in iter(lambda: response.read(1024 * 1024), b''):
+                out.write(block)
+                digest.update(block)
+                self.downloaded += len(block)
+
+    def sync_file(self, remote):
+        """Rebuild one file from local and downloaded chunks, verify it and move it into place"""
+        target = safe_join(self.dest, remote['path'])
+        if target is None:
+            raise ValueError('unsafe path')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Dot-files are not served by /content/, so a kiosk's own panel never exposes the partial copy
+        temp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.sync")
+        digest = hashlib.sha256()
+        try:
+            with open(temp_path, 'wb') as out:
+                if remote['chunks'] is None:
+                    self._fetch_file(remote, out, digest)
+                else:
+                    missing = []
+                    for chunk in remote['chunks']:
+                        data = self._read_local(chunk[2])
+                        if data is None:
+                            missing.append(chunk)
+                            continue
+                        self._fetch_chunks(remote, missing, out, digest)
+                        missing = []
+                        out.write(data)
+                        digest.update(data)
+                        self.reused += len(data)
+                    self._fetch_chunks(remote, missing, out, digest)
+                out.flush()
+                os.fsync(out.fileno())
+            if digest.hexdigest() != remote['sha256']:
+                raise ValueError('SHA-256 mismatch after reassembly')
+            os.replace(temp_path, target)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        if remote['chunks'] is None:
+            self.state.pop(remote['path'], None)  # Chunked on the next run
+        else:
+            stat = os.stat(target)
+            self.state[remote['path']] = {'sha256': remote['sha256'], 'size': stat.st_size,
+                                          'mtime_ns': stat.st_mtime_ns, 'chunks': remote['chunks']}
+            self._index(remote['path'], remote['chunks'])
+
+    def run(self, echo):
+        """Sync every file in the server's manifest; returns the number that failed"""
+        with self._open('/api/sync-manifest') as response:
+            files = json.load(response)['files']
+        
+        self.state = self._load_state()
+        local = {filename: self._local_entry(filename) for filename in {f['path'] for f in files} | set(self.state)}
+        for filename, entry in local.items():
+            if entry:
+                self._index(filename, entry['chunks'])
+        
+        failed = 0
+        for remote in files:
+            entry = local.get(remote['path'])
+            if entry and entry['sha256'] == remote['sha256']:
+                continue
+            try:
+                self.sync_file(remote)
+            except (OSError, ValueError, urllib.error.URLError) as e:
+                failed += 1
+                echo(f"{remote['path']}: {e}")
+            else:
+                echo(f"{remote['path']}: updated")
+            self._save_state()
+        self._save_state()
+        return failed
+
+# Command line
+@app.cli.command('export-catalog')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write (default: stdout)')
+def export_catalog_command(output):
+    """Export content and schedule as JSON"""
+    json.dump(export_catalog(), output, indent=2)
+    output.write('\n')
+
+@app.cli.command('import-catalog')
+@click.argument('source', type=click.File('r'))
+@click.option('--replace', is_flag=True, help='Replace all content and schedules instead of appending')
+def import_catalog_command(source, replace):
+    """Import content and schedule from a JSON export"""
+    counts, errors = import_catalog(json.load(source), replace=replace)
+    if errors:
+        for error in errors:
+            click.echo(error, err=True)
+        raise SystemExit(1)
+    click.echo(f"Imported {counts['content']} content rows and {counts['schedule']} schedule rows")
+
+@app.cli.command('timeline')
+@click.option('--days', default=TIMELINE_DAYS, show_default=True, type=click.IntRange(1, TIMELINE_MAX_DAYS))
+@click.option('--kiosk', default=None, help='Kiosk id whose group schedule to use')
+@click.option('--format', 'output_format', type=click.Choice(['json', 'tsv']), default='json', show_default=True)
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write (default: stdout)')
+def timeline_command(days, kiosk, output_format, output):
+    """Export the precompiled playback timeline"""
+    timeline = build_timeline(kiosk, days)
+    if output_format == 'tsv':
+        output.write(timeline_tsv(timeline))
+    else:
+        json.dump(timeline, output, indent=2)
+        output.write('\n')
+
+@app.cli.command('airtime-report')
+@click.option('--from', 'start', type=click.DateTime(['%Y-%m-%d']), default=None,
+              help=f'First day (default: {AIRTIME_REPORT_DAYS} days up to --to)')
+@click.option('--to', 'end', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day (default: today)')
+@click.option('--content-id', 'content_ids', type=int, multiple=True, help='Content item; repeat for a campaign')
+@click.option('--kiosk', default=None, help='Only this kiosk')
+@click.option('--group-by', default='content', show_default=True, help='Comma-separated: content, day, kiosk, mode')
+@click.option('--format', 'output_format', type=click.Choice(['csv', 'json']), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write (default: stdout)')
+def airtime_report_command(start, end, content_ids, kiosk, group_by, output_format, output):
+    """Export proof-of-play airtime from the daily totals"""
+    end = end.date() if end else datetime.now().date()
+    start = start.date() if start else end - timedelta(days=AIRTIME_REPORT_DAYS - 1)
+    group_by = [group for group in group_by.split(',') if group]
+    if any(group not in AIRTIME_GROUPS for group in group_by):
+        raise click.BadParameter(f"use {', '.join(AIRTIME_GROUPS)}", param_hint='--group-by')
+    report = airtime_report(start, end, content_ids, kiosk, group_by)
+    if output_format == 'csv':
+        output.write(airtime_csv(report))
+    else:
+        json.dump(report, output, indent=2)
+        output.write('\n')
+
+@app.cli.command('serve', with_appcontext=False)
+@click.option('--bind', default=SERVE_BIND, show_default=True, help='Address and port to listen on')
+@click.option('--workers', default=SERVE_WORKERS, show_default=True, type=click.IntRange(1),
+              help='Pre-forked worker processes')
+@click.option('--threads', default=SERVE_THREADS, show_default=True, type=click.IntRange(1),
+              help='Request threads per worker')
+@click.option('--pid', 'pid_file', default=None, help='Write the server PID here')
+def serve_command(bind, workers, threads, pid_file):
+    """Serve the admin panel with gunicorn; send SIGHUP to reload workers gracefully"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise click.ClickException('gunicorn is not installed (pip3 install gunicorn); '
+                                   'or run kiosk_admin_panel.py for the development server')
+
+    class AdminPanelServer(BaseApplication):
+        def load_config(self):
+            settings = {
+                'bind': bind,
+                'workers': workers,
+                'threads': threads,
+                'worker_class': 'gthread',
+                'timeout': SERVE_TIMEOUT,
+                'graceful_timeout': SERVE_GRACEFUL_TIMEOUT,
+                'preload_app': True,  # Workers share the imported code; the pool is reset after fork
+                'pidfile': pid_file,
+                'proc_name': 'kiosk-admin',
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    if workers > 1:
+        click.echo(f"Note: with {workers} workers, /metrics and /slow-requests each show only the worker "
+                   "that answers, and a /api/config long-poll may see a publish up to a second late", err=True)
+    create_templates()
+    init_db()
+    AdminPanelServer().run()
+
+@app.cli.command('sync-content', with_appcontext=False)
+@click.option('--server', required=True, help='Admin panel to copy from, e.g. http://10.0.0.5:8080')
+@click.option('--dest', default=UPLOAD_FOLDER, show_default=True, type=click.Path(file_okay=False),
+              help='Local content folder')
+def sync_content_command(server, dest):
+    """Download changed content files from another admin panel, reusing unchanged chunks"""
+    os.makedirs(dest, exist_ok=True)
+    sync = ContentSync(server, dest)
+    try:
+        failed = sync.run(click.echo)
+    except (OSError, ValueError, KeyError, urllib.error.URLError) as e:
+        raise click.ClickException(f"Could not sync from {server}: {e}")
+    click.echo(f"{sync.reused / 1048576:.1f}MB reused from local files, {sync.downloaded / 1048576:.1f}MB downloaded")
+    if failed:
+        raise click.ClickException(f"{failed} file(s) could not be synced; run sync-content again")
+
+# Create templates directory and templates
+def create_templates():
+    templates_dir = os.path.join(os.path.dirname(__file__), 'templates')
+    os.makedirs(templates_dir, exist_ok=True)
+    
+    # Create base template
+    with open(os.path.join(templates_dir, 'base.html'), 'w') as f:
+        f.write('''<!DOCTYPE html>
+<html>
+<head>
+    <title>{% block title %}Kiosk Admin Panel{% endblock %}</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css">
+    <style>
+        body { padding-top: 20px; }
+        .flash-messages { margin-bottom: 20px; }
+    </style>
+    {% block head %}{% endblock %}
+</head>
+<body>
+    <div class="container">
+        {% if session.user_id %}
+        <nav class="navbar navbar-expand-lg navbar-light bg-light mb-4">
+            <div class="container-fluid">
+                <a class="navbar-brand" href="{{ url_for('dashboard') }}">Kiosk Admin</a>
+                <button class="navbar-toggler" type="button" data-bs-toggle="collapse" data-bs-target="#navbarNav">
+                    <span class="navbar-toggler-icon"></span>
+                </button>
+                <div class="collapse navbar-collapse" id="navbarNav">
+                    <ul class="navbar-nav">
+                        <li class="nav-item">
+                            <a class="nav-link" href="{{ url_for('dashboard') }}">Dashboard</a>
+                        </li>
+                        <li class="nav-item">
+                            <a class="nav-link" href="{{ url_for('add_content') }}">Add Content</a>
+                        </li>
+                        <li class="nav-item">
+                            <a class="nav-link" href="{{ url_for('add_schedule') }}">Add Schedule</a>
+                        </li>
+                        <li class="nav-item">
+                            <a class="nav-link" href="{{ url_for('settings') }}">Settings</a>
+                        </li>
+                    </ul>
+                    <ul class="navbar-nav ms-auto">
+                        <li class="nav-item">
+                            <span class="nav-link">Welcome, {{ session.username }}</span>
+                        </li>
+                        <li class="nav-item">
+                            <a class="nav-link" href="{{ url_for('logout') }}">Logout</a>
+                        </li>
+                    </ul>
+                </div>
+            </div>
+        </nav>
+        {% endif %}
+        
+        <div class="flash-messages">
+            {% for message in get_flashed_messages() %}
+            <div class="alert alert-info">{{ message }}</div>
+            {% endfor %}
+        </div>
+        
+        {% block content %}{% endblock %}
+    </div>
+    
+    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
+    {% block scripts %}{% endblock %}
+</body>
+</html>''')
+    
+    # Create login template
+    with open(os.path.join(templates_dir, 'login.html'), 'w') as f:
+        f.write('''{% extends "base.html" %}
+
+{% block title %}Login - Kiosk Admin Panel{% endblock %}
+
+{% block content %}
+<div class="row justify-content-center">
+    <div class="col-md-6">
+        <div class="card">
+            <div class="card-header">
+                <h4>Login</h4>
+            </div>
+            <div class="card-body">
+                <form method="post">
+                    <div class="mb-3">
+                        <label for="username" class="form-label">Username</label>
+                        <input type="text" class="form-control" id="username" name="username" required>
+                    </div>
+                    <div class="mb-3">
+                        <label for="password" class="form-label">Password</label>
+                        <input type="password" class="form-control" id="password" name="password" required>
+                    </div>
+                    <button type="submit" class="btn btn-primary">Login</button>
+                </form>
+            </div>
+        </div>
+    </div>
+</div>
+{% endblock %}''')
+    
+    # Create dashboard template
+    with open(os.path.join(templates_dir, 'dashboard.html'), 'w') as f:
+        f.write('''{% extends "base.html" %}
+
+{% block title %}Dashboard - Kiosk Admin Panel{% endblock %}
+
+{% block content %}
+<h2>Dashboard</h2>
+
+<div class="row mb-4">
+    <div class="col-md-6">
+        <div class="card">
+            <div class="card-header">
+                <h5>Current Status</h5>
+            </div>
+            <div class="card-body">
+                <p><strong>Main URL:</strong> {{ main_url }}</p>
+                <p><strong>Offline URL:</strong> {{ offline_url }}</p>
+                <p><strong>Currently Showing:</strong> {{ current_content.name if current_content else 'Unknown' }}</p>
+                <p><strong>URL:</strong> {{ current_content.url if current_content else 'Unknown' }}</p>
+                <p><strong>Status:</strong> 
+                    {% if current_content and current_content.is_offline %}
+                        <span class="badge bg-warning">Offline Content</span>
+                    {% else %}
+                        <span class="badge bg-success">Online Content</span>
+                    {% endif %}
+                </p>
+            </div>
+        </div>
+    </div>
+    <div class="col-md-6">
+        <div class="card">
+            <div class="card-header">
+                <h5>Quick Actions</h5>
+            </div>
+            <div class="card-body">
+                <a href="{{ url_for('add_content') }}" class="btn btn-primary me-2">Add Content</a>
+                <a href="{{ url_for('add_schedule') }}" class="btn btn-success me-2">Add Schedule</a>
+                <a href="{{ url_for('settings') }}" class="btn btn-secondary">Settings</a>
+            </div>
+        </div>
+    </div>
+</div>
+
+<div class="row">
+    <div class="col-md-6">
+        <div class="card mb-4">
+            <div class="card-header d-flex justify-content-between align-items-center">
+                <h5>Content</h5>
+                <a href="{{ url_for('add_content') }}" class="btn btn-sm btn-primary">Add New</a>
+            </div>
+            <div class="card-body">
+                <form id="content-filters" class="row g-2 mb-3">
+                    <div class="col">
+                        <input type="search" name="q" class="form-control form-control-sm" placeholder="Search name">
+                    </div>
+                    <div class="col">
+                        <select name="type" class="form-select form-select-sm">
+                            <option value="">All types</option>
+                            <option value="url">External URL</option>
+                            <option value="local">Local File</option>
+                            <option value="html">HTML Content</option>
+                        </select>
+                    </div>
+                    <div class="col">
+                        <select name="flag" class="form-select form-select-sm">
+                            <option value="">Any</option>
+                            <option value="is_default">Default</option>
+                            <option value="is_offline">Offline</option>
+                        </select>
+                    </div>
+                </form>
+                <div class="table-responsive">
+                    <table class="table table-striped">
+                        <thead>
+                            <tr>
+                                <th>Name</th>
+                                <th>Type</th>
+                                <th>Default</th>
+                                <th>Offline</th>
+                                <th>Actions</th>
+                            </tr>
+                        </thead>
+                        <tbody id="content-rows"></tbody>
+                    </table>
+                </div>
+                <button type="button" id="content-more" class="btn btn-sm btn-outline-secondary d-none">Load more</button>
+            </div>
+        </div>
+    </div>
+    <div class="col-md-6">
+        <div class="card">
+            <div class="card-header d-flex justify-content-between align-items-center">
+                <h5>Schedule</h5>
+                <a href="{{ url_for('add_schedule') }}" class="btn btn-sm btn-primary">Add New</a>
+            </div>
+            <div class="card-body">
+                <form id="schedule-filters" class="row g-2 mb-3">
+                    <div class="col">
+                        <select name="day" class="form-select form-select-sm">
+                            <option value="">Every day</option>
+                            {% for day in day_names %}
+                            <option value="{{ day }}">{{ day|capitalize }}</option>
+                            {% endfor %}
+                        </select>
+                    </div>
+                    <div class="col">
+                        <input type="number" name="content_id" class="form-control form-control-sm" placeholder="Content ID" min="1">
+                    </div>
+                </form>
+                <div class="table-responsive">
+                    <table class="table table-striped">
+                        <thead>
+                            <tr>
+                                <th>Content</th>
+                                <th>Day</th>
+                                <th>Time</th>
+                                <th>Priority</th>
+                                <th>Actions</th>
+                            </tr>
+                        </thead>
+                        <tbody id="schedule-rows"></tbody>
+                    </table>
+                </div>
+                <button type="button" id="schedule-more" class="btn btn-sm btn-outline-secondary d-none">Load more</button>
+            </div>
+        </div>
+    </div>
+</div>
+{% endblock %}
+
+{% block scripts %}
+<script>
+// Tables load a page at a time from the JSON API; "Load more" follows the cursor
+function cell(row, text, badge) {
+    const td = row.insertCell();
+    if (badge) {
+        if (text) {
+            const span = document.createElement('span');
+            span.className = 'badge ' + badge;
+            span.textContent = 'Yes';
+            td.appendChild(span);
+        }
+    } else {
+        td.textContent = text;
+    }
+    return td;
+}
+
+function actions(row, editUrl, deleteUrl) {
+    const td = row.insertCell();
+    const edit = document.createElement('a');
+    edit.href = editUrl;
+    edit.className = 'btn btn-sm btn-info me-1';
+    edit.textContent = 'Edit';
+    const form = document.createElement('form');
+    form.method = 'post';
+    form.action = deleteUrl;
+    form.className = 'd-inline';
+    form.onsubmit = () => confirm('Are you sure?');
+    const button = document.createElement('button');
+    button.type = 'submit';
+    button.className = 'btn btn-sm btn-danger';
+    button.textContent = 'Delete';
+    form.appendChild(button);
+    td.append(edit, form);
+}
+
+function pagedTable(endpoint, filters, rows, more, emptyText, render) {
+    let cursor = null;
+    let generation = 0;
+
+    async function load(reset) {
+        if (reset) {
+            cursor = null;
+            generation++;
+        }
+        const current = generation;
+        const params = new URLSearchParams({limit: {{ page_size }}});
+        for (const [name, value] of new FormData(filters)) {
+            if (!value) continue;
+            if (name === 'flag') params.set(value, '1'); else params.set(name, value);
+        }
+        if (cursor !== null) params.set('after', cursor);
+
+        const response = await fetch(endpoint + '?' + params, {credentials: 'same-origin'});
+        if (current !== generation) return;  // A newer filter change won
+        const page = await response.json();
+        if (reset) rows.replaceChildren();
+        page.items.forEach(item => render(rows.insertRow(), item));
+        if (!rows.rows.length) {
+            const td = rows.insertRow().insertCell();
+            td.colSpan = 5;
+            td.className = 'text-center';
+            td.textContent = emptyText;
+        }
+        cursor = page.next;
+        more.classList.toggle('d-none', cursor === null);
+    }
+
+    let timer = null;
+    filters.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(() => load(true), 250);
+    });
+    filters.addEventListener('submit', event => event.preventDefault());
+    more.addEventListener('click', () => load(false));
+    load(true);
+}
+
+const editContentUrl = "{{ url_for('edit_content', id=0) }}".slice(0, -1);
+const deleteContentUrl = "{{ url_for('delete_content', id=0) }}".slice(0, -1);
+const editScheduleUrl = "{{ url_for('edit_schedule', id=0) }}".slice(0, -1);
+const deleteScheduleUrl = "{{ url_for('delete_schedule', id=0) }}".slice(0, -1);
+
+pagedTable("{{ url_for('api_content') }}", document.getElementById('content-filters'),
+    document.getElementById('content-rows'), document.getElementById('content-more'),
+    'No content added yet', (row, content) => {
+        cell(row, content.name);
+        cell(row, content.type);
+        cell(row, content.is_default, 'bg-success');
+        cell(row, content.is_offline, 'bg-warning');
+        actions(row, editContentUrl + content.id, deleteContentUrl + content.id);
+    });
+
+pagedTable("{{ url_for('api_schedule') }}", document.getElementById('schedule-filters'),
+    document.getElementById('schedule-rows'), document.getElementById('schedule-more'),
+    'No schedules added yet', (row, schedule) => {
+        const day = schedule.day_of_week || '';
+        cell(row, schedule.content_name);
+        cell(row, day.charAt(0).toUpperCase() + day.slice(1).toLowerCase());
+        cell(row, schedule.start_time + ' - ' + schedule.end_time);
+        cell(row, schedule.priority);
+        actions(row, editScheduleUrl + schedule.id, deleteScheduleUrl + schedule.id);
+    });
+</script>
+{% endblock %}''')
+    
+    # Create slow requests template
+    with open(os.path.join(templates_dir, 'slow_requests.html'), 'w') as f:
+        f.write('''{% extends "base.html" %}
+
+{% block title %}Slow Requests - Kiosk Admin Panel{% endblock %}
+
+{% block content %}
+<h2>Slow Requests</h2>
+
+{% if not enabled %}
+<div class="alert alert-secondary">
+    Profiling is off. Restart the admin panel with <code>KIOSK_PROFILING=1</code> to record requests slower than {{ threshold_ms }}ms.
+</div>
+{% else %}
+<p>Requests slower than {{ threshold_ms }}ms, slowest first. Profiles and slow SQL statements are written to <code>{{ profile_log }}</code>.</p>
+{% endif %}
+
+<div class="table-responsive">
+    <table class="table table-striped">
+        <thead>
+            <tr>
+                <th>Time</th>
+                <th>Request</th>
+                <th>Status</th>
+                <th>Duration</th>
+                <th>SQL</th>
+                <th>Profiled</th>
+            </tr>
+        </thead>
+        <tbody>
+            {% for entry in requests %}
+            <tr>
+                <td>{{ entry.at }}</td>
+                <td><code>{{ entry.method }} {{ entry.path }}</code></td>
+                <td>{{ entry.status }}</td>
+                <td>{{ entry.duration_ms }}ms</td>
+                <td>{{ entry.sql_ms }}ms ({{ entry.queries }} queries)</td>
+                <td>{% if entry.profiled %}<span class="badge bg-success">Yes</span>{% else %}<span class="badge bg-secondary">No</span>{% endif %}</td>
+            </tr>
+            {% else %}
+            <tr>
+                <td colspan="6" class="text-center">No slow requests recorded</td>
+            </tr>
+            {% endfor %}
+        </tbody>
+    </table>
+</div>
+{% endblock %}''')
+    
+    # Create add content template
+    with open(os.path.join(templates_dir, 'add_content.html'), 'w') as f:
+        f.write('''{% extends "base.html" %}
+
+{% block title %}Add Content - Kiosk Admin Panel{% endblock %}
+
+{% block content %}
+<h2>Add Content</h2>
+
+<div class="card">
+    <div class="card-body">
+        <form method="post" enctype="multipart/form-data" id="content-form">
+            <div class="mb-3">
+                <label for="name" class="form-label">Name</label>
+                <input type="text" class="form-control" id="name" name="name" required>
+            </div>
+            
+            <div class="mb-3">
+                <label for="type" class="form-label">Content Type</label>
+                <select class="form-select" id="type" name="type" required>
+                    <option value="url">External URL</option>
+                    <option value="local">Local File</option>
+                    <option value="html">HTML Content</option>
+                </select>
+            </div>
+            
+            <div class="mb-3">
+                <label for="url" class="form-label">URL</label>
+                <input type="text" class="form-control" id="url" name="url" 
+                       placeholder="https://example.com or file:///path/to/file.html">
+                <small class="form-text text-muted">For external content, provide full URL. For local content, this will be auto-filled when you upload a file.</small>
+            </div>
+            
+            <div class="mb-3">
+                <label for="file" class="form-label">Upload File</label>
+                <input type="file" class="form-control" id="file" name="file">
+                <small class="form-text text-muted">Upload HTML files, videos, or images for local content.</small>
+            </div>
+            
+            <div class="mb-3 form-check">
+                <input type="checkbox" class="form-check-input" id="is_default" name="is_default">
+                <label class="form-check-label" for="is_default">Set as Default Online Content</label>
+            </div>
+            
+            <div class="mb-3 form-check">
+                <input type="checkbox" class="form-check-input" id="is_offline" name="is_offline">
+                <label class="form-check-label" for="is_offline">Set as Default Offline Content</label>
+            </div>
+            
+            <button type="submit" class="btn btn-primary">Add Content</button>
+            <a href="{{ url_for('dashboard') }}" class="btn btn-secondary">Cancel</a>
+        </form>
+        
+        <div class="progress mt-3 d-none" id="upload-progress">
+            <div class="progress-bar" role="progressbar" style="width: 0%"></div>
+        </div>
+        
+        <script>
+        (function () {
+            // Large files go through the resumable chunked upload API instead of one big POST
+            const CHUNK_SIZE = {{ chunk_size }};
+            const THRESHOLD = {{ chunked_upload_threshold }};
+            const form = document.getElementById('content-form');
+            const submit = form.querySelector('button[type=submit]');
+            const progress = document.getElementById('upload-progress');
+            const bar = progress.querySelector('.progress-bar');
+            
+            async function sha256(blob) {
+                // crypto.subtle only exists in secure contexts (https or localhost)
+                if (!window.crypto || !crypto.subtle) return null;
+                const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+                return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+            }
+            
+            async function send(method, url, body, headers) {
+                // Retry network errors, server errors and checksum mismatches with backoff
+                for (let attempt = 1; ; attempt++) {
+                    try {
+                        const response = await fetch(url, {method, body, headers, credentials: 'same-origin'});
+                        if (attempt >= 5 || (response.status < 500 && response.status !== 422)) return response;
+                    } catch (error) {
+                        if (attempt >= 5) throw error;
+                    }
+                    await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+                }
+            }
+            
+            async function openSession(file) {
+                const key = ['chunked-upload', file.name, file.size, file.lastModified].join(':');
+                const saved = localStorage.getItem(key);
+                if (saved) {
+                    const response = await send('GET', `/api/uploads/${saved}`);
+                    if (response.ok) return [key, await response.json()];
+                }
+                const response = await send('POST', '/api/uploads',
+                    JSON.stringify({filename: file.name, size: file.size, chunk_size: CHUNK_SIZE}),
+                    {'Content-Type': 'application/json'});
+                const upload = await response.json();
+                if (!response.ok) throw new Error(upload.error);
+                localStorage.setItem(key, upload.upload_id);
+                return [key, upload];
+            }
+            
+            form.addEventListener('submit', async function (event) {
+                const file = form.elements.file.files[0];
+                if (!file || file.size < THRESHOLD) return;
+                event.preventDefault();
+                submit.disabled = true;
+                progress.classList.remove('d-none');
+                
+                try {
+                    const [key, upload] = await openSession(file);
+                    const received = new Set(upload.received);
+                    for (let index = 0; index < upload.chunk_count; index++) {
+                        if (!received.has(index)) {
+                            const chunk = file.slice(index * upload.chunk_size, (index + 1) * upload.chunk_size);
+                            const headers = {'Content-Type': 'application/octet-stream'};
+                            const checksum = await sha256(chunk);
+                            if (checksum) headers['X-Chunk-SHA256'] = checksum;
+                            const response = await send('PUT', `/api/uploads/${upload.upload_id}/chunks/${index}`, chunk, headers);
+                            if (!response.ok) throw new Error((await response.json()).error);
+                        }
+                        bar.style.width = `${Math.round((index + 1) * 100 / upload.chunk_count)}%`;
+                    }
+                    
+                    const fields = new FormData(form);
+                    fields.delete('file');
+                    const response = await send('POST', `/api/uploads/${upload.upload_id}/complete`, fields);
+                    const result = await response.json();
+                    if (!response.ok) throw new Error(result.error);
+                    localStorage.removeItem(key);
+                    window.location = result.redirect;
+                } catch (error) {
+                    alert(`Upload interrupted: ${error.message}. Submit again to resume.`);
+                    submit.disabled = false;
+                }
+            });
+        })();
+        </script>
     </div>
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""Shared fixtures: the admin panel and the portal server, loaded from this tree.
+
+The admin panel is imported the way tools/benchmark.py does it: a copy in a
+temporary KIOSK_HOME, so tests never touch /home/kiosk.
+"""
+
+import importlib.util
+import pathlib
+import sys
+import threading
+
+import pytest
+
+TOOLS = pathlib.Path(__file__).resolve().parent.parent / "tools"
+sys.path.insert(0, str(TOOLS))
+
+import benchmark  # noqa: E402
+
+@pytest.fixture(scope="session")
+def panel(tmp_path_factory):
+    module = benchmark.load_admin_panel(benchmark.ADMIN_PANEL, tmp_path_factory.mktemp("kiosk-home"))
+    yield module
+    media_pool = getattr(module, "media_pool", None)
+    if media_pool is not None and media_pool.executor is not None:
+        media_pool.executor.shutdown(wait=True)
+
+@pytest.fixture
+def client(panel):
+    client = panel.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+        session["username"] = "test"
+    return client
+
+@pytest.fixture(scope="session")
+def portal():
+    spec = importlib.util.spec_from_file_location("serve_portal", TOOLS / "serve_portal.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def portal_server(portal):
+    """A portal server on a free port with the asset cache; yields the port"""
+    class QuietHandler(portal.Handler):
+        def log_message(self, format, *args):
+            pass
+
+    assets = portal.AssetCache(portal.ROOT, portal.CACHED_ASSETS)
+    server = portal.PortalServer(("127.0.0.1", 0), QuietHandler, 4, assets)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
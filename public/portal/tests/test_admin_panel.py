@@ -0,0 +1,474 @@
+"""Admin panel behaviour, tested against a throwaway KIOSK_HOME"""
+
+import hashlib
+import itertools
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from werkzeug.serving import make_server
+
+# Schedule index
+MONDAY = (2024, 1, 1)  # Weekday 0
+
+def schedule_content():
+    return {
+        1: {"id": 1, "name": "Morning", "type": "local", "is_default": 0},
+        2: {"id": 2, "name": "Promo", "type": "local", "is_default": 0},
+        3: {"id": 3, "name": "Default", "type": "local", "is_default": 1},
+    }
+
+def schedule_row(id, content_id, days, start, end, priority=1, group_id=None):
+    """A schedule row as the database stores it; ``end`` is inclusive to the minute"""
+    day_mask = sum(1 << day for day in days)
+    return {"id": id, "content_id": content_id, "day_mask": day_mask, "priority": priority,
+            "start_minute": start, "end_minute": end, "group_id": group_id}
+
+def at(panel, day, hour, minute=0):
+    return panel.datetime(*MONDAY) + panel.timedelta(days=day, hours=hour, minutes=minute)
+
+def shown(panel, index, when):
+    return index.content_for(index.segment(when))["name"]
+
+def test_slot_past_midnight_wraps_into_next_week(panel):
+    # Sunday 22:00 to 01:59
+    index = panel.ScheduleIndex(schedule_content(), [schedule_row(1, 1, [6], 22 * 60, 119)])
+    assert shown(panel, index, at(panel, 6, 21, 59)) == "Default"
+    assert shown(panel, index, at(panel, 6, 23)) == "Morning"
+    assert shown(panel, index, at(panel, 0, 1, 30)) == "Morning"  # Monday of the same week
+    assert shown(panel, index, at(panel, 0, 2)) == "Default"
+    assert index.next_transition(at(panel, 6, 23), index.segment(at(panel, 6, 23))) == at(panel, 7, 2)
+
+def test_higher_priority_wins_overlap(panel):
+    index = panel.ScheduleIndex(schedule_content(), [
+        schedule_row(1, 1, [0], 8 * 60, 12 * 60 - 1, priority=1),
+        schedule_row(2, 2, [0], 10 * 60, 10 * 60 + 29, priority=5),
+    ])
+    assert shown(panel, index, at(panel, 0, 9)) == "Morning"
+    assert shown(panel, index, at(panel, 0, 10, 15)) == "Promo"
+    assert shown(panel, index, at(panel, 0, 10, 30)) == "Morning"
+    assert shown(panel, index, at(panel, 0, 12)) == "Default"
+
+def test_equal_priority_goes_to_older_row(panel):
+    index = panel.ScheduleIndex(schedule_content(), [
+        schedule_row(7, 2, [2], 9 * 60, 9 * 60 + 59),
+        schedule_row(4, 1, [2], 9 * 60, 9 * 60 + 59),
+    ])
+    assert shown(panel, index, at(panel, 2, 9, 30)) == "Morning"
+
+def test_empty_schedule_never_changes(panel):
+    index = panel.ScheduleIndex(schedule_content(), [])
+    assert shown(panel, index, at(panel, 3, 12)) == "Default"
+    assert index.next_transition(at(panel, 3, 12), 0) is None
+
+def test_group_schedules_apply_to_their_kiosks_only(panel):
+    rows = [
+        schedule_row(1, 1, range(7), 0, 1439),
+        schedule_row(2, 2, range(7), 9 * 60, 9 * 60 + 59, priority=5, group_id=10),
+    ]
+    kiosks = [{"id": "lobby-1", "group_id": 10}, {"id": "hall-1", "group_id": 20}, {"id": "spare", "group_id": None}]
+    fleet = panel.FleetSchedule(schedule_content().values(), rows, kiosks, [{"id": 10}, {"id": 20}])
+    nine = at(panel, 1, 9, 30)
+    assert shown(panel, fleet.for_kiosk("lobby-1"), nine) == "Promo"
+    assert shown(panel, fleet.for_kiosk("hall-1"), nine) == "Morning"  # Group without own rows
+    assert shown(panel, fleet.for_kiosk("spare"), nine) == "Morning"
+    assert shown(panel, fleet.for_kiosk("unregistered"), nine) == "Morning"
+    assert shown(panel, fleet.for_kiosk("lobby-1"), at(panel, 1, 10)) == "Morning"
+
+# Playback timeline
+def test_timeline_lists_each_visible_change(panel):
+    content = schedule_content()
+    index = panel.ScheduleIndex(content, [
+        schedule_row(1, 1, [0], 9 * 60, 9 * 60 + 59),
+        schedule_row(2, 3, [0], 12 * 60, 12 * 60 + 59),  # Default content: no visible change
+    ])
+    transitions = index.timeline(at(panel, 0, 8, 0) + panel.timedelta(seconds=42), 1)
+    assert [(when.hour, content["name"]) for when, content in transitions] == [
+        (8, "Default"), (9, "Morning"), (10, "Default")]
+    assert transitions[0][0] == at(panel, 0, 8)  # Rounded down to the minute
+
+def test_timeline_tsv_export(panel):
+    start = at(panel, 0, 8)
+    timeline = {"transitions": [
+        {"epoch": int(start.timestamp()), "content": {"is_offline": 0, "url": "https://example.com/a"}},
+        {"epoch": int(start.timestamp()) + 3600, "content": {"is_offline": 1, "url": "file:///b.html"}},
+    ]}
+    assert panel.timeline_tsv(timeline) == (
+        f"{int(start.timestamp())}\t0\thttps://example.com/a\n"
+        f"{int(start.timestamp()) + 3600}\t1\tfile:///b.html\n")
+
+def test_timeline_api_and_command(panel, client):
+    assert client.get("/api/timeline?days=0").status_code == 400
+    response = client.get("/api/timeline?days=2&format=tsv")
+    assert response.mimetype == "text/tab-separated-values"
+    assert response.get_data(as_text=True).count("\t") >= 2
+
+    result = panel.app.test_cli_runner().invoke(args=["timeline", "--days", "2"])
+    assert result.exit_code == 0
+    timeline = panel.json.loads(result.output)
+    assert timeline["transitions"][0]["content"]["url"]
+
+# Kiosk config
+def test_publish_bumps_config_version(panel, client):
+    before = panel.read_config()["version"]
+    version = panel.update_config_file("https://example.com/main", "file:///offline.html")
+    assert version == before + 1
+    config = client.get("/api/config").get_json()
+    assert config == {"version": version, "main_page": "https://example.com/main",
+                      "offline_video_page": "file:///offline.html"}
+
+def test_config_long_poll(panel, client):
+    version = panel.update_config_file("https://example.com/a", "")
+    assert client.get(f"/api/config?since={version - 1}").status_code == 200
+    assert client.get(f"/api/config?since={version}&wait=0").status_code == 304
+
+    def publish():
+        time.sleep(0.2)
+        panel.update_config_file("https://example.com/b", "")
+
+    threading.Thread(target=publish).start()
+    response = client.get(f"/api/config?since={version}&wait=5")
+    assert response.status_code == 200
+    assert response.get_json()["version"] == version + 1
+
+def test_config_long_polls_past_the_cap_are_told_to_retry(panel, client):
+    version = panel.read_config()["version"]
+    for _ in range(panel.CONFIG_WAITERS_MAX):
+        panel._config_waiters.acquire()
+    try:
+        response = client.get(f"/api/config?since={version}&wait=5")
+    finally:
+        for _ in range(panel.CONFIG_WAITERS_MAX):
+            panel._config_waiters.release()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(panel.CONFIG_RETRY_AFTER)
+    assert client.get(f"/api/config?since={version - 1}").status_code == 200  # Changes still answered
+
+# Connection pool
+def test_late_release_leaves_reacquired_connection_alone(panel):
+    with panel.app.test_request_context("/"):
+        conn = panel.get_db_connection()
+        conn.close()
+
+        taken = []
+
+        def other_request():
+            other = panel.db_pool.acquire()
+            other.execute("BEGIN IMMEDIATE")
+            taken.append(other)
+
+        thread = threading.Thread(target=other_request)
+        thread.start()
+        thread.join()
+        assert taken == [conn]
+
+        panel.release_db_connections(None)  # Teardown of the first request
+        assert conn.in_transaction
+        assert conn in panel.db_pool.checked_out
+        conn.rollback()
+        conn.close()
+    assert conn not in panel.db_pool.checked_out
+
+def test_teardown_releases_unclosed_connection(panel):
+    with panel.app.test_request_context("/"):
+        conn = panel.get_db_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        panel.release_db_connections(None)
+    assert conn not in panel.db_pool.checked_out
+    assert not conn.in_transaction
+
+# Chunked uploads
+def chunked_upload(client, name, data, chunk_size):
+    response = client.post("/api/uploads", json={"filename": name, "size": len(data), "chunk_size": chunk_size})
+    assert response.status_code == 201
+    upload_id = response.get_json()["upload_id"]
+    for index, offset in enumerate(range(0, len(data), chunk_size)):
+        chunk = data[offset:offset + chunk_size]
+        response = client.put(f"/api/uploads/{upload_id}/chunks/{index}", data=chunk,
+                              headers={"X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest()})
+        assert response.status_code == 200
+    return upload_id
+
+def test_chunked_upload_stores_file_sha256(panel, client):
+    data = os.urandom(250_000)
+    upload_id = chunked_upload(client, "chunked.bin", data, 100_000)
+
+    response = client.post(f"/api/uploads/{upload_id}/complete", json={"name": "Chunked", "type": "local"})
+    assert response.status_code == 200
+    result = response.get_json()
+    with open(result["file_path"], "rb") as f:
+        assert f.read() == data
+
+    conn = panel.get_db_connection()
+    row = conn.execute("SELECT etag FROM content WHERE id = ?", (result["content_id"],)).fetchone()
+    conn.close()
+    assert row["etag"] == hashlib.sha256(data).hexdigest()
+    assert not os.path.exists(panel.upload_part_path(upload_id))
+
+def test_incomplete_upload_is_refused(client):
+    response = client.post("/api/uploads", json={"filename": "partial.bin", "size": 200, "chunk_size": 100})
+    upload_id = response.get_json()["upload_id"]
+    client.put(f"/api/uploads/{upload_id}/chunks/0", data=b"x" * 100)
+
+    response = client.post(f"/api/uploads/{upload_id}/complete", json={"name": "Partial"})
+    assert response.status_code == 409
+
+def test_chunk_checksum_mismatch_is_rejected(client):
+    response = client.post("/api/uploads", json={"filename": "bad.bin", "size": 10, "chunk_size": 10})
+    upload_id = response.get_json()["upload_id"]
+    response = client.put(f"/api/uploads/{upload_id}/chunks/0", data=b"0123456789",
+                          headers={"X-Chunk-SHA256": "0" * 64})
+    assert response.status_code == 422
+
+# Media processing
+class BrokenPool:
+    """Stands in for a ProcessPoolExecutor whose workers died"""
+
+    def submit(self, *args):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+    def shutdown(self, wait=True):
+        pass
+
+def upload_content(client, name):
+    upload_id = chunked_upload(client, name, os.urandom(1000), 1000)
+    response = client.post(f"/api/uploads/{upload_id}/complete", json={"name": name, "type": "local"})
+    assert response.status_code == 200
+    return response.get_json()["content_id"]
+
+def wait_for_job(client, content_id):
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/content/{content_id}/media").get_json()["job"]
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError("media job never finished")
+
+def test_broken_media_pool_is_replaced(panel, client):
+    broken = panel.media_pool.executor = BrokenPool()
+    content_id = upload_content(client, "after-crash.bin")
+    assert panel.media_pool.executor is not broken
+    assert wait_for_job(client, content_id)["status"] == "done"
+
+def test_media_job_fails_when_new_pool_breaks_too(panel, client, monkeypatch):
+    monkeypatch.setattr(panel.media_pool, "_get_executor", BrokenPool)
+    content_id = upload_content(client, "still-broken.bin")
+    job = wait_for_job(client, content_id)
+    assert job["status"] == "failed"
+    assert job["error"].startswith("BrokenProcessPool")
+
+# Content sync
+def sync_data(size):
+    """Random bytes with the zero bytes that chunk boundaries are cut after"""
+    return os.urandom(size).replace(b"\x01", b"\x00")
+
+def test_edit_leaves_distant_chunks_alone(panel, tmp_path):
+    data = sync_data(6 * 1024 * 1024)
+    edited = data[:3_000_000] + b"inserted" + data[3_000_000:]
+    original, changed = tmp_path / "original.bin", tmp_path / "edited.bin"
+    original.write_bytes(data)
+    changed.write_bytes(edited)
+
+    sha256, chunks = panel.file_chunks(str(original))
+    assert sha256 == hashlib.sha256(data).hexdigest()
+    assert [offset for offset, _, _ in chunks] == [0] + list(itertools.accumulate(c[1] for c in chunks[:-1]))
+    assert all(length <= panel.SYNC_CHUNK_MAX for _, length, _ in chunks)
+    _, edited_chunks = panel.file_chunks(str(changed))
+    shared = {c[2] for c in chunks} & {c[2] for c in edited_chunks}
+    assert len(shared) >= len(chunks) - 2
+
+@pytest.fixture
+def panel_url(panel):
+    server = make_server("127.0.0.1", 0, panel.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+def test_sync_downloads_only_changed_chunks(panel, client, panel_url, tmp_path):
+    data = sync_data(12 * 1024 * 1024)
+    upload_id = chunked_upload(client, "synced.bin", data, 4 * 1024 * 1024)
+    response = client.post(f"/api/uploads/{upload_id}/complete", json={"name": "Synced", "type": "local"})
+    assert wait_for_job(client, response.get_json()["content_id"])["status"] == "done"
+
+    stale = bytearray(data)
+    stale[6_000_000:6_000_100] = os.urandom(100)
+    (tmp_path / "synced.bin").write_bytes(stale)
+    sync = panel.ContentSync(panel_url, str(tmp_path))
+    assert sync.run(lambda message: None) == 0
+    assert (tmp_path / "synced.bin").read_bytes() == data
+    assert sync.reused >= len(data) - 2 * panel.SYNC_CHUNK_MAX  # The edit touches at most two chunks
+
+    again = panel.ContentSync(panel_url, str(tmp_path))
+    assert again.run(lambda message: None) == 0
+    assert again.downloaded == 0
+
+# Byte ranges
+@pytest.fixture
+def served_file(panel, client):
+    """A file uploaded through the chunked API, so it has a strong ETag"""
+    data = os.urandom(10_000)
+    upload_id = chunked_upload(client, "ranged.bin", data, 10_000)
+    client.post(f"/api/uploads/{upload_id}/complete", json={"name": "Ranged", "type": "local"})
+    return data
+
+def test_range_returns_partial_content(client, served_file):
+    response = client.get("/content/ranged.bin", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(served_file)}"
+    assert response.data == served_file[100:200]
+
+def test_suffix_range(client, served_file):
+    response = client.get("/content/ranged.bin", headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.data == served_file[-10:]
+
+def test_unsatisfiable_range(client, served_file):
+    response = client.get("/content/ranged.bin", headers={"Range": f"bytes={len(served_file)}-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(served_file)}"
+
+def test_if_range_with_current_etag_returns_range(client, served_file):
+    etag = hashlib.sha256(served_file).hexdigest()
+    response = client.get("/content/ranged.bin", headers={"Range": "bytes=0-9", "If-Range": f'"{etag}"'})
+    assert response.status_code == 206
+    assert response.data == served_file[:10]
+
+def test_if_range_with_stale_etag_returns_whole_file(client, served_file):
+    response = client.get("/content/ranged.bin", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.data == served_file
+
+def test_if_none_match_returns_not_modified(client, served_file):
+    etag = hashlib.sha256(served_file).hexdigest()
+    response = client.get("/content/ranged.bin", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+
+def test_ranges_are_counted_as_they_are_sent(panel, client, served_file):
+    series = panel.metrics.metrics["kiosk_content_bytes_served_total"][4]
+    before = series.get(("read",), 0)
+    response = client.get("/content/ranged.bin", headers={"Range": "bytes=0-99"})
+    assert series.get(("read",), 0) == before + 100
+    assert len(response.data) == 100
+
+# Write-behind queues
+def flaky_flush(panel, failures):
+    """A flush that reports a locked database ``failures`` times, then succeeds; records every attempt"""
+    attempts = []
+
+    def flush(batch):
+        attempts.append(batch)
+        if len(attempts) <= failures:
+            raise panel.sqlite3.OperationalError("database is locked")
+
+    return flush, attempts
+
+def test_locked_database_is_retried(panel):
+    flush, attempts = flaky_flush(panel, 2)
+    queue = panel.WriteBehindQueue(flush, 60, 10, 100, retries=3, retry_delay=0.01)
+    queue.pending = [{"n": n} for n in range(5)]
+    queue.drain()
+    assert attempts == [[{"n": n} for n in range(5)]] * 3
+    assert queue.get_stats() == {"pending": 0, "written": 5, "dropped": 0, "retried": 2, "failed": 0}
+
+def test_batch_is_dropped_after_last_retry(panel):
+    flush, attempts = flaky_flush(panel, 10)
+    queue = panel.WriteBehindQueue(flush, 60, 10, 100, retries=2, retry_delay=0.01)
+    queue.pending = [{"n": 1}]
+    queue.drain()
+    assert len(attempts) == 3
+    assert queue.get_stats()["failed"] == 1
+    assert queue.get_stats()["written"] == 0
+
+# Kiosk health
+def wait_for_status(panel, client, kiosk_id):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        panel.heartbeat_queue.drain()
+        kiosks = client.get("/api/kiosks/status").get_json()["kiosks"]
+        found = [kiosk for kiosk in kiosks if kiosk["kiosk_id"] == kiosk_id]
+        if found:
+            return found[0]
+        time.sleep(0.05)
+    raise AssertionError(f"{kiosk_id} never reported")
+
+def test_heartbeats_are_stored_and_rolled_up(panel, client):
+    beats = [{"cpu_load": 1.0, "temperature": 50, "chrome_running": True, "mode": "online"},
+             {"cpu_load": 3.0, "temperature": 70, "chrome_running": False, "mode": "offline"}]
+    assert client.post("/api/heartbeat?kiosk=hb-1", json=beats).status_code == 202
+
+    status = wait_for_status(panel, client, "hb-1")
+    assert not status["stale"]
+    buckets = client.get("/api/kiosks/hb-1/health?resolution=minute").get_json()["buckets"]
+    assert sum(bucket["samples"] for bucket in buckets) == 2
+    assert max(bucket["temperature_max"] for bucket in buckets) == 70
+
+def test_invalid_heartbeat_is_rejected(client):
+    assert client.post("/api/heartbeat", json={"cpu_load": 1}).status_code == 400  # No kiosk id
+    assert client.post("/api/heartbeat?kiosk=hb-2", json={"cpu_load": "hot"}).status_code == 400
+
+# Content prefetch
+def test_finished_prefetch_copies_are_served(panel, client):
+    key = panel.ContentPrefetcher.key("https://example.com/page")
+    for folder in (key, f"{key}.123.tmp"):
+        os.makedirs(os.path.join(panel.PREFETCH_FOLDER, folder, "assets"), exist_ok=True)
+        for name in ("index.html", "manifest.json", "assets/app.js"):
+            with open(os.path.join(panel.PREFETCH_FOLDER, folder, name), "w") as f:
+                f.write(name)
+
+    assert client.get(f"/content/.prefetch/{key}/index.html").data == b"index.html"
+    assert client.get(f"/content/.prefetch/{key}/assets/app.js").status_code == 200
+    assert client.get(f"/content/.prefetch/{key}/manifest.json").status_code == 404
+    assert client.get(f"/content/.prefetch/{key}.123.tmp/index.html").status_code == 404
+
+# Proof of play
+def play_event(kiosk_id, started_at, duration, content_id=5):
+    return {"kiosk_id": kiosk_id, "content_id": content_id, "url": None,
+            "started_at": started_at, "ended_at": started_at + duration, "offline": 0}
+
+def daily_seconds(panel, kiosk_id):
+    conn = panel.get_db_connection()
+    row = conn.execute("""
+        SELECT SUM(d.seconds) AS seconds FROM play_daily d JOIN play_kiosks k ON k.id = d.kiosk
+        WHERE k.kiosk_id = ?
+    """, (kiosk_id,)).fetchone()
+    conn.close()
+    return row["seconds"]
+
+def test_resent_play_events_are_counted_once(panel):
+    started_at = int(time.time()) - 3600
+    batch = [play_event("kiosk-resend", started_at, 60)]
+    panel.write_play_events(batch)
+    panel.write_play_events(batch)
+    assert daily_seconds(panel, "kiosk-resend") == 60
+
+def test_failed_play_batch_does_not_poison_caches(panel):
+    started_at = int(time.time()) - 7200
+    day = panel.play_day(panel.datetime.fromtimestamp(started_at).date())
+    conn = panel.get_db_connection()
+    conn.execute(f"DROP TABLE IF EXISTS {panel.play_partition(day)}")
+    conn.execute("ALTER TABLE play_daily RENAME TO play_daily_saved")
+    conn.commit()
+    conn.close()
+    panel._play_partitions.clear()
+    try:
+        with pytest.raises(panel.sqlite3.OperationalError):
+            panel.write_play_events([play_event("kiosk-rollback", started_at, 30)])
+    finally:
+        conn = panel.get_db_connection()
+        conn.execute("ALTER TABLE play_daily_saved RENAME TO play_daily")
+        conn.commit()
+        conn.close()
+    assert "kiosk-rollback" not in panel._play_kiosks
+    assert panel.play_partition(day) not in panel._play_partitions
+
+    panel.write_play_events([play_event("kiosk-rollback", started_at, 30)])
+    assert daily_seconds(panel, "kiosk-rollback") == 30
+
+def test_play_events_of_a_day_without_table(client):
+    response = client.get("/api/play-events/2001-01-01")
+    assert response.status_code == 200
+    assert response.get_json()["items"] == []
@@ -0,0 +1,79 @@
+"""Portal server: byte ranges and keep-alive connections"""
+
+import contextlib
+import http.client
+import threading
+import time
+
+PDF = "/BrandM3dia_Kiosk_Scenario_Router_OnePager.pdf"
+
+def test_range_request(portal, portal_server):
+    data = (portal.ROOT / PDF.lstrip("/")).read_bytes()
+    conn = http.client.HTTPConnection("127.0.0.1", portal_server, timeout=5)
+    conn.request("GET", PDF, headers={"Range": "bytes=10-19"})
+    response = conn.getresponse()
+    assert response.status == 206
+    assert response.getheader("Content-Range") == f"bytes 10-19/{len(data)}"
+    assert response.read() == data[10:20]
+
+def test_unsatisfiable_range(portal, portal_server):
+    size = (portal.ROOT / PDF.lstrip("/")).stat().st_size
+    conn = http.client.HTTPConnection("127.0.0.1", portal_server, timeout=5)
+    conn.request("GET", PDF, headers={"Range": f"bytes={size}-"})
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 416
+
+def test_head_does_not_leak_length_into_next_response(portal, portal_server):
+    body = (portal.ROOT / "index.html").read_bytes()
+    conn = http.client.HTTPConnection("127.0.0.1", portal_server, timeout=5)
+    conn.request("HEAD", PDF, headers={"Range": "bytes=0-0"})
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 206
+
+    conn.request("GET", "/index.html")  # Same keep-alive connection, served from the asset cache
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.read() == body
+
+@contextlib.contextmanager
+def small_server(portal, workers, queued):
+    class QuietHandler(portal.Handler):
+        def log_message(self, format, *args):
+            pass
+
+    server = portal.PortalServer(("127.0.0.1", 0), QuietHandler, workers, queued=queued)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def keep_alive_get(port, path="/index.html"):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 200
+    return conn
+
+def test_full_queue_sheds_load(portal):
+    with small_server(portal, workers=1, queued=0) as port:
+        idle = keep_alive_get(port)  # Holds the only worker
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        conn.request("GET", "/index.html")
+        response = conn.getresponse()
+        assert response.status == 503
+        assert response.getheader("Retry-After") == "1"
+        idle.close()
+
+def test_idle_keep_alive_makes_way_for_queued_connection(portal):
+    with small_server(portal, workers=1, queued=1) as port:
+        idle = keep_alive_get(port)
+        started = time.monotonic()
+        keep_alive_get(port).close()
+        assert time.monotonic() - started < portal.KEEPALIVE_TIMEOUT / 2
+        idle.close()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""BrandM3dia KioskOps - Hot-path benchmarks
+
+Why this exists:
+- The admin panel and the portal server sit on every kiosk's critical path,
+  but nothing measured them, so a slow change was only noticed in the field.
+- This script times the hot paths, writes the numbers to JSON and compares
+  them with a stored baseline, exiting 1 when something got slower.
+
+What it measures:
+- Admin panel (Flask test client, throwaway data directory):
+    get_current_content() with 10, 1k and 100k schedule rows,
+    /api/current-content throughput, dashboard render time,
+    upload throughput to UPLOAD_FOLDER
+- Portal server (a local serve_portal.py instance on a free port):
+    static asset throughput with concurrent keep-alive clients,
+    with and without the in-memory asset cache,
+    search index build time and /search query latency
+
+Usage:
+  python3 tools/benchmark.py [--admin-panel PATH] [--only admin|portal] [--quick]
+                             [--output results.json] [--baseline FILE] [--tolerance 0.25]
+                             [--update-baseline]
+
+The admin panel benchmarks need Flask. They run the copy of the admin panel
+in Scripts/ unless --admin-panel names another (e.g. the deployed
+/home/kiosk/kiosk_admin_panel.py). The in-repo copy ends part way through
+its page templates; only its application code is loaded then, and the
+dashboard render is skipped. The panel is copied into a temporary directory
+with KIOSK_HOME pointing there, so the real database and content are never
+touched. The path and SHA-256 of the code that ran are stored with the
+results, so a baseline can be traced to the exact source it came from.
+"""
+
+import argparse
+import datetime
+import hashlib
+import http.client
+import importlib.util
+import io
+import itertools
+import json
+import os
+import pathlib
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+TOOLS = pathlib.Path(__file__).resolve().parent
+ROOT = TOOLS.parent  # portal root
+BASELINE = TOOLS / "benchmark_baseline.json"
+ADMIN_PANEL = ROOT / "Scripts" / "Kiosk script" / "Scheduling script" / "Kiosk_admin_panel.py"
+TEMPLATES_MARKER = "# Create templates directory and templates"  # Where the page templates start
+TOLERANCE = 0.25  # Allowed slowdown against the baseline before a result counts as a regression
+
+SCHEDULE_SIZES = [10, 1000, 100000]
+PORTAL_ASSETS = ["/index.html", "/assets/app.js", "/assets/app.css"]
+SEARCH_QUERIES = ["kiosk", "pre rental inspection", '"kiosk mode"', "chrome update script", "wifi password"]
+
+class Results:
+    def __init__(self):
+        self.values = {}
+
+    def add(self, name, value, unit, higher_is_better=True):
+        self.values[name] = {"value": round(value, 3), "unit": unit, "higher_is_better": higher_is_better}
+        print(f"  {name:<44} {value:>14,.1f} {unit}")
+
+def timed(function, iterations):
+    """Run function() iterations times; returns per-call latencies in seconds"""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+# Admin panel
+def read_admin_panel(source):
+    """The admin panel code to run, and whether its page templates are included.
+
+    Raises ValueError when not even the application code compiles.
+    """
+    code = pathlib.Path(source).read_text(encoding="utf-8").replace("\r\n", "\n")
+    try:
+        compile(code, str(source), "exec")
+        return code, True
+    except SyntaxError as e:
+        error = e
+    if TEMPLATES_MARKER in code:
+        app_code = code[:code.index(TEMPLATES_MARKER)]
+        try:
+            compile(app_code, str(source), "exec")
+            return app_code, False
+        except SyntaxError as e:
+            error = e
+    raise ValueError(f"{source} does not compile (line {error.lineno}: {error.msg})")
+
+def load_admin_panel(source, workdir):
+    """Import a copy of the admin panel whose data directory is ``workdir``"""
+    code, complete = read_admin_panel(source)
+    os.environ["KIOSK_HOME"] = str(workdir)
+    sys.path.insert(0, str(workdir))  # Spawned media workers import the module by name
+    target = workdir / "kiosk_admin_panel.py"
+    target.write_text(code, encoding="utf-8")
+    spec = importlib.util.spec_from_file_location("kiosk_admin_panel", target)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["kiosk_admin_panel"] = module
+    spec.loader.exec_module(module)
+
+    module.PREFETCH_ENABLED = False  # No network traffic while timing
+    module.TEMPLATES_LOADED = complete
+    if complete:
+        module.create_templates()
+    module.init_db()
+    return module
+
+def fill_schedule(panel, rows):
+    """Replace the schedule with ``rows`` random slots over 50 content items"""
+    conn = panel.get_db_connection()
+    conn.execute("DELETE FROM schedule")
+    conn.execute("DELETE FROM content")
+    conn.executemany("INSERT INTO content (id, name, type, url, is_default) VALUES (?, ?, 'url', ?, ?)",
+                     [(i, f"content {i}", f"http://example.com/{i}", int(i == 1)) for i in range(1, 51)])
+    rng = random.Random(rows)
+    days = panel.DAY_NAMES + ["everyday"]
+    slots = []
+    for _ in range(rows):
+        day = rng.choice(days)
+        start = rng.randrange(0, 24 * 60)
+        end = (start + rng.randrange(15, 240)) % (24 * 60)
+        start_time, end_time = f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}"
+        slots.append((rng.randrange(1, 51), day, start_time, end_time, rng.randrange(0, 10))
+                     + panel.schedule_columns(day, start_time, end_time))
+    conn.executemany("""
+        INSERT INTO schedule (content_id, day_of_week, start_time, end_time, priority,
+                              day_mask, start_minute, end_minute)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, slots)
+    conn.commit()
+    conn.close()
+
+def bench_admin_panel(source, results, quick):
+    with tempfile.TemporaryDirectory(prefix="kiosk-bench-") as tmp:
+        try:
+            panel = load_admin_panel(source, pathlib.Path(tmp))
+        except Exception as e:  # Anything the module raises while importing
+            print(f"ERROR: cannot load the admin panel {source}: {type(e).__name__}: {e}")
+            raise SystemExit(2)
+        client = panel.app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = 1
+            session["username"] = "benchmark"
+
+        rng = random.Random(1)
+        base = datetime.datetime(2024, 1, 1)
+        moments = [base + datetime.timedelta(minutes=rng.randrange(7 * 24 * 60)) for _ in range(1000)]
+        lookups = 2000 if quick else 20000
+
+        print("Admin panel")
+        for rows in SCHEDULE_SIZES:
+            fill_schedule(panel, rows)
+            start = time.perf_counter()
+            panel.rebuild_schedule_index()
+            results.add(f"admin.schedule_rebuild.{rows}_rows", (time.perf_counter() - start) * 1000, "ms",
+                        higher_is_better=False)
+            with panel.app.app_context():
+                start = time.perf_counter()
+                for i in range(lookups):
+                    panel.get_current_content(moments[i % len(moments)])
+                elapsed = time.perf_counter() - start
+            results.add(f"admin.get_current_content.{rows}_rows", lookups / elapsed, "ops/s")
+
+        fill_schedule(panel, 1000)
+        panel.rebuild_schedule_index()
+        requests = 1000 if quick else 5000
+        latencies = timed(lambda: client.get("/api/current-content"), requests)
+        results.add("admin.api_current_content", requests / sum(latencies), "req/s")
+        results.add("admin.api_current_content.p99", percentile(latencies, 0.99) * 1000, "ms",
+                    higher_is_better=False)
+
+        if panel.TEMPLATES_LOADED:
+            renders = 50 if quick else 200
+            latencies = timed(lambda: client.get("/dashboard"), renders)
+            results.add("admin.dashboard_render", statistics.median(latencies) * 1000, "ms", higher_is_better=False)
+        else:
+            print(f"  {'admin.dashboard_render':<44} skipped (this copy has no page templates)")
+
+        size = 8 * 1024 * 1024 if quick else 64 * 1024 * 1024
+        payload = os.urandom(1024 * 1024) * (size // (1024 * 1024))
+        uploads = 3 if quick else 5
+
+        def upload():
+            response = client.post("/content/add", data={
+                "name": "benchmark upload", "type": "local", "url": "",
+                "file": (io.BytesIO(payload), "benchmark.mp4")
+            }, content_type="multipart/form-data")
+            assert response.status_code == 302, response.status_code
+
+        upload()  # Warm up (starts the media worker pool)
+        latencies = timed(upload, uploads)
+        results.add("admin.upload_throughput", size * uploads / sum(latencies) / 1e6, "MB/s")
+
+        media_pool = getattr(panel, "media_pool", None)
+        if media_pool is not None and media_pool.executor is not None:
+            media_pool.executor.shutdown(wait=True)
+
+# Portal server
+def load_portal_server():
+    spec = importlib.util.spec_from_file_location("serve_portal", TOOLS / "serve_portal.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def fetch_loop(port, paths, deadline, counts, index):
+    """One keep-alive client fetching ``paths`` round-robin until ``deadline``"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    requests = received = 0
+    headers = {"Accept-Encoding": "gzip"}
+    while time.perf_counter() < deadline:
+        connection.request("GET", paths[requests % len(paths)], headers=headers)
+        response = connection.getresponse()
+        received += len(response.read())
+        requests += 1
+    connection.close()
+    counts[index] = (requests, received)
+
+def bench_portal(results, quick):
+    portal = load_portal_server()
+    duration = 2 if quick else 5
+    clients = 16 if quick else 64
+
+    class QuietHandler(portal.Handler):
+        def log_message(self, format, *args):
+            pass  # Per-request logging would dominate the measurement
+
+    print("Portal server")
+    for label, assets in (("cached", portal.AssetCache(ROOT, portal.CACHED_ASSETS)), ("uncached", None)):
+        server = portal.PortalServer(("127.0.0.1", 0), QuietHandler, max(clients, portal.WORKERS), assets)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            port = server.server_address[1]
+            counts = [(0, 0)] * clients
+            deadline = time.perf_counter() + duration
+            workers = [threading.Thread(target=fetch_loop, args=(port, PORTAL_ASSETS, deadline, counts, i))
+                       for i in range(clients)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        requests = sum(c[0] for c in counts)
+        received = sum(c[1] for c in counts)
+        results.add(f"portal.static_assets.{label}", requests / elapsed, "req/s")
+        results.add(f"portal.static_assets.{label}.bandwidth", received / elapsed / 1e6, "MB/s")
+
+    with tempfile.TemporaryDirectory(prefix="portal-bench-") as tmp:
+        search = portal.SearchIndex(ROOT, portal.SEARCH_DOCUMENTS, pathlib.Path(tmp) / "search-index.json")
+        start = time.perf_counter()
+        search.update()
+        results.add("portal.search_index_build", (time.perf_counter() - start) * 1000, "ms", higher_is_better=False)
+        start = time.perf_counter()
+        portal.SearchIndex(ROOT, portal.SEARCH_DOCUMENTS, search.path).update()
+        results.add("portal.search_index_unchanged", (time.perf_counter() - start) * 1000, "ms",
+                    higher_is_better=False)
+        queries = itertools.cycle(SEARCH_QUERIES)
+        latencies = timed(lambda: search.search(next(queries)), 500 if quick else 5000)
+        results.add("portal.search_query.p99", percentile(latencies, 0.99) * 1000, "ms", higher_is_better=False)
+
+# Baseline comparison
+def compare(current, baseline, tolerance):
+    """Print the comparison; returns the names of regressed benchmarks"""
+    regressions = []
+    print(f"\nAgainst baseline (tolerance {tolerance:.0%}):")
+    for name, result in sorted(current.items()):
+        reference = baseline.get(name)
+        if not reference or not reference["value"]:
+            print(f"  {name:<44} (no baseline)")
+            continue
+        ratio = result["value"] / reference["value"]
+        change = ratio - 1 if result["higher_is_better"] else 1 / ratio - 1 if ratio else float("inf")
+        regressed = change < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<44} {change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the admin panel and portal server hot paths")
+    parser.add_argument("--admin-panel", type=pathlib.Path, default=ADMIN_PANEL,
+                        help="kiosk_admin_panel.py to benchmark (default: the copy in Scripts/)")
+    parser.add_argument("--only", choices=["admin", "portal"], help="run one group of benchmarks")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for a fast sanity check")
+    parser.add_argument("--output", type=pathlib.Path, help="write results JSON here")
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE,
+                        help=f"baseline to compare against (default: {BASELINE.name})")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"allowed slowdown before failing (default: {TOLERANCE})")
+    parser.add_argument("--update-baseline", action="store_true", help="save these results as the new baseline")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = Results()
+
+    admin_panel = None
+    if args.only in (None, "admin"):
+        try:
+            code, complete = read_admin_panel(args.admin_panel)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: cannot load the admin panel: {e}")
+            print("Pass --admin-panel with a complete kiosk_admin_panel.py, or --only portal")
+            raise SystemExit(2)
+        admin_panel = {
+            "path": os.path.relpath(args.admin_panel, ROOT),  # Relative to the portal root
+            "sha256": hashlib.sha256(code.encode("utf-8")).hexdigest(),
+            "templates": complete,
+        }
+        bench_admin_panel(args.admin_panel, results, args.quick)
+    if args.only in (None, "portal"):
+        bench_portal(results, args.quick)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": args.quick,
+            "admin_panel": admin_panel,
+        },
+        "results": results.values,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {"results": {}}
+        baseline["meta"] = report["meta"]
+        baseline["results"].update(results.values)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline updated: {args.baseline}")
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results.values, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            raise SystemExit(1)
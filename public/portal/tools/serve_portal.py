@@ -4,34 +4,375 @@
 Why this exists:
 - Some Python environments serve .js as text/plain, causing Chrome/Edge to BLOCK scripts.
 - This server forces correct MIME types for .js/.css/.json so the portal always works.
+- It serves many clients at once (HTTP/1.1 keep-alive, bounded worker pool and queue), so one
+  laptop can host the portal for a whole field team. Large PDFs/videos support
+  Range requests, so a slow download never blocks anyone else.
+- The portal's text assets are kept in memory, gzip-compressed, with ETags, so repeat
+  visits are answered with 304s and nothing is read from disk.
+- The SOP and docs library (.docx) is searchable at /search?q=. Its text goes into a
+  positional index in data/search-index.json (a local cache, not committed), built at startup
+  and updated for changed files only.
+- --build writes a release copy of the portal whose assets carry a content hash in their
+  name (assets/app.<hash>.js). Those are sent as immutable, so a repeat visit loads them
+  from the browser cache without a single request, and an update can never mix old and
+  new files.
 
 Usage:
-  python3 tools/serve_portal.py
+  python3 tools/serve_portal.py [--bind ADDRESS] [--port PORT] [--workers N] [--no-cache]
+  python3 tools/serve_portal.py --build-index
+  python3 tools/serve_portal.py --build ../portal-release  (then serve from that folder)
 Then open:
   http://localhost:8787/index.html
+  http://localhost:8787/search?q=pre+rental+inspection  (JSON; "quoted words" match as a phrase)
 
 Tip:
-  If port 8787 is already in use, stop the old server or change PORT below.
+  If port 8787 is already in use, stop the old server or pass --port.
+  Use --bind 0.0.0.0 (the default) to let other devices on the network connect.
 """
 
+import argparse
+import concurrent.futures
+import email.utils
+import gzip
+import hashlib
 import http.server
-import socketserver
+import io
+import json
+import math
 import os
 import pathlib
 import mimetypes
+import re
+import select
+import shutil
+import sys
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+import zipfile
 
 PORT = 8787
+BIND = ""  # All interfaces
+WORKERS = 32  # Concurrent connections served at once
+QUEUED_CONNECTIONS = 64  # Connections that may wait for a worker; beyond that new ones get a 503
+KEEPALIVE_TIMEOUT = 15  # Seconds an idle keep-alive connection may hold a worker
+IDLE_POLL = 0.5  # Seconds between checks whether an idle keep-alive should make way for a queued connection
 ROOT = pathlib.Path(__file__).resolve().parents[1]  # portal root
 
+# Text assets preloaded into memory (glob patterns relative to ROOT)
+CACHED_ASSETS = ["index.html", "diagnostics.html", "selftest.html", "data/portal.config.json", "assets/*"]
+STAT_INTERVAL = 1.0  # Seconds between mtime checks of a cached asset
+
+# Documents indexed for /search (glob patterns relative to ROOT)
+SEARCH_DOCUMENTS = ["**/*.docx"]
+SEARCH_INDEX = ROOT / "data" / "search-index.json"
+SEARCH_RESULTS = 20  # Hits returned by /search unless ?limit= says otherwise
+SNIPPET_WORDS = 24  # Words of context shown around the first match
+
+# Release build: assets/* get content-hashed copies, referenced from these pages
+BUILD_PAGES = ["index.html", "diagnostics.html", "selftest.html"]
+ASSET_MANIFEST = "assets/manifest.json"
+FINGERPRINT_LENGTH = 10  # Hex digits of SHA-256 in a fingerprinted name
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
 # Force MIME types (prevents "Portal script did not load" caused by strict MIME checking)
 mimetypes.add_type("application/javascript; charset=utf-8", ".js")
 mimetypes.add_type("text/css; charset=utf-8", ".css")
 mimetypes.add_type("application/json; charset=utf-8", ".json")
 
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+WORD_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+class CachedAsset:
+    __slots__ = ("path", "mtime_ns", "size", "body", "gzip_body", "etag", "checked")
+
+    def __init__(self, path):
+        stat = path.stat()
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.body = path.read_bytes()
+        compressed = gzip.compress(self.body, 9, mtime=0)
+        self.gzip_body = compressed if len(compressed) < len(self.body) else None
+        self.etag = hashlib.sha256(self.body).hexdigest()[:20]
+        self.checked = time.monotonic()
+
+class AssetCache:
+    """In-memory copies of the portal's text assets, reloaded when their mtime changes"""
+
+    def __init__(self, root, patterns):
+        self.entries = {}
+        self.lock = threading.Lock()
+        for pattern in patterns:
+            for path in sorted(root.glob(pattern)):
+                if path.is_file():
+                    self.entries[path.relative_to(root).as_posix()] = CachedAsset(path)
+
+    def get(self, name):
+        entry = self.entries.get(name)
+        if entry is None or time.monotonic() - entry.checked < STAT_INTERVAL:
+            return entry
+        with self.lock:
+            entry.checked = time.monotonic()
+            try:
+                stat = entry.path.stat()
+            except FileNotFoundError:
+                self.entries.pop(name, None)
+                return None
+            if (stat.st_mtime_ns, stat.st_size) != (entry.mtime_ns, entry.size):
+                entry = self.entries[name] = CachedAsset(entry.path)
+        return entry
+
+def extract_docx(path):
+    """(title, text) of a Word document, read straight from its zip/XML parts"""
+    with zipfile.ZipFile(path) as docx:
+        body = ET.fromstring(docx.read("word/document.xml"))
+        try:
+            core = ET.fromstring(docx.read("docProps/core.xml"))
+            title = (core.findtext("{http://purl.org/dc/elements/1.1/}title") or "").strip()
+        except KeyError:
+            title = ""
+    paragraphs = []
+    for paragraph in body.iter(WORD_NS + "p"):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == WORD_NS + "t" and node.text:
+                parts.append(node.text)
+            elif node.tag in (WORD_NS + "tab", WORD_NS + "br"):
+                parts.append(" ")
+        text = "".join(parts).strip()
+        if text:
+            paragraphs.append(text)
+    return title or pathlib.Path(path).stem, "\n".join(paragraphs)
+
+class SearchDocument:
+    __slots__ = ("path", "title", "size", "mtime_ns", "sha256", "text", "length", "spans")
+
+    def __init__(self, path, title, size, mtime_ns, sha256, text):
+        self.path = path
+        self.title = title
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+        self.text = text
+        self.length = 0
+        self.spans = None  # Character span of each word, computed on first snippet
+
+    def words(self):
+        return [w.lower() for w in WORD_RE.findall(self.title + "\n" + self.text)]
+
+    def snippet(self, position):
+        """About SNIPPET_WORDS words of text around word ``position``"""
+        if self.spans is None:
+            # Positions count the title's words first; they have no span in the text
+            self.spans = [(-1, -1)] * len(WORD_RE.findall(self.title)) + \
+                [m.span() for m in WORD_RE.finditer(self.text)]
+        first = max(position - SNIPPET_WORDS // 3, 0)
+        while first < len(self.spans) and self.spans[first][0] < 0:
+            first += 1  # Skip title words
+        last = min(first + SNIPPET_WORDS, len(self.spans)) - 1
+        if first > last:
+            return self.text[:200]
+        start, end = self.spans[first][0], self.spans[last][1]
+        text = " ".join(self.text[start:end].split())
+        return ("… " if start else "") + text + (" …" if end < len(self.text) else "")
+
+    def record(self):
+        return {"path": self.path, "title": self.title, "size": self.size, "mtime_ns": self.mtime_ns,
+                "sha256": self.sha256, "text": self.text}
+
+class SearchIndex:
+    """Positional inverted index over the portal's documents, saved as JSON.
+
+    postings maps each lower-cased word to [[document, [position deltas]], ...].
+    update() re-reads only documents whose size/mtime and SHA-256 changed,
+    so startup costs a stat per document when nothing was edited.
+    """
+
+    def __init__(self, root, patterns, path):
+        self.root = root
+        self.patterns = patterns
+        self.path = path
+        self.documents = []
+        self.postings = {}
+        self.load()
+
+    def load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return
+        self.documents = [SearchDocument(**record) for record in data["documents"]]
+        self.postings = data["postings"]
+        for entries in self.postings.values():
+            for doc, deltas in entries:
+                self.documents[doc].length += len(deltas)
+
+    def save(self):
+        data = {"version": 1, "documents": [doc.record() for doc in self.documents], "postings": self.postings}
+        temp = self.path.with_name(self.path.name + ".tmp")
+        temp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        os.replace(temp, self.path)
+
+    def update(self):
+        """Bring the index in line with the files on disk; returns (reindexed, removed, failed)"""
+        known = {doc.path: i for i, doc in enumerate(self.documents)}
+        kept, added, failed = [], [], []
+        paths = sorted({p for pattern in self.patterns for p in self.root.glob(pattern) if p.is_file()})
+        for path in paths:
+            name = path.relative_to(self.root).as_posix()
+            if path.name.startswith("~$"):
+                continue  # Word lock files
+            stat = path.stat()
+            old = known.get(name)
+            doc = self.documents[old] if old is not None else None
+            if doc and (doc.size, doc.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                kept.append(old)
+                continue
+            sha256 = hashlib.sha256(path.read_bytes()).hexdigest()
+            if doc and doc.sha256 == sha256:
+                # Only the mtime moved (a fresh checkout or unzip): not worth rewriting the
+                # shipped index for, so the new stat is remembered for this run only
+                doc.size, doc.mtime_ns = stat.st_size, stat.st_mtime_ns
+                kept.append(old)
+                continue
+            try:
+                title, text = extract_docx(path)
+            except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+                failed.append(f"{name}: {e}")
+                continue
+            added.append(SearchDocument(name, title, stat.st_size, stat.st_mtime_ns, sha256, text))
+        removed = len(self.documents) - len(kept)
+        if not added and not removed:
+            return 0, 0, failed
+
+        # Renumber the surviving documents and drop postings of the rest
+        renumber = {old: new for new, old in enumerate(kept)}
+        postings = {}
+        for word, entries in self.postings.items():
+            entries = [[renumber[doc], deltas] for doc, deltas in entries if doc in renumber]
+            if entries:
+                postings[word] = entries
+        self.documents = [self.documents[old] for old in kept]
+        for doc in added:
+            doc_id = len(self.documents)
+            self.documents.append(doc)
+            positions = {}
+            words = doc.words()
+            doc.length = len(words)
+            for position, word in enumerate(words):
+                positions.setdefault(word, []).append(position)
+            for word, found in positions.items():
+                postings.setdefault(word, []).append([doc_id, [found[0]] + [b - a for a, b in zip(found, found[1:])]])
+        self.postings = postings
+        self.save()
+        return len(added), removed, failed
+
+    def positions(self, word):
+        """{document: [positions]} for one word"""
+        result = {}
+        for doc, deltas in self.postings.get(word, ()):
+            total, found = 0, []
+            for delta in deltas:
+                total += delta
+                found.append(total)
+            result[doc] = found
+        return result
+
+    def search(self, query, limit=SEARCH_RESULTS):
+        """Documents containing every word and "quoted phrase" in ``query``, best first"""
+        terms = []
+        for phrase, word in QUERY_RE.findall(query):
+            words = [w.lower() for w in WORD_RE.findall(phrase or word)]
+            if words:
+                terms.append(words)
+        if not terms:
+            return 0, []
+
+        matches = None  # document -> [(term, start positions), ...]
+        for words in terms:
+            found = self.positions(words[0])
+            for offset, word in enumerate(words[1:], 1):
+                following = {doc: set(positions) for doc, positions in self.positions(word).items()}
+                found = {doc: [p for p in starts if p + offset in following[doc]]
+                         for doc, starts in found.items() if doc in following}
+                found = {doc: starts for doc, starts in found.items() if starts}
+            if matches is None:
+                matches = {doc: [(words, starts)] for doc, starts in found.items()}
+            else:
+                matches = {doc: hits + [(words, found[doc])] for doc, hits in matches.items() if doc in found}
+            if not matches:
+                return 0, []
+
+        # Term frequency, damped by document length and weighted by rarity; title hits count double
+        count = len(self.documents)
+        ranked = []
+        for doc, hits in matches.items():
+            document = self.documents[doc]
+            title = " %s " % " ".join(w.lower() for w in WORD_RE.findall(document.title))
+            score = 0.0
+            for words, starts in hits:
+                rarity = math.log(1 + count / len(self.postings.get(words[0], ())))
+                score += rarity * (len(starts) / (len(starts) + 1 + document.length / 2000))
+                if " %s " % " ".join(words) in title:
+                    score += rarity
+            ranked.append((score, doc, min(min(starts) for _, starts in hits)))
+        ranked.sort(key=lambda item: (-item[0], self.documents[item[1]].path))
+        return len(ranked), [{
+            "path": self.documents[doc].path,
+            "title": self.documents[doc].title,
+            "score": round(score, 4),
+            "snippet": self.documents[doc].snippet(first),
+        } for score, doc, first in ranked[:limit]]
+
 class Handler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive: browsers reuse one connection for all assets
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body go out as separate writes; with Nagle on, a keep-alive
+    # client's delayed ACK stalls every response by ~40ms
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=str(ROOT), **kwargs)
 
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.wait_for_request():
+            self.handle_one_request()
+
+    def wait_for_request(self):
+        """Wait for the next request on a keep-alive connection; False once it should close.
+
+        An idle connection holds a worker, so it is closed early as soon as
+        another connection is queued behind the pool.
+        """
+        self.connection.settimeout(0)
+        try:
+            if self.rfile.peek(1):
+                return True  # Pipelined request already buffered
+        except OSError:
+            return True  # Let handle_one_request() see the error
+        finally:
+            self.connection.settimeout(self.timeout)
+        deadline = time.monotonic() + self.timeout
+        while not self.server.saturated():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([self.connection], [], [], min(remaining, IDLE_POLL))
+            if readable:
+                return True
+        return False
+
+    def end_headers(self):
+        if self.server.saturated():
+            self.send_header("Connection", "close")  # Give the worker to a queued connection
+        super().end_headers()
+
     # Extra safety: override guess_type for critical extensions
     def guess_type(self, path):
         p = path.lower()
@@ -43,7 +384,275 @@ class Handler(http.server.SimpleHTTPRequestHandler):
             return "application/json; charset=utf-8"
         return super().guess_type(path)
 
+    def parse_range(self, size):
+        """Return (start, end) for a single satisfiable byte range, "invalid" or None"""
+        header = self.headers.get("Range")
+        if not header:
+            return None
+        match = RANGE_RE.match(header.strip())
+        if not match or match.groups() == ("", ""):
+            return None  # Multiple or malformed ranges: serve the whole file
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+        else:
+            start, end = max(size - int(last), 0), size
+        if start >= size or start >= end:
+            return "invalid"
+        return start, end
+
+    def cache_control(self, name):
+        if name in getattr(self.server, "fingerprinted", ()):
+            return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        return "no-cache"
+
+    def send_cached(self, entry, name):
+        use_gzip = entry.gzip_body is not None and "gzip" in self.headers.get("Accept-Encoding", "")
+        etag = f'"{entry.etag}-gz"' if use_gzip else f'"{entry.etag}"'
+
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+
+        body = entry.gzip_body if use_gzip else entry.body
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(str(entry.path)))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", self.cache_control(name))
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Last-Modified", self.date_time_string(entry.mtime_ns / 1e9))
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def send_search(self, params):
+        query = params.get("q", [""])[0]
+        try:
+            limit = min(max(int(params.get("limit", [SEARCH_RESULTS])[0]), 1), 100)
+        except ValueError:
+            limit = SEARCH_RESULTS
+        started = time.perf_counter()
+        total, results = self.server.search.search(query, limit)
+        body = json.dumps({
+            "query": query,
+            "total": total,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3),
+            "results": results,
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def send_head(self):
+        self.body_length = None  # A HEAD request leaves the last file's length behind
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/search" and getattr(self.server, "search", None) is not None:
+            return self.send_search(urllib.parse.parse_qs(url.query))
+
+        name = urllib.parse.unquote(url.path).lstrip("/") or "index.html"
+        assets = getattr(self.server, "assets", None)
+        if assets is not None and "Range" not in self.headers:
+            entry = assets.get(name)
+            if entry is not None:
+                return self.send_cached(entry, name)
+
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path) or self.path.split("?", 1)[0].endswith("/"):
+            return super().send_head()  # Directories, redirects and 404s
+
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        try:
+            fs = os.fstat(f.fileno())
+            size = fs.st_size
+
+            if "If-Modified-Since" in self.headers and "If-None-Match" not in self.headers:
+                try:
+                    since = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+                except (TypeError, ValueError):
+                    since = None
+                if since is not None and since.timestamp() >= int(fs.st_mtime):
+                    self.send_response(304)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    f.close()
+                    return None
+
+            span = self.parse_range(size)
+            if span == "invalid":
+                f.close()
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+
+            start, end = span or (0, size)
+            self.send_response(206 if span else 200)
+            self.send_header("Content-Type", self.guess_type(path))
+            self.send_header("Content-Length", str(end - start))
+            self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Cache-Control", self.cache_control(name))
+            if span:
+                self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+            self.end_headers()
+
+            f.seek(start)
+            self.body_length = end - start
+            return f
+        except Exception:
+            f.close()
+            raise
+
+    def copyfile(self, source, outputfile):
+        length = getattr(self, "body_length", None)
+        if length is None:
+            return super().copyfile(source, outputfile)  # Directory listings
+        self.body_length = None
+        # Zero-copy where the OS supports it; falls back to send() elsewhere
+        self.connection.sendfile(source, source.tell(), length)
+
+class PortalServer(http.server.HTTPServer):
+    """HTTP server that hands each connection to a bounded pool of worker threads.
+
+    At most ``queued`` connections wait for a free worker; past that, new
+    connections are answered with a 503 instead of piling up in memory.
+    """
+
+    def __init__(self, address, handler, workers, assets=None, search=None, fingerprinted=(),
+                 queued=QUEUED_CONNECTIONS):
+        super().__init__(address, handler)
+        self.assets = assets
+        self.search = search
+        self.fingerprinted = fingerprinted
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(workers + queued)
+        self.connections = 0
+        self.connections_lock = threading.Lock()
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="portal")
+
+    def saturated(self):
+        """True while connections are waiting for a worker"""
+        return self.connections > self.workers
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.reject_request(request)
+            return
+        with self.connections_lock:
+            self.connections += 1
+        future = self.pool.submit(self.process_request_thread, request, client_address)
+        future.add_done_callback(lambda future: future.cancelled() and self.release_request(request))
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.release_request(request)
+
+    def release_request(self, request):
+        self.shutdown_request(request)
+        with self.connections_lock:
+            self.connections -= 1
+        self.slots.release()
+
+    def reject_request(self, request):
+        """Answer a connection the queue has no room for, without reading its request"""
+        try:
+            request.settimeout(1)
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                            b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return  # Client went away mid-transfer
+        super().handle_error(request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)  # Queued connections are closed unanswered
+
+def read_manifest(root):
+    """{"assets/app.js": "assets/app.<hash>.js", ...} written by the last --build, or {}"""
+    try:
+        return json.loads((root / ASSET_MANIFEST).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def build_release(root, output):
+    """Copy the portal to ``output`` with fingerprinted assets; returns the asset manifest"""
+    output = output.resolve()
+    if output == root or root in output.parents:
+        raise ValueError(f"{output} is inside the portal; choose a folder outside it")
+    for path in sorted(root.rglob("*")):
+        relative = path.relative_to(root)
+        if path.is_dir() or "__pycache__" in relative.parts:
+            continue
+        target = output / relative
+        if target.exists():
+            stat, copied = path.stat(), target.stat()
+            if (stat.st_size, stat.st_mtime_ns) == (copied.st_size, copied.st_mtime_ns):
+                continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, target)
+
+    manifest = {}
+    for path in sorted((root / "assets").iterdir()):
+        if not path.is_file():
+            continue
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:FINGERPRINT_LENGTH]
+        name = f"assets/{path.stem}.{digest}{path.suffix}"
+        manifest[f"assets/{path.name}"] = name
+        if not (output / name).exists():
+            shutil.copy2(path, output / name)
+    for name in set(read_manifest(output).values()) - set(manifest.values()):
+        (output / name).unlink(missing_ok=True)  # Left over from an earlier build
+
+    # Longest names first, and never part of a longer name (app.js vs app.json)
+    reference = re.compile(r"(?<![\w.-])(%s)(?![\w.-])" % "|".join(
+        re.escape(name) for name in sorted(manifest, key=len, reverse=True)))
+    for page in BUILD_PAGES:
+        text = (root / page).read_text(encoding="utf-8")
+        (output / page).write_text(reference.sub(lambda m: manifest[m.group(1)], text), encoding="utf-8")
+
+    manifest_path = output / ASSET_MANIFEST
+    manifest_path.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    return manifest
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the KioskOps portal")
+    parser.add_argument("--bind", default=BIND, help="address to listen on (default: all interfaces)")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (default: {PORT})")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help=f"connections served concurrently (default: {WORKERS})")
+    parser.add_argument("--no-cache", action="store_true", help="read every asset from disk on each request")
+    parser.add_argument("--build-index", action="store_true",
+                        help=f"update {SEARCH_INDEX.relative_to(ROOT)} for changed documents and exit")
+    parser.add_argument("--build", type=lambda value: pathlib.Path(value).resolve(), metavar="DIR",
+                        help="write a release copy with fingerprinted assets to DIR and exit")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     os.chdir(str(ROOT))
 
     # Quick sanity checks
@@ -59,10 +668,47 @@ if __name__ == "__main__":
             print(" -", m)
         raise SystemExit(1)
 
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
+    search = SearchIndex(ROOT, SEARCH_DOCUMENTS, SEARCH_INDEX)
+    started = time.perf_counter()
+    try:
+        reindexed, removed, failed = search.update()
+    except OSError as e:
+        # A read-only copy (e.g. on a USB stick) still searches, it just re-indexes each start
+        print(f"WARNING: could not save the search index: {e}")
+        reindexed, removed, failed = None, None, []
+    for problem in failed:
+        print(f"WARNING: not indexed: {problem}")
+    if reindexed is not None:
+        print(f"Search index: {len(search.documents)} documents, {reindexed} re-indexed, {removed} removed "
+              f"({time.perf_counter() - started:.2f}s)")
+    if args.build_index:
+        raise SystemExit(1 if failed or reindexed is None else 0)
+
+    if args.build:
+        try:
+            manifest = build_release(ROOT, args.build)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: build failed: {e}")
+            raise SystemExit(1)
+        print(f"Release written to: {args.build}")
+        for source, name in manifest.items():
+            print(f" - {source} -> {name}")
+        print(f"Serve it with: python3 {args.build / 'tools' / 'serve_portal.py'}")
+        raise SystemExit(0)
+
+    assets = None if args.no_cache else AssetCache(ROOT, CACHED_ASSETS)
+    fingerprinted = frozenset(read_manifest(ROOT).values())
+
+    with PortalServer((args.bind, args.port), Handler, args.workers, assets, search, fingerprinted) as httpd:
+        host = args.bind if args.bind not in ("", "0.0.0.0") else "localhost"
         print(f"Serving portal from: {ROOT}")
-        print(f"Open: http://localhost:{PORT}/index.html")
-        print(f"Debug check: http://localhost:{PORT}/assets/app.js (should show JavaScript)")
+        print(f"Open: http://{host}:{args.port}/index.html")
+        print(f"Debug check: http://{host}:{args.port}/assets/app.js (should show JavaScript)")
+        print(f"Serving up to {args.workers} connections at once")
+        if assets is not None:
+            print(f"Cached {len(assets.entries)} text assets in memory")
+        if fingerprinted:
+            print(f"Serving {len(fingerprinted)} fingerprinted assets as immutable")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt: